@@ -0,0 +1,670 @@
+# benchmark.py
+import os
+import sys
+import glob
+import json
+import math
+import time
+import types
+import argparse
+import platform
+import itertools
+import threading
+import contextlib
+import subprocess
+import importlib.util
+import numpy as np
+from collections import defaultdict, deque
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+class AMQPError(Exception):
+    pass
+
+
+class AMQPConnectionError(AMQPError):
+    pass
+
+
+class ConnectionClosed(AMQPConnectionError):
+    pass
+
+
+class AMQPChannelError(AMQPError):
+    pass
+
+
+class ChannelClosed(AMQPChannelError):
+    pass
+
+
+class ChannelClosedByBroker(ChannelClosed):
+    pass
+
+
+class ChannelWrongStateError(AMQPChannelError):
+    pass
+
+
+class NackError(AMQPChannelError):
+    def __init__(self, messages):
+        super().__init__(messages)
+        self.messages = messages
+
+
+class ConfirmacionAck:
+    NAME = "Basic.Ack"
+
+    def __init__(self, delivery_tag, multiple=False):
+        self.delivery_tag = delivery_tag
+        self.multiple = multiple
+
+
+class ConfirmacionNack(ConfirmacionAck):
+    NAME = "Basic.Nack"
+
+
+class PropiedadesMemoria:
+    def __init__(self, content_type=None, delivery_mode=None, headers=None, expiration=None,
+                 reply_to=None, correlation_id=None, **kwargs):
+        self.content_type = content_type
+        self.delivery_mode = delivery_mode
+        self.headers = headers
+        self.expiration = expiration
+        self.reply_to = reply_to
+        self.correlation_id = correlation_id
+        self.__dict__.update(kwargs)
+
+
+class ColaMemoria:
+    def __init__(self, nombre, argumentos):
+        self.nombre = nombre
+        self.maximo = (argumentos or {}).get('x-max-length')
+        self.mensajes = deque()
+        self.consumidores = 0
+
+
+def _coincide_topico(patron, clave):
+    # '*' sustituye exactamente una palabra y '#' cero o mas, como en un intercambio topic
+    def coincide(p, c):
+        if not p:
+            return not c
+        if p[0] == '#':
+            return any(coincide(p[1:], c[i:]) for i in range(len(c) + 1))
+        return bool(c) and p[0] in ('*', c[0]) and coincide(p[1:], c[1:])
+    return coincide(patron.split('.'), clave.split('.'))
+
+
+class BrokerMemoria:
+    # Sustituto en memoria de RabbitMQ con la semantica que usan los scripts: colas, fanout, prefetch y acks
+    def __init__(self):
+        self.condicion = threading.Condition()
+        self.colas = {}
+        self.intercambios = {}
+        self.cerrado = False
+        self.trafico = defaultdict(lambda: {"mensajes": 0, "bytes": 0})
+        self._nombres = itertools.count()
+
+    def nombre_temporal(self):
+        return f"amq.gen-{next(self._nombres)}"
+
+    def publicar(self, intercambio, clave, cuerpo, propiedades):
+        with self.condicion:
+            trafico = self.trafico[intercambio or clave]
+            trafico["mensajes"] += 1
+            trafico["bytes"] += len(cuerpo)
+            if not intercambio:
+                destinos = [clave] if clave in self.colas else []
+            elif intercambio in self.intercambios:
+                tipo, enlaces = self.intercambios[intercambio]
+                destinos = [
+                    cola for cola, enlace in enlaces
+                    if tipo == 'fanout' or enlace == clave or (tipo == 'topic' and _coincide_topico(enlace, clave))
+                ]
+            else:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no exchange '{intercambio}'")
+            rechazado = False
+            for nombre in destinos:
+                cola = self.colas.get(nombre)
+                if cola is None:
+                    continue
+                if cola.maximo and len(cola.mensajes) >= cola.maximo:
+                    rechazado = True
+                    continue
+                cola.mensajes.append((cuerpo, propiedades or PropiedadesMemoria(), False))
+            self.condicion.notify_all()
+            return rechazado
+
+    def cerrar(self):
+        with self.condicion:
+            self.cerrado = True
+            self.condicion.notify_all()
+
+
+class CanalMemoria:
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.broker = conexion.broker
+        self.is_open = True
+        self.consumos = {}
+        self.prefetch = 0
+        self.sin_confirmar = {}
+        self.etiquetas = itertools.count(1)
+        self.etiquetas_consumo = itertools.count()
+        self.consumiendo = False
+        self.confirmando = False
+        self.al_confirmar = None
+        self.publicaciones = itertools.count(1)
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def _verificar(self):
+        self.conexion._verificar()
+        if not self.is_open:
+            raise ChannelWrongStateError("Canal cerrado")
+
+    def _cerrar_por_broker(self, codigo, texto):
+        self.close()
+        raise ChannelClosedByBroker(codigo, texto)
+
+    def queue_declare(self, queue='', passive=False, durable=False, exclusive=False, auto_delete=False, arguments=None):
+        self._verificar()
+        with self.broker.condicion:
+            if passive and queue not in self.broker.colas:
+                self._cerrar_por_broker(404, f"NOT_FOUND - no queue '{queue}'")
+            if not queue:
+                queue = self.broker.nombre_temporal()
+            cola = self.broker.colas.setdefault(queue, ColaMemoria(queue, arguments))
+            metodo = types.SimpleNamespace(queue=queue, message_count=len(cola.mensajes), consumer_count=cola.consumidores)
+            return types.SimpleNamespace(method=metodo)
+
+    def queue_delete(self, queue, **kwargs):
+        self._verificar()
+        with self.broker.condicion:
+            cola = self.broker.colas.pop(queue, None)
+            for _, enlaces in self.broker.intercambios.values():
+                enlaces.difference_update({enlace for enlace in enlaces if enlace[0] == queue})
+            return types.SimpleNamespace(method=types.SimpleNamespace(message_count=len(cola.mensajes) if cola else 0))
+
+    def queue_purge(self, queue):
+        self._verificar()
+        with self.broker.condicion:
+            cola = self.broker.colas.get(queue)
+            cantidad = len(cola.mensajes) if cola else 0
+            if cola:
+                cola.mensajes.clear()
+            return types.SimpleNamespace(method=types.SimpleNamespace(message_count=cantidad))
+
+    def exchange_declare(self, exchange, exchange_type='direct', **kwargs):
+        self._verificar()
+        with self.broker.condicion:
+            self.broker.intercambios.setdefault(exchange, (exchange_type, set()))
+
+    def queue_bind(self, queue, exchange, routing_key=None, **kwargs):
+        self._verificar()
+        with self.broker.condicion:
+            if exchange not in self.broker.intercambios or queue not in self.broker.colas:
+                self._cerrar_por_broker(404, "NOT_FOUND")
+            self.broker.intercambios[exchange][1].add((queue, routing_key or ''))
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        self._verificar()
+        self.prefetch = prefetch_count
+
+    @property
+    def _impl(self):
+        # Canal asincrono subyacente de pika: mismo objeto, con confirmaciones por callback
+        return self
+
+    def confirm_delivery(self, ack_nack_callback=None, callback=None):
+        self._verificar()
+        self.confirmando = True
+        self.al_confirmar = ack_nack_callback
+        if callback:
+            self.conexion.add_callback_threadsafe(lambda: callback(types.SimpleNamespace(method=None)))
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self._verificar()
+        # Con confirmaciones, una cola llena (reject-publish) responde con nack como RabbitMQ
+        rechazado = self.broker.publicar(exchange, routing_key, body, properties)
+        if self.al_confirmar:
+            # Las confirmaciones asincronas llegan en el siguiente process_data_events
+            metodo = (ConfirmacionNack if rechazado else ConfirmacionAck)(next(self.publicaciones))
+            self.conexion.add_callback_threadsafe(lambda: self.al_confirmar(types.SimpleNamespace(method=metodo)))
+        elif rechazado and self.confirmando:
+            raise NackError([])
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, exclusive=False, consumer_tag=None, **kwargs):
+        self._verificar()
+        with self.broker.condicion:
+            if queue not in self.broker.colas:
+                self._cerrar_por_broker(404, f"NOT_FOUND - no queue '{queue}'")
+            self.broker.colas[queue].consumidores += 1
+        etiqueta = consumer_tag or f"ctag-{id(self)}-{next(self.etiquetas_consumo)}"
+        self.consumos[etiqueta] = (queue, on_message_callback, auto_ack)
+        return etiqueta
+
+    def basic_cancel(self, consumer_tag):
+        consumo = self.consumos.pop(consumer_tag, None)
+        if consumo:
+            with self.broker.condicion:
+                cola = self.broker.colas.get(consumo[0])
+                if cola:
+                    cola.consumidores -= 1
+
+    def _tomar(self, nombre_cola, auto_ack):
+        cola = self.broker.colas.get(nombre_cola)
+        if cola is None or not cola.mensajes:
+            return None
+        cuerpo, propiedades, reentregado = cola.mensajes.popleft()
+        etiqueta = next(self.etiquetas)
+        if not auto_ack:
+            self.sin_confirmar[etiqueta] = (nombre_cola, cuerpo, propiedades)
+        metodo = types.SimpleNamespace(delivery_tag=etiqueta, redelivered=reentregado, routing_key=nombre_cola, exchange='')
+        return metodo, propiedades, cuerpo
+
+    def basic_get(self, queue, auto_ack=False):
+        self._verificar()
+        with self.broker.condicion:
+            return self._tomar(queue, auto_ack) or (None, None, None)
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self._verificar()
+        with self.broker.condicion:
+            if multiple:
+                for etiqueta in [e for e in self.sin_confirmar if e <= delivery_tag]:
+                    del self.sin_confirmar[etiqueta]
+            else:
+                self.sin_confirmar.pop(delivery_tag, None)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self._verificar()
+        with self.broker.condicion:
+            etiquetas = [e for e in self.sin_confirmar if e <= delivery_tag] if multiple else [delivery_tag]
+            for etiqueta in sorted(etiquetas, reverse=True):
+                nombre_cola, cuerpo, propiedades = self.sin_confirmar.pop(etiqueta)
+                if requeue and nombre_cola in self.broker.colas:
+                    self.broker.colas[nombre_cola].mensajes.appendleft((cuerpo, propiedades, True))
+            self.broker.condicion.notify_all()
+
+    def basic_reject(self, delivery_tag, requeue=True):
+        self.basic_nack(delivery_tag, requeue=requeue)
+
+    def _despachar(self, limite=1000):
+        entregados = 0
+        while entregados < limite and self.is_open:
+            entrega = None
+            with self.broker.condicion:
+                if self.prefetch and len(self.sin_confirmar) >= self.prefetch:
+                    break
+                for nombre_cola, callback, auto_ack in list(self.consumos.values()):
+                    tomado = self._tomar(nombre_cola, auto_ack)
+                    if tomado:
+                        entrega = (callback, tomado)
+                        break
+            if entrega is None:
+                break
+            callback, (metodo, propiedades, cuerpo) = entrega
+            callback(self, metodo, propiedades, cuerpo)
+            entregados += 1
+        return entregados
+
+    def start_consuming(self):
+        self.consumiendo = True
+        while self.consumiendo:
+            self.conexion.process_data_events(time_limit=0.1)
+
+    def stop_consuming(self):
+        self.consumiendo = False
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        with self.broker.condicion:
+            for nombre_cola, cuerpo, propiedades in self.sin_confirmar.values():
+                if nombre_cola in self.broker.colas:
+                    self.broker.colas[nombre_cola].mensajes.appendleft((cuerpo, propiedades, True))
+            self.sin_confirmar.clear()
+            for nombre_cola, _, _ in self.consumos.values():
+                if nombre_cola in self.broker.colas:
+                    self.broker.colas[nombre_cola].consumidores -= 1
+            self.consumos.clear()
+            self.broker.condicion.notify_all()
+
+
+class ConexionMemoria:
+    def __init__(self, broker, parametros=None):
+        if broker.cerrado:
+            raise AMQPConnectionError("Broker en memoria cerrado")
+        self.broker = broker
+        self.parametros = parametros
+        self.is_open = True
+        self.canales = []
+        self.pendientes = deque()
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def _verificar(self):
+        if self.broker.cerrado:
+            self.is_open = False
+        if not self.is_open:
+            raise ConnectionClosed(320, "Conexion cerrada")
+
+    def channel(self):
+        self._verificar()
+        canal = CanalMemoria(self)
+        self.canales.append(canal)
+        return canal
+
+    def add_callback_threadsafe(self, callback):
+        with self.broker.condicion:
+            self.pendientes.append(callback)
+            self.broker.condicion.notify_all()
+
+    def _despachar(self):
+        entregados = 0
+        while self.pendientes:
+            self.pendientes.popleft()()
+            entregados += 1
+        for canal in list(self.canales):
+            entregados += canal._despachar()
+        return entregados
+
+    def process_data_events(self, time_limit=0):
+        self._verificar()
+        limite = time.monotonic() + (time_limit if time_limit is not None else math.inf)
+        while not self._despachar() and time_limit != 0:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            with self.broker.condicion:
+                self.broker.condicion.wait(min(restante, 0.05))
+            self._verificar()
+
+    def sleep(self, segundos):
+        self.process_data_events(time_limit=segundos)
+
+    def close(self):
+        for canal in self.canales:
+            canal.close()
+        self.is_open = False
+
+
+def crear_modulo_pika(broker):
+    pika = types.ModuleType("pika")
+    # Mismo comportamiento que la version fijada en requirements.txt
+    pika.__version__ = "1.4.4"
+    pika.exceptions = types.SimpleNamespace(
+        AMQPError=AMQPError,
+        AMQPConnectionError=AMQPConnectionError,
+        ConnectionClosed=ConnectionClosed,
+        AMQPChannelError=AMQPChannelError,
+        ChannelClosed=ChannelClosed,
+        ChannelClosedByBroker=ChannelClosedByBroker,
+        ChannelWrongStateError=ChannelWrongStateError,
+        NackError=NackError
+    )
+    pika.BlockingConnection = lambda parametros=None: ConexionMemoria(broker, parametros)
+    pika.ConnectionParameters = lambda **kwargs: types.SimpleNamespace(**kwargs)
+    pika.PlainCredentials = lambda usuario, contrasena: types.SimpleNamespace(username=usuario, password=contrasena)
+    pika.BasicProperties = PropiedadesMemoria
+    pika.spec = types.SimpleNamespace(Basic=types.SimpleNamespace(Ack=ConfirmacionAck, Nack=ConfirmacionNack))
+    return pika
+
+
+class ColectorSocketIO:
+    def __init__(self):
+        self.eventos = defaultdict(int)
+
+    def emit(self, evento, datos=None, **kwargs):
+        self.eventos[evento] += 1
+
+
+def cargar_componentes(pika):
+    # Los scripts importan pika/eventlet al cargarse: se sustituyen antes para no tocar red ni parchear hilos
+    sys.modules["pika"] = pika
+    # semillas.py se importa desde el directorio de los scripts
+    if DIRECTORIO not in sys.path:
+        sys.path.insert(0, DIRECTORIO)
+    sys.modules["eventlet"] = types.SimpleNamespace(
+        monkey_patch=lambda *args, **kwargs: None,
+        tpool=types.SimpleNamespace(execute=lambda funcion, *args, **kwargs: funcion(*args, **kwargs))
+    )
+    modulos = {}
+    for nombre, archivo in (("productor", "producer-2.py"), ("consumidor", "consumer-2.py"), ("dashboard", "dashboard.py")):
+        especificacion = importlib.util.spec_from_file_location(f"bench_{nombre}", os.path.join(DIRECTORIO, archivo))
+        modulo = importlib.util.module_from_spec(especificacion)
+        especificacion.loader.exec_module(modulo)
+        modulos[nombre] = modulo
+    return modulos
+
+
+def _etapa_hilo(hilo):
+    if hilo.name.startswith("etapa:"):
+        return hilo.name.split(":")[1]
+    objetivo = getattr(hilo, "_target", None)
+    propietario = getattr(objetivo, "__self__", None)
+    modulo = type(propietario).__module__ if propietario is not None else getattr(objetivo, "__module__", "")
+    return modulo.replace("bench_", "") if modulo and modulo.startswith("bench_") else "otros"
+
+
+def _cpu_hilos():
+    # El hilo principal solo coordina el benchmark y no se atribuye a ninguna etapa
+    cpu = {}
+    for hilo in threading.enumerate():
+        if hilo is threading.main_thread():
+            continue
+        try:
+            cpu[hilo.ident] = (_etapa_hilo(hilo), time.clock_gettime(time.pthread_getcpuclockid(hilo.ident)))
+        except (AttributeError, OSError, TypeError):
+            continue
+    return cpu
+
+
+def _medir_cpu(funcion, finalizados):
+    def envoltura():
+        try:
+            funcion()
+        except AMQPError:
+            pass
+        finally:
+            hilo = threading.current_thread()
+            finalizados[hilo.ident] = (_etapa_hilo(hilo), time.thread_time())
+    return envoltura
+
+
+def _percentil_ms(valores, p):
+    return float(np.percentile(valores, p) * 1000) if len(valores) else None
+
+
+def _formatear_ms(valor):
+    return "n/a" if valor is None else f"{valor:.1f} ms"
+
+
+def ejecutar_modelo(archivo_modelo, escenarios, trabajadores, escenarios_por_mensaje, tipo_contenido, tiempo_maximo):
+    broker = BrokerMemoria()
+    m = cargar_componentes(crear_modulo_pika(broker))
+    with open(archivo_modelo, 'r', encoding='utf-8') as f:
+        texto_modelo = f.read()
+
+    publicador_modelo = m["productor"].PublicadorModelo()
+    version = publicador_modelo.publicar_modelo(texto_modelo)
+    registro_modelos = m["productor"].RegistroModelos(publicador_modelo)
+    registro_modelos.iniciar()
+    productor = m["productor"].ProductorEscenariosContinuo(
+        escenarios_minimos=escenarios,
+        escenarios_maximos=max(escenarios // 4, escenarios_por_mensaje * 8),
+        tamano_lote=escenarios_por_mensaje * 4,
+        semilla=12345,
+        escenarios_por_mensaje=escenarios_por_mensaje,
+        tipo_contenido=tipo_contenido
+    )
+    productor.establecer_version_modelo(version)
+
+    creacion = np.full(escenarios, np.nan)
+    latencias = []
+    preparar_envios = productor._preparar_envios
+
+    def preparar_envios_medido(version, cantidad):
+        # Solo los indices recien generados reciben marca: los reintentos conservan la de su primer envio
+        marca = time.time()
+        inicio = productor.siguiente_indice
+        envios = preparar_envios(version, cantidad)
+        creacion[inicio:min(productor.siguiente_indice, escenarios)] = marca
+        return envios
+
+    productor._preparar_envios = preparar_envios_medido
+
+    colector = ColectorSocketIO()
+    metricas = m["dashboard"].MetricasDashboard(convergencia=m["dashboard"].RastreadorConvergencia(muestras_minimas=math.inf))
+    planificador = m["dashboard"].PlanificadorEmisiones(colector, metricas)
+    oyente = m["dashboard"].OyenteRabbitMonteCarlo("memoria", 5672, "admin", "admin", colector, metricas, planificador)
+    actualizar_resultado = metricas.actualizar_resultado
+
+    def actualizar_resultado_medido(datos):
+        nuevo = actualizar_resultado(datos)
+        indice = datos.get("indice")
+        if nuevo and indice is not None and indice < escenarios:
+            latencias.append(time.time() - creacion[indice])
+        return nuevo
+
+    metricas.actualizar_resultado = actualizar_resultado_medido
+
+    lista_trabajadores = [m["consumidor"].TrabajadorMonteCarlo(f"bench-{i}") for i in range(trabajadores)]
+    for trabajador in lista_trabajadores:
+        if not trabajador.inicializar():
+            raise RuntimeError("El trabajador no pudo obtener el modelo")
+
+    detener = threading.Event()
+
+    def producir():
+        # La cola llena se detecta por el nack de la publicacion confirmada, sin consultar su profundidad
+        while productor.escenarios_publicados < escenarios and not detener.is_set():
+            solicitados = min(productor.tamano_lote, escenarios - productor.escenarios_publicados)
+            if productor._publicar_lote(solicitados) < solicitados:
+                time.sleep(0.002)
+
+    finalizados = {}
+    hilos = [threading.Thread(target=_medir_cpu(oyente.ejecutar, finalizados), name="etapa:dashboard", daemon=True),
+             threading.Thread(target=_medir_cpu(planificador.bucle, finalizados), name="etapa:dashboard-emision", daemon=True)]
+    hilos += [threading.Thread(target=_medir_cpu(t.iniciar_consumo, finalizados), name=f"etapa:consumidor-{i}", daemon=True)
+              for i, t in enumerate(lista_trabajadores)]
+    hilos.append(threading.Thread(target=_medir_cpu(producir, finalizados), name="etapa:productor", daemon=True))
+
+    cpu_inicial = _cpu_hilos()
+    cpu_proceso = time.process_time()
+    inicio = time.time()
+    for hilo in hilos:
+        hilo.start()
+    while metricas.total_procesados < escenarios and time.time() - inicio < tiempo_maximo:
+        time.sleep(0.01)
+    transcurrido = time.time() - inicio
+    cpu_final = {**finalizados, **_cpu_hilos()}
+    cpu_total = time.process_time() - cpu_proceso
+
+    detener.set()
+    oyente.ejecutando = False
+    planificador.ejecutando = False
+    registro_modelos.detener()
+    for trabajador in lista_trabajadores:
+        trabajador.oyente_actualizaciones.detener()
+        trabajador.obtenedor_modelo.detener()
+    broker.cerrar()
+    for hilo in hilos:
+        hilo.join(timeout=2)
+
+    cpu_agrupado = defaultdict(float)
+    for ident, (etapa, segundos) in cpu_final.items():
+        cpu_agrupado[etapa.split("-")[0]] += segundos - cpu_inicial.get(ident, (etapa, 0.0))[1]
+    completados = metricas.total_procesados
+    return {
+        "modelo": os.path.basename(archivo_modelo),
+        "escenarios": escenarios,
+        "completados": completados,
+        "trabajadores": trabajadores,
+        "escenarios_por_mensaje": escenarios_por_mensaje,
+        "tipo_contenido": productor.tipo_contenido,
+        "segundos": transcurrido,
+        "escenarios_por_segundo": completados / transcurrido if transcurrido > 0 else 0,
+        "latencia_ms": {
+            "p50": _percentil_ms(latencias, 50),
+            "p99": _percentil_ms(latencias, 99),
+            "maxima": float(max(latencias) * 1000) if latencias else None
+        },
+        "bytes": {
+            destino: dict(trafico, bytes_por_mensaje=trafico["bytes"] / trafico["mensajes"])
+            for destino, trafico in broker.trafico.items()
+        },
+        "cpu_segundos": dict(cpu_agrupado, total_proceso=cpu_total),
+        "emisiones_socketio": dict(colector.eventos)
+    }
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=DIRECTORIO, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _modelos_incluidos():
+    archivos = []
+    for ruta in sorted(glob.glob(os.path.join(DIRECTORIO, "*.txt"))):
+        with open(ruta, 'r', encoding='utf-8') as f:
+            if "def model_fn" in f.read():
+                archivos.append(ruta)
+    return archivos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline productor/consumidor/dashboard con broker en memoria")
+    parser.add_argument("modelos", nargs="*", help="Archivos de modelo (por defecto todos los incluidos)")
+    parser.add_argument("-n", "--escenarios", type=int, default=20000)
+    parser.add_argument("--trabajadores", type=int, default=2)
+    parser.add_argument("--escenarios-por-mensaje", type=int, default=500)
+    parser.add_argument("--formato", choices=["msgpack", "json"], default="msgpack")
+    parser.add_argument("--tiempo-maximo", type=float, default=300.0)
+    parser.add_argument("--salida", default="benchmark-resultados.json")
+    parser.add_argument("--verboso", action="store_true", help="Mostrar la salida de los componentes")
+    argumentos = parser.parse_args()
+
+    tipo_contenido = "application/x-msgpack" if argumentos.formato == "msgpack" else "application/json"
+    resultados = []
+    for archivo_modelo in argumentos.modelos or _modelos_incluidos():
+        print(f"[BENCHMARK] {os.path.basename(archivo_modelo)}: {argumentos.escenarios} escenarios, "
+              f"{argumentos.trabajadores} trabajadores, {argumentos.formato}")
+        silencio = contextlib.nullcontext() if argumentos.verboso else contextlib.redirect_stdout(open(os.devnull, 'w'))
+        with silencio:
+            resultado = ejecutar_modelo(
+                archivo_modelo, argumentos.escenarios, argumentos.trabajadores,
+                argumentos.escenarios_por_mensaje, tipo_contenido, argumentos.tiempo_maximo
+            )
+        resultados.append(resultado)
+        escenarios_bytes = resultado["bytes"].get("escenarios", {})
+        p50, p99 = (resultado["latencia_ms"][p] for p in ("p50", "p99"))
+        print(f"  {resultado['escenarios_por_segundo']:.0f} escenarios/s | "
+              f"latencia p50 {_formatear_ms(p50)}, p99 {_formatear_ms(p99)} | "
+              f"{escenarios_bytes.get('bytes_por_mensaje', 0):.0f} B/mensaje de escenarios")
+        print("  CPU: " + ", ".join(f"{etapa} {segundos:.2f}s" for etapa, segundos in sorted(resultado["cpu_segundos"].items())))
+
+    informe = {
+        "marca_tiempo": time.time(),
+        "commit": _commit_actual(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "parametros": vars(argumentos),
+        "resultados": resultados
+    }
+    with open(argumentos.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2)
+    print(f"[BENCHMARK] Resultados guardados en {argumentos.salida}")
+
+
+if __name__ == "__main__":
+    main()
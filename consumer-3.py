@@ -1,9 +1,340 @@
 # consumer.py
 import pika
+import os
 import json
+import math
 import time
 import sys
-from threading import Thread, Event
+import uuid
+import hashlib
+import queue
+import signal
+import argparse
+import multiprocessing
+import numpy as np
+from semillas import derivar_semillas, espacio_modelo, verificar_equivalencia_lote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Event, Lock, Condition, local, current_thread
+from collections import OrderedDict, defaultdict
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class CodificadorNumpy(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (np.integer, np.int32, np.int64)):
+            return int(obj)
+        elif isinstance(obj, (np.floating, np.float32, np.float64)):
+            return float(obj)
+        elif isinstance(obj, np.ndarray):
+            return obj.tolist()
+        return super().default(obj)
+
+
+TIPO_JSON = "application/json"
+TIPO_MSGPACK = "application/x-msgpack"
+
+
+def _empaquetar_numpy(obj):
+    if isinstance(obj, np.ndarray):
+        arreglo = np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder('<'))
+        return {"__ndarray__": True, "dtype": arreglo.dtype.str, "forma": list(arreglo.shape), "datos": arreglo.tobytes()}
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj)}")
+
+
+def _desempaquetar_numpy(obj):
+    if obj.get("__ndarray__"):
+        return np.frombuffer(obj["datos"], dtype=np.dtype(obj["dtype"])).reshape(obj["forma"])
+    return obj
+
+
+def codificar_mensaje(datos, tipo_contenido=TIPO_JSON):
+    if tipo_contenido == TIPO_MSGPACK:
+        return msgpack.packb(datos, default=_empaquetar_numpy, use_bin_type=True)
+    return json.dumps(datos, cls=CodificadorNumpy).encode()
+
+
+def decodificar_mensaje(cuerpo, tipo_contenido=None):
+    if tipo_contenido == TIPO_MSGPACK:
+        if not msgpack:
+            raise ValueError("Mensaje msgpack recibido pero 'msgpack' no esta instalado")
+        return msgpack.unpackb(cuerpo, object_hook=_desempaquetar_numpy, raw=False)
+    return json.loads(cuerpo)
+
+
+class HistogramaLatencias:
+    # Cubetas log-lineales al estilo HDR: se conservan los 7 bits mas significativos (error relativo < 1.6%)
+    BITS_SIGNIFICATIVOS = 7
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self):
+        self.candado = Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.conteos = {}
+        self.cantidad = 0
+        self.suma = 0
+        self.maximo = 0
+
+    def registrar(self, microsegundos, veces=1):
+        valor = int(microsegundos)
+        desplazamiento = max(valor.bit_length() - self.BITS_SIGNIFICATIVOS, 0)
+        cubeta = (valor >> desplazamiento) << desplazamiento
+        with self.candado:
+            self.conteos[cubeta] = self.conteos.get(cubeta, 0) + veces
+            self.cantidad += veces
+            self.suma += valor * veces
+            if valor > self.maximo:
+                self.maximo = valor
+
+    def extraer(self):
+        with self.candado:
+            datos = (self.conteos, self.cantidad, self.suma, self.maximo)
+            self.reiniciar()
+        return datos
+
+    def fusionar(self, datos):
+        conteos, cantidad, suma, maximo = datos
+        with self.candado:
+            for cubeta, veces in conteos.items():
+                self.conteos[cubeta] = self.conteos.get(cubeta, 0) + veces
+            self.cantidad += cantidad
+            self.suma += suma
+            self.maximo = max(self.maximo, maximo)
+
+    @staticmethod
+    def limite_superior(cubeta):
+        return cubeta + (1 << max(cubeta.bit_length() - HistogramaLatencias.BITS_SIGNIFICATIVOS, 0)) - 1
+
+    def resumen(self):
+        with self.candado:
+            cubetas = sorted(self.conteos.items())
+            cantidad, suma, maximo = self.cantidad, self.suma, self.maximo
+        percentiles = {}
+        acumulado = 0
+        pendientes = list(self.PERCENTILES)
+        for cubeta, veces in cubetas:
+            acumulado += veces
+            while pendientes and acumulado >= pendientes[0] / 100 * cantidad:
+                percentiles[f"p{pendientes.pop(0):g}"] = min(self.limite_superior(cubeta), maximo)
+        return {
+            "unidad": "us",
+            "cantidad": cantidad,
+            "media": suma / cantidad if cantidad else 0,
+            "maximo": maximo,
+            "percentiles": percentiles,
+            "cubetas": [[cubeta, veces] for cubeta, veces in cubetas]
+        }
+
+
+def memoria_residente():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None
+
+
+class RegistroMetricas:
+    # Formato de exposicion de texto de Prometheus (compatible con OpenMetrics al hacer scrape)
+    def __init__(self, prefijo):
+        self.prefijo = prefijo
+        self.lineas = []
+
+    @staticmethod
+    def _valor(valor):
+        valor = float(valor)
+        if math.isnan(valor):
+            return "NaN"
+        if math.isinf(valor):
+            return "+Inf" if valor > 0 else "-Inf"
+        return repr(int(valor)) if valor.is_integer() and abs(valor) < 2 ** 53 else repr(valor)
+
+    @staticmethod
+    def _etiquetas(etiquetas):
+        if not etiquetas:
+            return ""
+        pares = []
+        for clave, valor in etiquetas.items():
+            valor = str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+            pares.append(f'{clave}="{valor}"')
+        return "{" + ",".join(pares) + "}"
+
+    def familia(self, nombre, tipo, ayuda):
+        self.lineas.append(f"# HELP {self.prefijo}_{nombre} {ayuda}")
+        self.lineas.append(f"# TYPE {self.prefijo}_{nombre} {tipo}")
+
+    def muestra(self, nombre, valor, **etiquetas):
+        if valor is not None:
+            self.lineas.append(f"{self.prefijo}_{nombre}{self._etiquetas(etiquetas)} {self._valor(valor)}")
+
+    def metrica(self, nombre, tipo, ayuda, valor, **etiquetas):
+        self.familia(nombre, tipo, ayuda)
+        self.muestra(nombre, valor, **etiquetas)
+
+    def histograma(self, nombre, ayuda, limites, conteos, suma, **etiquetas):
+        self.familia(nombre, "histogram", ayuda)
+        acumulado = 0
+        for limite, conteo in zip(limites, conteos):
+            acumulado += conteo
+            self.muestra(nombre + "_bucket", acumulado, le=self._valor(limite), **etiquetas)
+        self.muestra(nombre + "_bucket", sum(conteos), le="+Inf", **etiquetas)
+        self.muestra(nombre + "_sum", suma, **etiquetas)
+        self.muestra(nombre + "_count", sum(conteos), **etiquetas)
+
+    def texto(self):
+        return "\n".join(self.lineas) + "\n"
+
+
+class ExportadorMetricas:
+    TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, recolectar, puerto, host="0.0.0.0"):
+        self.recolectar = recolectar
+        self.puerto = puerto
+        self.host = host
+        self.servidor = None
+
+    def iniciar(self):
+        recolectar = self.recolectar
+        tipo_contenido = self.TIPO_CONTENIDO
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                cuerpo = recolectar().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", tipo_contenido)
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.servidor = ThreadingHTTPServer((self.host, self.puerto), Manejador)
+        except OSError as e:
+            print(f"[METRICAS] No se pudo abrir el puerto {self.puerto}: {e} - exportador desactivado")
+            return False
+        self.servidor.daemon_threads = True
+        Thread(target=self.servidor.serve_forever, daemon=True).start()
+        print(f"[METRICAS] Exportando en http://{self.host}:{self.servidor.server_address[1]}/metrics")
+        return True
+
+    def detener(self):
+        if self.servidor:
+            self.servidor.shutdown()
+            self.servidor.server_close()
+            self.servidor = None
+
+
+class PoolConexionesRabbit:
+    _pools = {}
+    _candado_pools = Lock()
+
+    def __init__(self, parametros):
+        self.parametros = parametros
+        self._local = local()
+        self._candado = Lock()
+        self.reconexiones = 0
+        self.cerradas_hilo_terminado = 0
+        # Conexion abierta por cada hilo: la de un hilo que ya termino no la usa ni la cierra nadie
+        self._por_hilo = {}
+
+    @classmethod
+    def compartido(cls, parametros):
+        clave = (parametros.host, parametros.port, parametros.credentials.username)
+        with cls._candado_pools:
+            if clave not in cls._pools:
+                cls._pools[clave] = cls(parametros)
+            return cls._pools[clave]
+
+    def _conexion_sana(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None or not conexion.is_open:
+            return False
+        # Un hilo ocioso no atiende los heartbeats: pasado el intervalo el broker ya cerro su conexion
+        latido = getattr(self.parametros, "heartbeat", None)
+        if isinstance(latido, (int, float)) and latido and time.monotonic() - getattr(self._local, "ultimo_uso", 0) > latido:
+            return False
+        try:
+            conexion.process_data_events(time_limit=0)
+            return True
+        except pika.exceptions.AMQPError:
+            return False
+
+    def _reconectar(self):
+        self.invalidar()
+        self._cerrar_hilos_terminados()
+        self._local.conexion = pika.BlockingConnection(self.parametros)
+        self._local.canal = self._local.conexion.channel()
+        with self._candado:
+            self.reconexiones += 1
+            self._por_hilo[current_thread()] = self._local.conexion
+
+    def _cerrar_hilos_terminados(self):
+        # Se barre al abrir otra conexion: el hilo propietario ya no existe, asi que no hay uso concurrente
+        with self._candado:
+            terminados = [hilo for hilo in self._por_hilo if not hilo.is_alive()]
+            conexiones = [self._por_hilo.pop(hilo) for hilo in terminados]
+            self.cerradas_hilo_terminado += len(conexiones)
+        for conexion in conexiones:
+            try:
+                if conexion.is_open:
+                    conexion.close()
+            except Exception:
+                pass
+
+    def obtener_canal(self):
+        # pika no es thread-safe: cada hilo mantiene su propia conexion persistente
+        if not self._conexion_sana():
+            self._reconectar()
+        if self._local.canal is None or not self._local.canal.is_open:
+            self._local.canal = self._local.conexion.channel()
+        self._local.ultimo_uso = time.monotonic()
+        return self._local.canal
+
+    def invalidar(self):
+        conexion = getattr(self._local, "conexion", None)
+        self._local.conexion = None
+        self._local.canal = None
+        if conexion is not None:
+            with self._candado:
+                self._por_hilo.pop(current_thread(), None)
+        if conexion and conexion.is_open:
+            try:
+                conexion.close()
+            except Exception:
+                pass
+
+    def ejecutar(self, operacion, reintentos=1):
+        for intento in range(reintentos + 1):
+            try:
+                return operacion(self.obtener_canal())
+            except pika.exceptions.AMQPConnectionError:
+                # Incluye StreamLostError y AMQPHeartbeatTimeout: socket perdido, se reconstruye la conexion
+                self.invalidar()
+                if intento == reintentos:
+                    raise
+            except pika.exceptions.AMQPChannelError:
+                self._local.canal = None
+                raise
 
 
 class ConexionRabbit:
@@ -14,6 +345,7 @@ class ConexionRabbit:
         self.contrasena = contrasena
         self.conexion = None
         self.canal = None
+        self.pool = PoolConexionesRabbit.compartido(self.obtener_parametros())
 
     def obtener_parametros(self):
         return pika.ConnectionParameters(
@@ -37,79 +369,315 @@ class ConexionRabbit:
         try:
             canal.queue_declare(queue=cola, passive=True)
         except pika.exceptions.ChannelClosedByBroker:
-            canal = self.conectar()
+            canal = self.pool.obtener_canal()
             canal.queue_declare(queue=cola, durable=durable)
         return canal
 
 
 class ObtenedorModelo(ConexionRabbit):
-    def __init__(self, cola="cola_modelo", **kwargs):
+    def __init__(self, cola="cola_modelo", intercambio="modelos", cola_registro="registro_modelos",
+                 modelos_en_cache=4, **kwargs):
         super().__init__(**kwargs)
         self.cola = cola
+        self.intercambio = intercambio
+        self.cola_registro = cola_registro
         self.version_modelo = None
         self.codigo_modelo = None
         self.funcion_modelo = None
+        self.funcion_modelo_lote = None
+        # LRU de modelos compilados por (version, sha256 del codigo): cambiar de version no recompila
+        self.modelos_en_cache = max(1, modelos_en_cache)
+        self.cache_modelos = OrderedDict()
+        self.candado_cache = Lock()
+        self.aciertos_cache = 0
+        self.compilaciones = 0
+        self.en_compilacion = set()
+        self.versiones_invalidas = set()
+        self.solicitudes_pendientes = {}
+        self.marcas_version = {}
+        # Codigo fuente recibido por el fanout 'modelos' o como respuesta del registro del productor
+        self.modelos_anunciados = OrderedDict()
+        self.version_anunciada = None
+        self.versiones_desconocidas = set()
+        self.respuestas_registro = 0
+        self.cola_suscripcion = None
+        self.condicion_anuncios = Condition()
+        self.al_anunciar = None
+        self.suscripcion_iniciada = False
+        self.ejecutando = True
+
+    def iniciar_suscripcion(self, espera=5):
+        if not self.suscripcion_iniciada:
+            self.suscripcion_iniciada = True
+            Thread(target=self._bucle_suscripcion, daemon=True).start()
+        with self.condicion_anuncios:
+            self.condicion_anuncios.wait_for(lambda: self.cola_suscripcion is not None, timeout=espera)
+
+    def _bucle_suscripcion(self):
+        while self.ejecutando:
+            try:
+                conexion = pika.BlockingConnection(self.obtener_parametros())
+                canal = conexion.channel()
+                canal.exchange_declare(exchange=self.intercambio, exchange_type='fanout', durable=True)
+                cola = canal.queue_declare(queue='', exclusive=True).method.queue
+                canal.queue_bind(exchange=self.intercambio, queue=cola)
+                canal.basic_consume(queue=cola, on_message_callback=self._al_recibir_modelo, auto_ack=True)
+                with self.condicion_anuncios:
+                    self.cola_suscripcion = cola
+                    self.condicion_anuncios.notify_all()
+                canal.start_consuming()
+            except Exception as e:
+                with self.condicion_anuncios:
+                    self.cola_suscripcion = None
+                if self.ejecutando:
+                    print(f"[ADVERTENCIA] Reconectando suscripcion de modelos: {e}")
+                    time.sleep(5)
+
+    def _al_recibir_modelo(self, ch, metodo, props, cuerpo):
+        datos = json.loads(cuerpo.decode())
+        version = datos.get("version")
+        # Sin correlation_id es un anuncio del fanout; con el, la respuesta a una solicitud al registro
+        anuncio = props.correlation_id is None
+        valido = bool(version and datos.get("codigo") and not datos.get("error"))
+        with self.condicion_anuncios:
+            if not anuncio:
+                self.respuestas_registro += 1
+            self.solicitudes_pendientes.pop(version, None)
+            if datos.get("error"):
+                self.versiones_desconocidas.add(version)
+            elif valido:
+                self.modelos_anunciados[version] = datos
+                self.modelos_anunciados.move_to_end(version)
+                while len(self.modelos_anunciados) > 2 * self.modelos_en_cache:
+                    self.modelos_anunciados.popitem(last=False)
+                self.marcas_version[version] = datos.get("marca_tiempo") or time.time()
+                if anuncio or props.correlation_id == "ultima":
+                    self.version_anunciada = version
+            self.condicion_anuncios.notify_all()
+        # La respuesta a "ultima" la compila quien la pidio; anuncios y versiones pedidas se compilan aparte
+        if valido and props.correlation_id != "ultima":
+            self.preparar(version)
+        if anuncio and version and self.al_anunciar:
+            self.al_anunciar(version)
+
+    def _publicar_solicitud(self, version=None):
+        if self.cola_suscripcion is None:
+            return False
+        try:
+            self.pool.ejecutar(lambda canal: canal.basic_publish(
+                exchange='',
+                routing_key=self.cola_registro,
+                body=json.dumps({"version": version}).encode(),
+                properties=pika.BasicProperties(
+                    content_type=TIPO_JSON,
+                    reply_to=self.cola_suscripcion,
+                    correlation_id=version or "ultima"
+                )
+            ))
+            return True
+        except Exception as e:
+            print(f"[ADVERTENCIA] No se pudo consultar el registro de modelos: {e}")
+            return False
+
+    def _solicitar_registro(self, version=None, espera=3):
+        with self.condicion_anuncios:
+            respuestas_previas = self.respuestas_registro
+        if not self._publicar_solicitud(version):
+            return None
+        with self.condicion_anuncios:
+            self.condicion_anuncios.wait_for(
+                lambda: self.respuestas_registro != respuestas_previas or version in self.modelos_anunciados,
+                timeout=espera
+            )
+            return self.modelos_anunciados.get(version or self.version_anunciada)
+
+    def _leer_cola_modelo(self):
+        # Respaldo para productores sin registro: se mira el mensaje retenido en cola_modelo y se devuelve
+        try:
+            canal = self.pool.obtener_canal()
+            try:
+                info = canal.queue_declare(queue=self.cola, passive=True)
+                if info.method.message_count == 0:
+                    return None
+            except pika.exceptions.ChannelClosedByBroker:
+                return None
+
+            metodo, _, cuerpo = canal.basic_get(queue=self.cola, auto_ack=False)
+            if metodo:
+                canal.basic_nack(delivery_tag=metodo.delivery_tag, requeue=True)
+                return json.loads(cuerpo.decode())
+        except Exception as e:
+            print(f"[ERROR] Conexion fallida: {e}")
+            self.pool.invalidar()
+        return None
+
+    def _cargar(self, datos):
+        self.version_modelo = datos.get("version")
+        self.codigo_modelo = datos.get("codigo")
+        self._compilar_modelo()
 
     def obtener_modelo(self, espera_maxima=120):
         inicio = time.time()
-        print(f"[TRABAJADOR] Buscando modelo en cola '{self.cola}'...")
+        print(f"[TRABAJADOR] Buscando modelo en '{self.intercambio}'...")
+        self.iniciar_suscripcion()
 
         while (time.time() - inicio) < espera_maxima:
-            try:
-                canal = self.conectar()
-                try:
-                    info = canal.queue_declare(queue=self.cola, passive=True)
-                    if info.method.message_count == 0:
-                        self.cerrar()
-                        time.sleep(2)
-                        continue
-                except pika.exceptions.ChannelClosedByBroker:
-                    self.cerrar()
-                    time.sleep(2)
-                    continue
-
-                metodo, _, cuerpo = canal.basic_get(queue=self.cola, auto_ack=False)
-                if metodo:
-                    datos = json.loads(cuerpo.decode())
-                    self.version_modelo = datos.get("version")
-                    self.codigo_modelo = datos.get("codigo")
-                    canal.basic_nack(delivery_tag=metodo.delivery_tag, requeue=True)
-                    self._compilar_modelo()
-                    self.cerrar()
-                    print(f"[TRABAJADOR] Modelo recibido: {self.version_modelo[:12]}...")
-                    return True
-
-                self.cerrar()
-                time.sleep(2)
-            except Exception as e:
-                print(f"[ERROR] Conexion fallida: {e}")
-                self.cerrar()
-                time.sleep(3)
+            datos = self.modelos_anunciados.get(self.version_anunciada) or self._solicitar_registro()
+            if not datos:
+                datos = self._leer_cola_modelo()
+            if datos:
+                self._cargar(datos)
+                print(f"[TRABAJADOR] Modelo recibido: {self.version_modelo[:12]}...")
+                return True
+            time.sleep(2)
 
         print(f"[ERROR] Timeout esperando modelo")
         return False
 
+    def preparar(self, version, reintento_solicitud=5.0):
+        # Nunca bloquea: compila en segundo plano lo que ya se recibio y pide al registro lo que falta
+        if not version or version in self.versiones_invalidas or self.tiene_version(version):
+            return
+        datos = self.modelos_anunciados.get(version)
+        with self.candado_cache:
+            if version in self.en_compilacion:
+                return
+            if datos:
+                self.en_compilacion.add(version)
+        if datos:
+            Thread(target=self._precompilar, args=(datos,), daemon=True).start()
+        elif time.time() - self.solicitudes_pendientes.get(version, 0) > reintento_solicitud:
+            self.solicitudes_pendientes[version] = time.time()
+            self._publicar_solicitud(version)
+
+    def _precompilar(self, datos):
+        version = datos["version"]
+        try:
+            clave = (version, hashlib.sha256(datos["codigo"].encode()).hexdigest())
+            if clave not in self.cache_modelos:
+                self._insertar(clave, self._compilar_codigo(datos["codigo"]))
+                print(f"[TRABAJADOR] Modelo {version[:12]}... listo para el cambio en caliente")
+        except Exception as e:
+            print(f"[ERROR] Modelo {version[:12]}... invalido: {e}")
+            self.versiones_invalidas.add(version)
+        finally:
+            with self.candado_cache:
+                self.en_compilacion.discard(version)
+
+    def clasificar(self, version):
+        if self.tiene_version(version):
+            return "ejecutar"
+        if version in self.versiones_desconocidas or version in self.versiones_invalidas:
+            return "descartar"
+        marca = self.marcas_version.get(version)
+        marca_vigente = self.marcas_version.get(self.version_anunciada)
+        if marca is not None and marca_vigente is not None and marca < marca_vigente:
+            return "descartar"
+        self.preparar(version)
+        return "esperar"
+
+    def cargar_anunciado(self, version):
+        datos = self.modelos_anunciados.get(version)
+        if not datos:
+            return False
+        self._cargar(datos)
+        return True
+
+    def detener(self):
+        self.ejecutando = False
+
     def _compilar_modelo(self):
         if not self.codigo_modelo:
             raise ValueError("No hay codigo de modelo")
+
+        clave = (self.version_modelo, hashlib.sha256(self.codigo_modelo.encode()).hexdigest())
+        entrada = self.cache_modelos.get(clave)
+        if entrada is None:
+            entrada = self._insertar(clave, self._compilar_codigo(self.codigo_modelo))
+        else:
+            self.aciertos_cache += 1
+        self._activar_entrada(clave, entrada)
+
+    def _insertar(self, clave, entrada):
+        with self.candado_cache:
+            self.compilaciones += 1
+            self.cache_modelos[clave] = entrada
+            while len(self.cache_modelos) > self.modelos_en_cache:
+                self.cache_modelos.popitem(last=False)
+        return entrada
+
+    def _activar_entrada(self, clave, entrada):
+        with self.candado_cache:
+            if clave in self.cache_modelos:
+                self.cache_modelos.move_to_end(clave)
+        self.version_modelo = clave[0]
+        self.codigo_modelo = entrada["codigo"]
+        self.funcion_modelo = entrada["funcion_modelo"]
+        self.funcion_modelo_lote = entrada["funcion_modelo_lote"]
+
+    def _compilar_codigo(self, codigo):
+        espacio = espacio_modelo()
+        exec(codigo, espacio)
+        funcion_modelo = espacio.get("model_fn")
         
-        espacio = {}
-        exec(self.codigo_modelo, espacio)
-        self.funcion_modelo = espacio.get("model_fn")
-        
-        if not self.funcion_modelo:
+        if not funcion_modelo:
             raise ValueError("El modelo no contiene 'model_fn'")
         
-        self.funcion_modelo({"prueba": True})
-        print("[TRABAJADOR] Modelo compilado y verificado")
+        funcion_modelo({"prueba": True})
+        funcion_modelo_lote = espacio.get("model_fn_batch")
+        if funcion_modelo_lote:
+            try:
+                self._verificar_modelo_lote(funcion_modelo_lote, funcion_modelo)
+            except Exception as e:
+                print(f"[ADVERTENCIA] 'model_fn_batch' descartado: {e}")
+                funcion_modelo_lote = None
+        print("[TRABAJADOR] Modelo compilado y verificado" + (" (con model_fn_batch)" if funcion_modelo_lote else ""))
+        return {"codigo": codigo, "funcion_modelo": funcion_modelo, "funcion_modelo_lote": funcion_modelo_lote}
+
+    def tiene_version(self, version):
+        with self.candado_cache:
+            return any(clave[0] == version for clave in self.cache_modelos)
+
+    def activar(self, version):
+        with self.candado_cache:
+            encontrada = next(((clave, entrada) for clave, entrada in reversed(self.cache_modelos.items()) if clave[0] == version), None)
+        if encontrada is None:
+            return False
+        self.aciertos_cache += 1
+        self._activar_entrada(*encontrada)
+        return True
+
+    def estado_cache(self):
+        with self.candado_cache:
+            versiones = [version for version, _ in self.cache_modelos]
+        return {
+            "versiones": versiones,
+            "capacidad": self.modelos_en_cache,
+            "aciertos": self.aciertos_cache,
+            "compilaciones": self.compilaciones,
+            "en_compilacion": len(self.en_compilacion),
+            "invalidas": len(self.versiones_invalidas)
+        }
+
+    def _verificar_modelo_lote(self, funcion_modelo_lote, funcion_modelo):
+        columnas = {"indice": np.arange(2)}
+        salidas = funcion_modelo_lote(columnas)
+        if not isinstance(salidas, dict):
+            raise ValueError("debe devolver un diccionario de columnas")
+        for clave, valores in salidas.items():
+            np.broadcast_to(valores, (2,))
+        verificar_equivalencia_lote(funcion_modelo_lote, funcion_modelo)
 
 
 class OyenteActualizaciones(ConexionRabbit):
-    def __init__(self, cola="actualizaciones_modelo", **kwargs):
+    def __init__(self, cola="actualizaciones_modelo", intercambio_control="control_simulacion", **kwargs):
         super().__init__(**kwargs)
         self.cola = cola
+        self.intercambio_control = intercambio_control
         self.evento_actualizacion = Event()
         self.nueva_version = None
+        self.versiones_convergidas = set()
+        self.al_converger = None
         self.ejecutando = True
 
     def iniciar_escucha(self):
@@ -136,13 +704,26 @@ class OyenteActualizaciones(ConexionRabbit):
                         print(f"\n[TRABAJADOR] Actualizacion detectada: {self.nueva_version[:12]}...")
                     ch.basic_ack(metodo.delivery_tag)
 
+                canal.exchange_declare(exchange=self.intercambio_control, exchange_type='fanout')
+                cola_control = canal.queue_declare(queue='', exclusive=True).method.queue
+                canal.queue_bind(exchange=self.intercambio_control, queue=cola_control)
+
                 canal.basic_consume(queue=self.cola, on_message_callback=callback)
+                canal.basic_consume(queue=cola_control, on_message_callback=self._al_recibir_control, auto_ack=True)
                 canal.start_consuming()
             except Exception as e:
                 if self.ejecutando:
                     print(f"[ADVERTENCIA] Reconectando oyente: {e}")
                     time.sleep(5)
 
+    def _al_recibir_control(self, ch, metodo, props, cuerpo):
+        datos = json.loads(cuerpo.decode())
+        if datos.get("evento") != "convergencia_alcanzada":
+            return
+        self.versiones_convergidas.add(datos.get("version_modelo"))
+        if self.al_converger:
+            self.al_converger(datos)
+
     def verificar_actualizacion(self):
         if self.evento_actualizacion.is_set():
             self.evento_actualizacion.clear()
@@ -154,23 +735,275 @@ class OyenteActualizaciones(ConexionRabbit):
 
 
 class Publicador(ConexionRabbit):
-    def __init__(self, cola, **kwargs):
+    def __init__(self, cola, intercambio=None, histogramas=None, **kwargs):
         super().__init__(**kwargs)
         self.cola = cola
+        self.intercambio = intercambio
+        self.histogramas = histogramas
+        self.reconexiones_declaradas = None
+        self.tipo_contenido = TIPO_JSON
+
+    def _declarar_destino(self, canal):
+        if not self.intercambio:
+            return self.declarar_cola_segura(canal, self.cola)
+        # Con intercambio fanout la cola propia se enlaza para no perder mensajes sin suscriptores
+        canal.exchange_declare(exchange=self.intercambio, exchange_type='fanout', durable=True)
+        canal.queue_declare(queue=self.cola, durable=True)
+        canal.queue_bind(exchange=self.intercambio, queue=self.cola)
+        return canal
 
     def publicar(self, datos):
-        try:
-            canal = self.conectar()
-            canal = self.declarar_cola_segura(canal, self.cola)
+        inicio = time.perf_counter_ns()
+        cuerpo = codificar_mensaje(datos, self.tipo_contenido)
+        if self.histogramas:
+            self.histogramas["codificacion"].registrar((time.perf_counter_ns() - inicio) // 1000)
+
+        def publicar(canal):
+            if self.reconexiones_declaradas != self.pool.reconexiones:
+                canal = self._declarar_destino(canal)
+                self.reconexiones_declaradas = self.pool.reconexiones
+            inicio = time.perf_counter_ns()
             canal.basic_publish(
-                exchange='',
-                routing_key=self.cola,
-                body=json.dumps(datos).encode(),
-                properties=pika.BasicProperties(content_type='application/json')
+                exchange=self.intercambio or '',
+                routing_key='' if self.intercambio else self.cola,
+                body=cuerpo,
+                properties=pika.BasicProperties(content_type=self.tipo_contenido)
             )
-            self.cerrar()
+            if self.histogramas:
+                self.histogramas["publicacion"].registrar((time.perf_counter_ns() - inicio) // 1000)
+
+        try:
+            self.pool.ejecutar(publicar)
+            return True
         except Exception as e:
             print(f"[ERROR] No se pudo publicar en {self.cola}: {e}")
+            return False
+
+
+class AnuncianteCapacidad(ConexionRabbit):
+    # El productor dosifica la cola con lo que anuncian los trabajadores: capacidad medida y consumo por version
+    def __init__(self, id_consumidor, intercambio="capacidad_trabajadores", intervalo=1.0, suavizado=0.3, **kwargs):
+        super().__init__(**kwargs)
+        self.id_consumidor = id_consumidor
+        self.intercambio = intercambio
+        self.intervalo = intervalo
+        self.suavizado = suavizado
+        self.escenarios = 0
+        self.segundos_ocupados = 0.0
+        self.capacidad = None
+        self.tasa = 0.0
+        self.ultimo_anuncio = time.time()
+        self.anuncios = 0
+        self.reconexiones_declaradas = None
+
+    def registrar(self, escenarios, segundos):
+        self.escenarios += escenarios
+        self.segundos_ocupados += segundos
+
+    def pendiente(self):
+        return time.time() - self.ultimo_anuncio >= self.intervalo
+
+    def anunciar(self, consumidos, prefetch):
+        # La capacidad se mide sobre el tiempo ocupado: no cae cuando la cola se vacia
+        ahora = time.time()
+        transcurrido = ahora - self.ultimo_anuncio
+        if self.segundos_ocupados > 0:
+            muestra = self.escenarios / self.segundos_ocupados
+            self.capacidad = muestra if self.capacidad is None else self.capacidad + self.suavizado * (muestra - self.capacidad)
+        self.tasa = self.escenarios / transcurrido if transcurrido > 0 else 0.0
+        self.escenarios = 0
+        self.segundos_ocupados = 0.0
+        self.ultimo_anuncio = ahora
+        cuerpo = json.dumps({
+            "consumidor": self.id_consumidor,
+            "capacidad": self.capacidad,
+            "tasa": self.tasa,
+            "consumidos": consumidos,
+            "prefetch": prefetch,
+            "marca_tiempo": ahora
+        }).encode()
+
+        def publicar(canal):
+            if self.reconexiones_declaradas != self.pool.reconexiones:
+                canal.exchange_declare(exchange=self.intercambio, exchange_type='fanout')
+                self.reconexiones_declaradas = self.pool.reconexiones
+            canal.basic_publish(exchange=self.intercambio, routing_key='', body=cuerpo,
+                                properties=pika.BasicProperties(content_type=TIPO_JSON))
+
+        try:
+            self.pool.ejecutar(publicar)
+            self.anuncios += 1
+        except Exception as e:
+            print(f"[ERROR] No se pudo anunciar la capacidad: {e}")
+
+
+class AgrupadorResultados:
+    def __init__(self, publicador, id_consumidor, tamano_maximo=500, ventana=0.1):
+        self.publicador = publicador
+        self.id_consumidor = id_consumidor
+        self.tamano_maximo = tamano_maximo
+        self.ventana = ventana
+        self.pendientes = []
+        self.version_pendiente = None
+        self.inicio_ventana = None
+        self.candado = Lock()
+        self.candado_publicacion = Lock()
+        self.ejecutando = False
+        self.lotes_enviados = 0
+        # Etiquetas de entrega por estado: en el lote en curso, en publicacion, y ya publicadas o fallidas
+        self.etiquetas_pendientes = []
+        self.etiquetas_en_publicacion = []
+        self.confirmables = []
+        self.fallidas = []
+
+    def iniciar(self):
+        self.ejecutando = True
+        Thread(target=self._bucle_vaciado, daemon=True).start()
+
+    def detener(self):
+        self.ejecutando = False
+        self.vaciar()
+
+    def _bucle_vaciado(self):
+        while self.ejecutando:
+            time.sleep(self.ventana / 2)
+            if self.inicio_ventana and (time.time() - self.inicio_ventana) >= self.ventana:
+                self.vaciar()
+
+    def agregar(self, resultado):
+        version = resultado.get("version_modelo")
+        while True:
+            with self.candado:
+                if not self.pendientes or self.version_pendiente == version:
+                    break
+            self.vaciar()
+        with self.candado:
+            if not self.pendientes:
+                self.inicio_ventana = self.inicio_ventana or time.time()
+                self.version_pendiente = version
+            self.pendientes.append({
+                "id_escenario": resultado["id_escenario"],
+                "indice": resultado.get("indice"),
+                "resultado": resultado["resultado"],
+                "marca_tiempo": resultado["marca_tiempo"],
+                "tiempo_procesamiento": resultado["tiempo_procesamiento"],
+                "exito": resultado["exito"]
+            })
+            lleno = len(self.pendientes) >= self.tamano_maximo
+        if lleno:
+            self.vaciar()
+
+    def agregar_etiqueta(self, etiqueta):
+        # La entrega se confirma cuando se publique el lote que lleva sus ultimos resultados
+        with self.candado:
+            self.etiquetas_pendientes.append(etiqueta)
+            self.inicio_ventana = self.inicio_ventana or time.time()
+            return len(self.etiquetas_pendientes) + len(self.etiquetas_en_publicacion)
+
+    def tomar_confirmables(self):
+        with self.candado:
+            publicadas, self.confirmables = self.confirmables, []
+            fallidas, self.fallidas = self.fallidas, []
+            abiertas = self.etiquetas_pendientes + self.etiquetas_en_publicacion
+            return publicadas, fallidas, min(abiertas) if abiertas else None
+
+    def vaciar(self):
+        # Los lotes salen en orden: una etiqueta nunca queda confirmable antes que los resultados previos
+        with self.candado_publicacion:
+            with self.candado:
+                if not self.pendientes and not self.etiquetas_pendientes:
+                    return
+                lote, self.pendientes = self.pendientes, []
+                etiquetas, self.etiquetas_pendientes = self.etiquetas_pendientes, []
+                self.etiquetas_en_publicacion = etiquetas
+                version = self.version_pendiente
+                self.inicio_ventana = None
+            publicado = True
+            if lote:
+                publicado = self.publicador.publicar({
+                    "tipo": "lote_resultados",
+                    "id_lote": uuid.uuid4().hex,
+                    "consumidor": self.id_consumidor,
+                    "version_modelo": version,
+                    "cantidad": len(lote),
+                    "resultados": lote
+                })
+                if publicado:
+                    self.lotes_enviados += 1
+            with self.candado:
+                (self.confirmables if publicado else self.fallidas).extend(etiquetas)
+                self.etiquetas_en_publicacion = []
+
+
+class ControlPrefetch:
+    def __init__(self, minimo=1, maximo=500, segundos_ventana=1.0, intervalo_ajuste=1.0, suavizado=0.2):
+        self.minimo = minimo
+        self.maximo = max(minimo, maximo)
+        self.segundos_ventana = segundos_ventana
+        self.intervalo_ajuste = intervalo_ajuste
+        self.suavizado = suavizado
+        self.actual = minimo
+        self.latencia_modelo = None
+        self.latencia_ida_vuelta = None
+        self.ultimo_ack = None
+        self.ultimo_ajuste = time.time()
+        self.entregas = 0
+        self.reentregas = 0
+        self.ajustes = 0
+
+    def _suavizar(self, previo, valor):
+        return valor if previo is None else previo + self.suavizado * (valor - previo)
+
+    def registrar_entrega(self, reentregado=False):
+        self.entregas += 1
+        if reentregado:
+            self.reentregas += 1
+        if self.ultimo_ack is not None:
+            espera = time.perf_counter() - self.ultimo_ack
+            self.latencia_ida_vuelta = self._suavizar(self.latencia_ida_vuelta, espera)
+            self.ultimo_ack = None
+
+    def registrar_ack(self, duracion_modelo):
+        self.latencia_modelo = self._suavizar(self.latencia_modelo, duracion_modelo)
+        self.ultimo_ack = time.perf_counter()
+
+    def recalcular(self):
+        if self.latencia_modelo is None or self.latencia_ida_vuelta is None:
+            return None
+        if time.time() - self.ultimo_ajuste < self.intervalo_ajuste:
+            return None
+        self.ultimo_ajuste = time.time()
+
+        # Si el trabajador espera al broker entre mensajes, la ventana se queda corta;
+        # si nunca espera, se reduce poco a poco para limitar el trabajo a reentregar
+        objetivo = self.actual
+        if self.latencia_ida_vuelta > 0.1 * self.latencia_modelo:
+            objetivo = self.actual * 2
+        elif self.latencia_ida_vuelta < 0.01 * self.latencia_modelo:
+            objetivo = self.actual - max(1, self.actual // 8)
+        techo = int(self.segundos_ventana / max(self.latencia_modelo, 1e-6))
+        objetivo = max(self.minimo, min(objetivo, techo, self.maximo))
+
+        if objetivo == self.actual:
+            return None
+        self.actual = objetivo
+        self.ajustes += 1
+        return objetivo
+
+    def estadisticas(self):
+        latencia_modelo = self.latencia_modelo or 0
+        return {
+            "actual": self.actual,
+            "minimo": self.minimo,
+            "maximo": self.maximo,
+            "ajustes": self.ajustes,
+            "latencia_modelo_ms": latencia_modelo * 1000,
+            "latencia_ida_vuelta_ms": (self.latencia_ida_vuelta or 0) * 1000,
+            "entregas": self.entregas,
+            "reentregas": self.reentregas,
+            "tasa_reentrega": self.reentregas / self.entregas if self.entregas else 0,
+            "trabajo_en_riesgo_s": self.actual * latencia_modelo
+        }
 
 
 class TrabajadorMonteCarlo:
@@ -180,19 +1013,50 @@ class TrabajadorMonteCarlo:
         "usuario": "admin",
         "contrasena": "admin"
     }
+    ETAPAS = ("decodificacion", "verificacion_version", "modelo", "codificacion", "publicacion", "ack")
 
-    def __init__(self, id_consumidor):
+    def __init__(self, id_consumidor, tamano_lote_resultados=500, ventana_resultados=0.1,
+                 prefetch_minimo=1, prefetch_maximo=500, segundos_ventana_prefetch=1.0, puerto_metricas=None,
+                 modelos_en_cache=4):
         self.id_consumidor = id_consumidor
-        self.obtenedor_modelo = ObtenedorModelo(**self.CONFIG)
-        self.publicador_resultados = Publicador(cola="resultados", **self.CONFIG)
+        self.exportador_metricas = ExportadorMetricas(self.recolectar_metricas, puerto_metricas) if puerto_metricas else None
+        self.histogramas = {etapa: HistogramaLatencias() for etapa in self.ETAPAS}
+        self.obtenedor_modelo = ObtenedorModelo(modelos_en_cache=modelos_en_cache, **self.CONFIG)
+        self.publicador_resultados = Publicador(
+            cola="resultados", intercambio="resultados", histogramas=self.histogramas, **self.CONFIG
+        )
         self.publicador_estadisticas = Publicador(cola="estadisticas", **self.CONFIG)
+        self.anunciante_capacidad = AnuncianteCapacidad(id_consumidor, **self.CONFIG)
+        self.agrupador_resultados = AgrupadorResultados(
+            self.publicador_resultados, id_consumidor,
+            tamano_maximo=tamano_lote_resultados,
+            ventana=ventana_resultados
+        )
         self.oyente_actualizaciones = OyenteActualizaciones(**self.CONFIG)
+        self.oyente_actualizaciones.al_converger = self.drenar
+        self.obtenedor_modelo.al_anunciar = self._al_anunciar_modelo
         
         self.contador_procesados = 0
         self.contador_errores = 0
+        self.descartados_convergencia = 0
+        self.cambios_modelo = 0
+        self.conteo_versiones = defaultdict(lambda: {"ejecutados": 0, "reencolados": 0, "descartados": 0})
+        self.aparcados = []
+        self.espera_modelo_maxima = 30.0
+        self.intercambio_escenarios = "escenarios"
+        self.prefijo_cola = "escenarios"
+        self.cola_consumo = None
+        self.etiqueta_consumo = None
+        self.proximo_intento_cola = 0
+        self.cambios_cola = 0
         self.tiempo_inicio = None
         self.ultimo_tiempo_stats = time.time()
         self.version_modelo = None
+        self.control_prefetch = ControlPrefetch(
+            minimo=prefetch_minimo,
+            maximo=prefetch_maximo,
+            segundos_ventana=segundos_ventana_prefetch
+        )
 
     def inicializar(self):
         print(f"\n{'=' * 60}")
@@ -204,39 +1068,214 @@ class TrabajadorMonteCarlo:
             self.version_modelo = self.obtenedor_modelo.version_modelo
             self.tiempo_inicio = time.time()
             self.oyente_actualizaciones.iniciar_escucha()
+            self.agrupador_resultados.iniciar()
+            if self.exportador_metricas:
+                self.exportador_metricas.iniciar()
             print(f"[TRABAJADOR {self.id_consumidor}] Listo")
             return True
         
         print(f"[TRABAJADOR {self.id_consumidor}] Error al inicializar")
         return False
 
-    def recargar_modelo(self):
-        print(f"[TRABAJADOR {self.id_consumidor}] Recargando modelo...")
-        if self.obtenedor_modelo.obtener_modelo(espera_maxima=30):
-            if self.obtenedor_modelo.version_modelo != self.version_modelo:
-                self.version_modelo = self.obtenedor_modelo.version_modelo
-                print(f"[TRABAJADOR {self.id_consumidor}] Modelo actualizado")
+    def _al_anunciar_modelo(self, version):
+        if version != self.version_modelo:
+            self.oyente_actualizaciones.nueva_version = version
+            self.oyente_actualizaciones.evento_actualizacion.set()
+            print(f"\n[TRABAJADOR] Modelo anunciado: {version[:12]}...")
+
+    def _cambiar_version(self, version):
+        # Cambio en caliente: solo se apunta a un modelo ya compilado (o cuyo codigo ya se recibio)
+        if not (self.obtenedor_modelo.activar(version) or self.obtenedor_modelo.cargar_anunciado(version)):
+            return False
+        if version != self.version_modelo:
+            self.version_modelo = version
+            self.cambios_modelo += 1
+        return True
+
+    def _enrutar(self, ch, metodo, props, cuerpo, desde=None):
+        cabeceras = props.headers or {}
+        version = cabeceras.get('version-modelo')
+        if not version or version == self.version_modelo:
+            return True
+        destino = self.obtenedor_modelo.clasificar(version)
+        if destino == "ejecutar":
+            if self._cambiar_version(version):
                 return True
+            destino = "esperar"
+
+        cantidad = cabeceras.get('cantidad-escenarios', 1)
+        if destino == "esperar":
+            desde = desde or time.time()
+            if time.time() - desde < self.espera_modelo_maxima:
+                # Se retiene sin confirmar mientras el modelo compila en segundo plano; si no llega, vuelve a la cola
+                self.aparcados.append((ch, metodo, props, cuerpo, desde))
+                return False
+            ch.basic_nack(metodo.delivery_tag, requeue=True)
+            self.conteo_versiones[version]["reencolados"] += cantidad
+        else:
+            ch.basic_ack(metodo.delivery_tag)
+            self.conteo_versiones[version]["descartados"] += cantidad
         return False
 
+    def _atender_aparcados(self):
+        if not self.aparcados:
+            return
+        aparcados, self.aparcados = self.aparcados, []
+        for ch, metodo, props, cuerpo, desde in aparcados:
+            if self._enrutar(ch, metodo, props, cuerpo, desde):
+                self._procesar_entrega(ch, metodo, props, cuerpo)
+
+    def _cola_version(self, version):
+        return f"{self.prefijo_cola}.{version}"
+
+    def _asegurar_cola_version(self, version):
+        # Se comprueba por el pool: un queue_declare pasivo fallido cierra el canal y no debe ser el de consumo
+        cola = self._cola_version(version)
+        pool = self.obtenedor_modelo.pool
+        try:
+            pool.ejecutar(lambda canal: canal.queue_declare(queue=cola, passive=True))
+        except pika.exceptions.ChannelClosedByBroker:
+            def declarar(canal):
+                canal.exchange_declare(exchange=self.intercambio_escenarios, exchange_type='topic', durable=True)
+                canal.queue_declare(
+                    queue=cola,
+                    durable=True,
+                    arguments={
+                        'x-max-length': 50000,
+                        'x-overflow': 'reject-publish',
+                        'x-message-ttl': 3600000,
+                        'x-expires': 3600000,
+                        'x-queue-mode': 'lazy'
+                    }
+                )
+                canal.queue_bind(exchange=self.intercambio_escenarios, queue=cola, routing_key=version)
+            pool.ejecutar(declarar)
+        return cola
+
+    def _consumir_version(self, canal, version):
+        cola = self._asegurar_cola_version(version)
+        etiqueta = canal.basic_consume(queue=cola, on_message_callback=self._al_recibir)
+        if self.etiqueta_consumo:
+            # Lo ya entregado de la cola anterior se sigue procesando y confirmando en este canal
+            canal.basic_cancel(self.etiqueta_consumo)
+            self.cambios_cola += 1
+        self.etiqueta_consumo, self.cola_consumo = etiqueta, cola
+        return cola
+
+    def _actualizar_cola_consumo(self, canal):
+        # Se pasa a la cola de la version anunciada en cuanto su modelo esta compilado
+        version = self.obtenedor_modelo.version_anunciada
+        if not version or self.cola_consumo == self._cola_version(version):
+            return
+        if not self.obtenedor_modelo.tiene_version(version) or time.time() < self.proximo_intento_cola:
+            return
+        try:
+            cola = self._consumir_version(canal, version)
+            print(f"[TRABAJADOR {self.id_consumidor}] Consumiendo de '{cola}'")
+        except Exception as e:
+            self.proximo_intento_cola = time.time() + 1.0
+            print(f"[TRABAJADOR {self.id_consumidor}] No se pudo cambiar a la cola de {version[:12]}...: {e}")
+
+    def _semillas_bloque(self, bloque):
+        if bloque.get("semilla") is None:
+            return None
+        inicio = bloque["indice_inicial"]
+        return derivar_semillas(bloque["semilla"], np.arange(inicio, inicio + bloque["cantidad"]))
+
+    def expandir_bloque(self, bloque):
+        distribuciones = bloque.get("distribuciones", {})
+        nombres = list(distribuciones.keys())
+        metadatos = {
+            "marca_tiempo_lote": int(bloque["marca_tiempo"]),
+            "tipos_distribucion": nombres
+        }
+        semillas = self._semillas_bloque(bloque)
+        semillas = semillas.tolist() if semillas is not None else [None] * bloque["cantidad"]
+        filas = zip(*distribuciones.values()) if nombres else [()] * bloque["cantidad"]
+        for desplazamiento, (semilla, fila) in enumerate(zip(semillas, filas)):
+            indice = bloque["indice_inicial"] + desplazamiento
+            escenario = {
+                "id": f"{bloque['id_lote']}-{indice}",
+                "indice": indice,
+                "marca_tiempo": bloque["marca_tiempo"],
+                "version_modelo": bloque.get("version_modelo"),
+                "metadatos": metadatos
+            }
+            if semilla is not None:
+                escenario["semilla"] = semilla
+            if nombres:
+                escenario["distribuciones"] = dict(zip(nombres, fila))
+            yield escenario
+
+    def _medir(self, etapa, inicio_ns, veces=1):
+        self.histogramas[etapa].registrar((time.perf_counter_ns() - inicio_ns) // 1000 // veces, veces)
+
+    def procesar_mensaje(self, datos):
+        inicio = time.perf_counter_ns()
+        version_escenario = datos.get("version_modelo")
+        if version_escenario and version_escenario != self.version_modelo:
+            self._cambiar_version(version_escenario)
+        self._medir("verificacion_version", inicio)
+
+        if datos.get("tipo") == "bloque_escenarios":
+            if self.obtenedor_modelo.funcion_modelo_lote:
+                return self.procesar_bloque(datos)
+            return [self.procesar_escenario(escenario) for escenario in self.expandir_bloque(datos)]
+        return [self.procesar_escenario(datos)]
+
+    def procesar_bloque(self, bloque):
+        inicio = time.time()
+        cantidad = bloque["cantidad"]
+        indices = np.arange(bloque["indice_inicial"], bloque["indice_inicial"] + cantidad)
+        columnas = {nombre: np.asarray(valores) for nombre, valores in bloque.get("distribuciones", {}).items()}
+        columnas["indice"] = indices
+        semillas = self._semillas_bloque(bloque)
+        if semillas is not None:
+            columnas["semilla"] = semillas
+        try:
+            inicio_modelo = time.perf_counter_ns()
+            salidas = self.obtenedor_modelo.funcion_modelo_lote(columnas)
+            self._medir("modelo", inicio_modelo, max(cantidad, 1))
+            salidas = {clave: np.broadcast_to(valores, (cantidad,)).tolist() for clave, valores in salidas.items()}
+        except Exception as e:
+            print(f"[TRABAJADOR {self.id_consumidor}] Fallo en model_fn_batch, usando model_fn: {e}")
+            return [self.procesar_escenario(escenario) for escenario in self.expandir_bloque(bloque)]
+
+        fin = time.time()
+        tiempo_por_escenario = (fin - inicio) / cantidad if cantidad else 0
+        claves = list(salidas.keys())
+        self.contador_procesados += cantidad
+        return [
+            {
+                "consumidor": self.id_consumidor,
+                "id_escenario": f"{bloque['id_lote']}-{indice}",
+                "indice": indice,
+                "resultado": dict(zip(claves, fila)),
+                "marca_tiempo": fin,
+                "tiempo_procesamiento": tiempo_por_escenario,
+                "exito": True,
+                "version_modelo": self.version_modelo
+            }
+            for indice, fila in zip(indices.tolist(), zip(*salidas.values()))
+        ]
+
     def procesar_escenario(self, escenario):
         inicio = time.time()
+        inicio_modelo = time.perf_counter_ns()
         try:
-            version_escenario = escenario.get("version_modelo")
-            if version_escenario and version_escenario != self.version_modelo:
-                self.recargar_modelo()
-            
             resultado = self.obtenedor_modelo.funcion_modelo(escenario)
             exito = True
         except Exception as e:
             resultado = {"error": str(e)}
             exito = False
             self.contador_errores += 1
+        self._medir("modelo", inicio_modelo)
 
         self.contador_procesados += 1
         return {
             "consumidor": self.id_consumidor,
             "id_escenario": escenario["id"],
+            "indice": escenario.get("indice"),
             "resultado": resultado,
             "marca_tiempo": time.time(),
             "tiempo_procesamiento": time.time() - inicio,
@@ -244,21 +1283,191 @@ class TrabajadorMonteCarlo:
             "version_modelo": self.version_modelo
         }
 
+    def _datos_estadisticas(self):
+        tiempo_activo = time.time() - self.tiempo_inicio if self.tiempo_inicio else 0
+        return {
+            "consumidor": self.id_consumidor,
+            "procesados": self.contador_procesados,
+            "errores": self.contador_errores,
+            "lotes_resultados": self.agrupador_resultados.lotes_enviados,
+            "descartados_convergencia": self.descartados_convergencia,
+            "tiempo_activo": tiempo_activo,
+            "tasa": self.contador_procesados / tiempo_activo if tiempo_activo > 0 else 0,
+            "version_modelo": self.version_modelo,
+            "prefetch": self.control_prefetch.estadisticas(),
+            "cache_modelos": self.obtenedor_modelo.estado_cache(),
+            "cambios_modelo": self.cambios_modelo,
+            "cola_consumo": self.cola_consumo,
+            "capacidad": self.anunciante_capacidad.capacidad,
+            "cambios_cola": self.cambios_cola,
+            "por_version": {version: dict(conteo) for version, conteo in self.conteo_versiones.items()},
+            "latencias": {etapa: histograma.resumen() for etapa, histograma in self.histogramas.items()},
+            "marca_tiempo": time.time()
+        }
+
+    def _registrar_metricas(self, registro):
+        etiqueta = {"consumidor": self.id_consumidor}
+        registro.metrica("escenarios_procesados_total", "counter", "Escenarios procesados", self.contador_procesados, **etiqueta)
+        registro.metrica("errores_total", "counter", "Escenarios con error en el modelo", self.contador_errores, **etiqueta)
+        registro.metrica("lotes_resultados_total", "counter", "Lotes de resultados publicados",
+                         self.agrupador_resultados.lotes_enviados, **etiqueta)
+        registro.metrica("descartados_convergencia_total", "counter", "Mensajes descartados tras la convergencia",
+                         self.descartados_convergencia, **etiqueta)
+        registro.metrica("cambios_modelo_total", "counter", "Cambios en caliente del modelo activo", self.cambios_modelo, **etiqueta)
+        registro.metrica("cambios_cola_total", "counter", "Cambios de cola de escenarios por nueva version", self.cambios_cola, **etiqueta)
+        if self.anunciante_capacidad.capacidad is not None:
+            registro.metrica("capacidad_escenarios_por_segundo", "gauge", "Capacidad medida anunciada al productor",
+                             self.anunciante_capacidad.capacidad, **etiqueta)
+        registro.familia("escenarios_por_version_total", "counter", "Escenarios por version de modelo y destino")
+        for version, conteo in list(self.conteo_versiones.items()):
+            for destino, cantidad in conteo.items():
+                registro.muestra("escenarios_por_version_total", cantidad, version=version, destino=destino, **etiqueta)
+        registro.metrica("compilaciones_modelo_total", "counter", "Modelos compilados (fallos de cache)",
+                         self.obtenedor_modelo.compilaciones, **etiqueta)
+        registro.metrica("cache_modelos_aciertos_total", "counter", "Cambios de version servidos desde la cache",
+                         self.obtenedor_modelo.aciertos_cache, **etiqueta)
+        registro.metrica("cache_modelos_versiones", "gauge", "Versiones de modelo compiladas en cache",
+                         len(self.obtenedor_modelo.cache_modelos), **etiqueta)
+        registro.metrica("prefetch", "gauge", "Ventana de prefetch actual", self.control_prefetch.actual, **etiqueta)
+        registro.metrica("reentregas_total", "counter", "Mensajes recibidos como reentrega", self.control_prefetch.reentregas, **etiqueta)
+        if self.tiempo_inicio:
+            registro.metrica("tiempo_activo_segundos", "gauge", "Segundos desde la inicializacion", time.time() - self.tiempo_inicio, **etiqueta)
+
+        registro.familia("latencia_etapa_segundos", "summary", "Latencia por etapa del camino caliente")
+        for etapa, histograma in self.histogramas.items():
+            resumen = histograma.resumen()
+            for percentil, valor in resumen["percentiles"].items():
+                registro.muestra("latencia_etapa_segundos", valor / 1e6, etapa=etapa, quantile=f"{float(percentil[1:]) / 100:g}", **etiqueta)
+            registro.muestra("latencia_etapa_segundos_sum", resumen["media"] * resumen["cantidad"] / 1e6, etapa=etapa, **etiqueta)
+            registro.muestra("latencia_etapa_segundos_count", resumen["cantidad"], etapa=etapa, **etiqueta)
+        registro.metrica("memoria_residente_bytes", "gauge", "Memoria residente del proceso", memoria_residente(), **etiqueta)
+
+    def recolectar_metricas(self):
+        registro = RegistroMetricas("montecarlo_trabajador")
+        self._registrar_metricas(registro)
+        return registro.texto()
+
     def publicar_estadisticas(self, forzar=False):
         if forzar or (time.time() - self.ultimo_tiempo_stats) >= 30:
-            tiempo_activo = time.time() - self.tiempo_inicio if self.tiempo_inicio else 0
-            self.publicador_estadisticas.publicar({
-                "consumidor": self.id_consumidor,
-                "procesados": self.contador_procesados,
-                "errores": self.contador_errores,
-                "tiempo_activo": tiempo_activo,
-                "tasa": self.contador_procesados / tiempo_activo if tiempo_activo > 0 else 0,
-                "version_modelo": self.version_modelo,
-                "marca_tiempo": time.time()
-            })
+            self.publicador_estadisticas.publicar(self._datos_estadisticas())
             self.ultimo_tiempo_stats = time.time()
 
+    def _anunciar_capacidad(self, forzar=False):
+        if not (forzar or self.anunciante_capacidad.pendiente()):
+            return
+        consumidos = {
+            version: conteo["ejecutados"] + conteo["descartados"]
+            for version, conteo in list(self.conteo_versiones.items())
+        }
+        self.anunciante_capacidad.anunciar(consumidos, self.control_prefetch.actual)
+
+    def drenar(self, datos):
+        if datos.get("version_modelo") != self.version_modelo:
+            return
+        print(f"\n[TRABAJADOR {self.id_consumidor}] Convergencia alcanzada en '{datos.get('metrica')}', drenando resultados...")
+        self.agrupador_resultados.vaciar()
+        self.publicar_estadisticas(forzar=True)
+
+    def _descartar_convergido(self, ch, metodo, props):
+        # Los escenarios de una version ya convergida se confirman sin ejecutar el modelo
+        version = (props.headers or {}).get('version-modelo')
+        if version is None or version not in self.oyente_actualizaciones.versiones_convergidas:
+            return False
+        ch.basic_ack(metodo.delivery_tag)
+        self.descartados_convergencia += 1
+        return True
+
+    def _reportar_progreso(self, procesados_previos):
+        if self.contador_procesados // 50 != procesados_previos // 50:
+            transcurrido = time.time() - self.tiempo_inicio
+            tasa = self.contador_procesados / transcurrido
+            print(f"[TRABAJADOR {self.id_consumidor}] Procesados: {self.contador_procesados} | Tasa: {tasa:.1f}/s")
+
+    def _ajustar_prefetch(self, canal):
+        nuevo = self.control_prefetch.recalcular()
+        if nuevo:
+            canal.basic_qos(prefetch_count=nuevo)
+
+    def _negociar_codificacion(self, tipo_contenido):
+        # Resultados y estadisticas se publican en la misma codificacion que eligio el productor
+        tipo = TIPO_MSGPACK if tipo_contenido == TIPO_MSGPACK and msgpack else TIPO_JSON
+        self.publicador_resultados.tipo_contenido = tipo
+        self.publicador_estadisticas.tipo_contenido = tipo
+
+    def _al_recibir(self, ch, metodo, props, cuerpo):
+        if self._descartar_convergido(ch, metodo, props):
+            return
+        self.control_prefetch.registrar_entrega(metodo.redelivered)
+        self._negociar_codificacion(props.content_type)
+        hay_actualizacion, nueva_version = self.oyente_actualizaciones.verificar_actualizacion()
+        if hay_actualizacion:
+            self.obtenedor_modelo.preparar(nueva_version)
+        if self._enrutar(ch, metodo, props, cuerpo):
+            self._procesar_entrega(ch, metodo, props, cuerpo)
+
+    def _procesar_entrega(self, ch, metodo, props, cuerpo):
+        inicio = time.perf_counter()
+        procesados_previos = self.contador_procesados
+        inicio_etapa = time.perf_counter_ns()
+        datos = decodificar_mensaje(cuerpo, props.content_type)
+        self._medir("decodificacion", inicio_etapa)
+        for resultado in self.procesar_mensaje(datos):
+            self.agrupador_resultados.agregar(resultado)
+        duracion = time.perf_counter() - inicio
+        self.control_prefetch.registrar_ack(duracion)
+        self.anunciante_capacidad.registrar(self.contador_procesados - procesados_previos, duracion)
+        self.conteo_versiones[self.version_modelo or "sin_version"]["ejecutados"] += self.contador_procesados - procesados_previos
+
+        self._reportar_progreso(procesados_previos)
+        self.publicar_estadisticas()
+        self._anunciar_capacidad()
+        self._retener_entrega(metodo.delivery_tag)
+        self._confirmar_publicados(ch)
+        self._ajustar_prefetch(ch)
+
+    def _retener_entrega(self, etiqueta):
+        # Si todo el prefetch espera resultados sin publicar el broker deja de entregar: se vacia ya
+        retenidas = self.agrupador_resultados.agregar_etiqueta(etiqueta)
+        if retenidas + self._entregas_abiertas() >= self.control_prefetch.actual:
+            self.agrupador_resultados.vaciar()
+
+    def _entregas_abiertas(self):
+        return len(self.aparcados)
+
+    def _etiqueta_abierta_minima(self):
+        # Entregas sin confirmar que no pasan por el agrupador: las aparcadas a la espera de su modelo
+        return min((metodo.delivery_tag for _, metodo, _, _, _ in self.aparcados), default=None)
+
+    def _confirmar_publicados(self, canal):
+        # Solo se confirman entregas cuyos resultados ya se publicaron; si el lote fallo, vuelven a la cola
+        publicadas, fallidas, minima_agrupador = self.agrupador_resultados.tomar_confirmables()
+        if not publicadas and not fallidas:
+            return
+        inicio_etapa = time.perf_counter_ns()
+        for etiqueta in fallidas:
+            canal.basic_nack(etiqueta, requeue=True)
+        if publicadas:
+            abiertas = [e for e in (minima_agrupador, self._etiqueta_abierta_minima()) if e is not None]
+            limite = min(abiertas) if abiertas else math.inf
+            seguras = [e for e in publicadas if e < limite]
+            # Por debajo de la menor entrega abierta todo lo pendiente esta publicado: basta un ack multiple
+            if seguras:
+                canal.basic_ack(max(seguras), multiple=len(seguras) > 1)
+            for etiqueta in publicadas:
+                if etiqueta >= limite:
+                    canal.basic_ack(etiqueta)
+        self._medir("ack", inicio_etapa)
+
+    def _bucle_consumo(self, conexion, canal):
+        while True:
+            conexion.process_data_events(time_limit=0.05)
+            self._atender_aparcados()
+            self._confirmar_publicados(canal)
+            self._actualizar_cola_consumo(canal)
+            self._anunciar_capacidad()
+
     def iniciar_consumo(self, cola_escenarios="escenarios"):
+        self.prefijo_cola = cola_escenarios
         params = pika.ConnectionParameters(
             host=self.CONFIG["host"],
             port=self.CONFIG["port"],
@@ -271,23 +1480,7 @@ class TrabajadorMonteCarlo:
             try:
                 conexion = pika.BlockingConnection(params)
                 canal = conexion.channel()
-                
-                try:
-                    canal.queue_declare(queue=cola_escenarios, passive=True)
-                except pika.exceptions.ChannelClosedByBroker:
-                    conexion.close()
-                    conexion = pika.BlockingConnection(params)
-                    canal = conexion.channel()
-                    canal.queue_declare(
-                        queue=cola_escenarios,
-                        durable=True,
-                        arguments={
-                            'x-max-length': 50000,
-                            'x-overflow': 'reject-publish',
-                            'x-message-ttl': 3600000,
-                            'x-queue-mode': 'lazy'
-                        }
-                    )
+                self._asegurar_cola_version(self.version_modelo)
                 break
             except Exception as e:
                 print(f"[TRABAJADOR {self.id_consumidor}] Intento {intento + 1} fallido: {e}")
@@ -295,41 +1488,32 @@ class TrabajadorMonteCarlo:
                     raise
                 time.sleep(2)
 
-        canal.basic_qos(prefetch_count=1)
-
-        def al_recibir(ch, metodo, props, cuerpo):
-            hay_actualizacion, _ = self.oyente_actualizaciones.verificar_actualizacion()
-            if hay_actualizacion:
-                self.recargar_modelo()
-
-            escenario = json.loads(cuerpo.decode())
-            resultado = self.procesar_escenario(escenario)
-            self.publicador_resultados.publicar(resultado)
-
-            if self.contador_procesados % 50 == 0:
-                transcurrido = time.time() - self.tiempo_inicio
-                tasa = self.contador_procesados / transcurrido
-                print(f"[TRABAJADOR {self.id_consumidor}] Procesados: {self.contador_procesados} | Tasa: {tasa:.1f}/s")
-
-            self.publicar_estadisticas()
-            ch.basic_ack(metodo.delivery_tag)
-
-        canal.basic_consume(queue=cola_escenarios, on_message_callback=al_recibir)
+        canal.basic_qos(prefetch_count=self.control_prefetch.actual)
+        self._consumir_version(canal, self.version_modelo)
 
         print(f"\n{'=' * 60}")
         print(f"[TRABAJADOR {self.id_consumidor}] CONSUMIDOR ACTIVO")
         print(f"{'=' * 60}")
-        print(f"Cola: {cola_escenarios}")
+        print(f"Cola: {self.cola_consumo}")
         print(f"Modelo: {self.version_modelo[:12]}...")
         print(f"Esperando escenarios... (Ctrl+C para detener)")
 
         try:
-            canal.start_consuming()
+            self._bucle_consumo(conexion, canal)
         except KeyboardInterrupt:
             print(f"\n[TRABAJADOR {self.id_consumidor}] Interrumpido")
         finally:
             self.oyente_actualizaciones.detener()
+            self.obtenedor_modelo.detener()
+            self.agrupador_resultados.detener()
+            try:
+                self._confirmar_publicados(canal)
+            except Exception:
+                pass
             self.publicar_estadisticas(forzar=True)
+            self._anunciar_capacidad(forzar=True)
+            if self.exportador_metricas:
+                self.exportador_metricas.detener()
             self._mostrar_resumen()
             try:
                 canal.stop_consuming()
@@ -349,13 +1533,250 @@ class TrabajadorMonteCarlo:
             print(f"  Errores: {self.contador_errores}")
 
 
+def ejecutar_proceso_trabajador(id_consumidor, indice, cola_tareas, cola_respuestas, modelos_en_cache):
+    # Proceso hijo del supervisor: arranca con un interprete limpio, sin hilos ni conexiones del padre,
+    # y recibe el codigo de cada modelo por su cola de tareas
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    trabajador = TrabajadorMonteCarlo(id_consumidor, modelos_en_cache=modelos_en_cache)
+    while True:
+        tarea = cola_tareas.get()
+        if tarea is None:
+            break
+        if tarea[0] == "modelo":
+            _, version, codigo = tarea
+            trabajador.obtenedor_modelo.modelos_anunciados[version] = {"version": version, "codigo": codigo}
+            trabajador.obtenedor_modelo.cargar_anunciado(version)
+            trabajador.version_modelo = version
+            continue
+
+        _, etiqueta, cuerpo, tipo_contenido = tarea
+        inicio = time.perf_counter()
+        errores_previos = trabajador.contador_errores
+        version_escenario, error = None, None
+        try:
+            inicio_etapa = time.perf_counter_ns()
+            datos = decodificar_mensaje(cuerpo, tipo_contenido)
+            trabajador._medir("decodificacion", inicio_etapa)
+            version_escenario = datos.get("version_modelo")
+            resultados = trabajador.procesar_mensaje(datos)
+        except Exception as e:
+            # Un mensaje que no se puede procesar no debe tumbar el proceso ni a los demas en vuelo
+            resultados, error = [], f"{type(e).__name__}: {e}"
+        cola_respuestas.put((
+            indice, etiqueta, resultados,
+            trabajador.contador_errores - errores_previos,
+            version_escenario,
+            time.perf_counter() - inicio,
+            {etapa: h.extraer() for etapa, h in trabajador.histogramas.items() if h.cantidad},
+            error
+        ))
+
+
+class SupervisorTrabajadores(TrabajadorMonteCarlo):
+    def __init__(self, id_consumidor, num_procesos, en_vuelo_por_proceso=2, caidas_maximas_mensaje=3,
+                 modelos_en_cache=4, **kwargs):
+        kwargs.setdefault("prefetch_minimo", num_procesos * en_vuelo_por_proceso)
+        super().__init__(id_consumidor, modelos_en_cache=modelos_en_cache, **kwargs)
+        self.num_procesos = num_procesos
+        self.modelos_en_cache = modelos_en_cache
+        # Nada de fork: el padre ya tiene hilos y sockets de pika cuando arranca o reinicia un hijo
+        metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.contexto = multiprocessing.get_context(metodo)
+        self.cola_respuestas = self.contexto.Queue()
+        self.procesos = {}
+        # Por proceso: etiqueta de entrega -> (cuerpo, tipo de contenido), para reintentar si el hijo cae
+        self.en_vuelo = {}
+        self.procesados_por_proceso = {}
+        self.reinicios_procesos = 0
+        self.caidas_maximas_mensaje = caidas_maximas_mensaje
+        self.caidas_por_etiqueta = {}
+        self.mensajes_descartados_caidas = 0
+        self.mensajes_fallidos = 0
+        self.codigos_en_procesos = OrderedDict()
+
+    def _iniciar_proceso(self, indice):
+        cola_tareas = self.contexto.Queue()
+        proceso = self.contexto.Process(
+            target=ejecutar_proceso_trabajador,
+            args=(self.id_consumidor, indice, cola_tareas, self.cola_respuestas, self.modelos_en_cache),
+            daemon=True
+        )
+        proceso.start()
+        # Un hijo nuevo no tiene modelos: recibe los ya repartidos antes que cualquier escenario
+        for version, codigo in self.codigos_en_procesos.items():
+            cola_tareas.put(("modelo", version, codigo))
+        self.procesos[indice] = (proceso, cola_tareas)
+        self.en_vuelo[indice] = {}
+        self.procesados_por_proceso.setdefault(indice, 0)
+
+    def _enviar_modelo_a_procesos(self):
+        # La cola de cada hijo es FIFO: el modelo llega antes que cualquier escenario de su version
+        version = self.version_modelo
+        if not version or version in self.codigos_en_procesos:
+            return
+        codigo = self.obtenedor_modelo.codigo_modelo
+        for _, cola_tareas in self.procesos.values():
+            cola_tareas.put(("modelo", version, codigo))
+        self.codigos_en_procesos[version] = codigo
+        while len(self.codigos_en_procesos) > self.modelos_en_cache:
+            self.codigos_en_procesos.popitem(last=False)
+
+    def _al_recibir(self, ch, metodo, props, cuerpo):
+        if self._descartar_convergido(ch, metodo, props):
+            return
+        self.control_prefetch.registrar_entrega(metodo.redelivered)
+        self._negociar_codificacion(props.content_type)
+        hay_actualizacion, nueva_version = self.oyente_actualizaciones.verificar_actualizacion()
+        if hay_actualizacion:
+            self.obtenedor_modelo.preparar(nueva_version)
+        if self._enrutar(ch, metodo, props, cuerpo):
+            self._procesar_entrega(ch, metodo, props, cuerpo)
+
+    def _procesar_entrega(self, ch, metodo, props, cuerpo):
+        self._enviar_modelo_a_procesos()
+        self._repartir(metodo.delivery_tag, cuerpo, props.content_type)
+
+    def _repartir(self, etiqueta, cuerpo, tipo_contenido):
+        indice = min(self.en_vuelo, key=lambda i: len(self.en_vuelo[i]))
+        self.en_vuelo[indice][etiqueta] = (cuerpo, tipo_contenido)
+        self.procesos[indice][1].put(("escenarios", etiqueta, cuerpo, tipo_contenido))
+
+    def _recoger_respuestas(self, canal):
+        while True:
+            try:
+                indice, etiqueta, resultados, errores, version_escenario, duracion, latencias, error = self.cola_respuestas.get_nowait()
+            except queue.Empty:
+                self._confirmar_publicados(canal)
+                self._ajustar_prefetch(canal)
+                return
+            if etiqueta not in self.en_vuelo.get(indice, ()):
+                continue
+            del self.en_vuelo[indice][etiqueta]
+            self.caidas_por_etiqueta.pop(etiqueta, None)
+            for etapa, datos in latencias.items():
+                self.histogramas[etapa].fusionar(datos)
+            if error:
+                # El fallo es del propio mensaje: reencolarlo solo lo haria fallar de nuevo
+                print(f"[TRABAJADOR {self.id_consumidor}] Mensaje {etiqueta} descartado por error en el proceso {indice}: {error}")
+                self.mensajes_fallidos += 1
+                self.contador_errores += 1
+                canal.basic_nack(etiqueta, requeue=False)
+                continue
+
+            procesados_previos = self.contador_procesados
+            self.contador_procesados += len(resultados)
+            self.contador_errores += errores
+            self.procesados_por_proceso[indice] += len(resultados)
+            self.conteo_versiones[version_escenario or "sin_version"]["ejecutados"] += len(resultados)
+            for resultado in resultados:
+                self.agrupador_resultados.agregar(resultado)
+            self._retener_entrega(etiqueta)
+            self.control_prefetch.registrar_ack(duracion / self.num_procesos)
+            self.anunciante_capacidad.registrar(len(resultados), duracion / self.num_procesos)
+            self._reportar_progreso(procesados_previos)
+
+    def _entregas_abiertas(self):
+        return super()._entregas_abiertas() + sum(len(tareas) for tareas in self.en_vuelo.values())
+
+    def _etiqueta_abierta_minima(self):
+        abiertas = [etiqueta for tareas in self.en_vuelo.values() for etiqueta in tareas]
+        aparcada = super()._etiqueta_abierta_minima()
+        if aparcada is not None:
+            abiertas.append(aparcada)
+        return min(abiertas, default=None)
+
+    def _vigilar_procesos(self, canal):
+        for indice, (proceso, _) in list(self.procesos.items()):
+            if proceso.is_alive():
+                continue
+            print(f"[TRABAJADOR {self.id_consumidor}] Proceso {indice} caido (codigo {proceso.exitcode}), reiniciando...")
+            tareas = self.en_vuelo[indice]
+            self.reinicios_procesos += 1
+            self._iniciar_proceso(indice)
+            # Se reintenta con la misma etiqueta; un mensaje que tumba procesos una y otra vez se descarta
+            for etiqueta, (cuerpo, tipo_contenido) in tareas.items():
+                caidas = self.caidas_por_etiqueta.get(etiqueta, 0) + 1
+                if caidas >= self.caidas_maximas_mensaje:
+                    print(f"[TRABAJADOR {self.id_consumidor}] Mensaje {etiqueta} descartado tras {caidas} caidas de proceso")
+                    self.caidas_por_etiqueta.pop(etiqueta, None)
+                    self.mensajes_descartados_caidas += 1
+                    canal.basic_nack(etiqueta, requeue=False)
+                else:
+                    self.caidas_por_etiqueta[etiqueta] = caidas
+                    self._repartir(etiqueta, cuerpo, tipo_contenido)
+
+    def _detener_procesos(self):
+        for proceso, cola_tareas in self.procesos.values():
+            if proceso.is_alive():
+                cola_tareas.put(None)
+        for proceso, _ in self.procesos.values():
+            proceso.join(timeout=5)
+            if proceso.is_alive():
+                proceso.terminate()
+
+    def _bucle_consumo(self, conexion, canal):
+        for indice in range(self.num_procesos):
+            self._iniciar_proceso(indice)
+        print(f"[TRABAJADOR {self.id_consumidor}] {self.num_procesos} procesos trabajadores iniciados")
+
+        try:
+            while True:
+                conexion.process_data_events(time_limit=0.05)
+                self._atender_aparcados()
+                self._actualizar_cola_consumo(canal)
+                self._recoger_respuestas(canal)
+                self._vigilar_procesos(canal)
+                self._anunciar_capacidad()
+                self.publicar_estadisticas()
+        finally:
+            self._detener_procesos()
+
+    def _registrar_metricas(self, registro):
+        super()._registrar_metricas(registro)
+        etiqueta = {"consumidor": self.id_consumidor}
+        registro.metrica("procesos", "gauge", "Procesos trabajadores vivos",
+                         sum(proceso.is_alive() for proceso, _ in self.procesos.values()), **etiqueta)
+        registro.metrica("reinicios_procesos_total", "counter", "Procesos trabajadores reiniciados", self.reinicios_procesos, **etiqueta)
+        registro.metrica("mensajes_en_vuelo", "gauge", "Mensajes repartidos a procesos sin confirmar",
+                         sum(len(tareas) for tareas in self.en_vuelo.values()), **etiqueta)
+        registro.metrica("mensajes_fallidos_total", "counter", "Mensajes que fallaron al procesarse en un proceso hijo",
+                         self.mensajes_fallidos, **etiqueta)
+        registro.metrica("mensajes_descartados_caidas_total", "counter", "Mensajes descartados por tumbar procesos repetidamente",
+                         self.mensajes_descartados_caidas, **etiqueta)
+
+    def _datos_estadisticas(self):
+        datos = super()._datos_estadisticas()
+        datos.update({
+            "procesos": self.num_procesos,
+            "reinicios_procesos": self.reinicios_procesos,
+            "mensajes_fallidos": self.mensajes_fallidos,
+            "mensajes_descartados_caidas": self.mensajes_descartados_caidas,
+            "procesados_por_proceso": {
+                f"{self.id_consumidor}-{indice}": procesados
+                for indice, procesados in self.procesados_por_proceso.items()
+            }
+        })
+        return datos
+
+
 def main():
-    id_consumidor = sys.argv[1] if len(sys.argv) > 1 else f"trabajador-{int(time.time())}"
-    
-    trabajador = TrabajadorMonteCarlo(id_consumidor)
+    parser = argparse.ArgumentParser(description="Consumidor de escenarios Monte Carlo")
+    parser.add_argument("id_consumidor", nargs="?", default=f"trabajador-{int(time.time())}")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos trabajadores a ejecutar bajo un supervisor")
+    parser.add_argument("--puerto-metricas", type=int, default=9102, help="Puerto del endpoint /metrics (0 lo desactiva)")
+    parser.add_argument("--modelos-en-cache", type=int, default=4, help="Versiones de modelo compiladas que se mantienen")
+    argumentos = parser.parse_args()
+    id_consumidor = argumentos.id_consumidor
+    opciones = {"puerto_metricas": argumentos.puerto_metricas, "modelos_en_cache": argumentos.modelos_en_cache}
+
+    if argumentos.workers > 1:
+        trabajador = SupervisorTrabajadores(id_consumidor, argumentos.workers, **opciones)
+    else:
+        trabajador = TrabajadorMonteCarlo(id_consumidor, **opciones)
     
     print(f"\nCONSUMIDOR INICIADO")
     print(f"ID: {id_consumidor}")
+    print(f"Procesos: {argumentos.workers}")
     
     if trabajador.inicializar():
         trabajador.iniciar_consumo()
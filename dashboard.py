@@ -1,18 +1,539 @@
 # dashboard.py
 import eventlet
 eventlet.monkey_patch()
+from eventlet import tpool
 
-from flask import Flask, render_template_string
+from flask import Flask, Response, render_template_string, request
 from flask_socketio import SocketIO
 import threading
+import os
+import re
 import json
 import time
+import copy
+import math
+import random
+import hashlib
 import pika
+import argparse
+import numpy as np
 from collections import defaultdict, deque
+from estadisticas import AcumuladorNumerico
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class CodificadorNumpy(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (np.integer, np.int32, np.int64)):
+            return int(obj)
+        elif isinstance(obj, (np.floating, np.float32, np.float64)):
+            return float(obj)
+        elif isinstance(obj, np.ndarray):
+            return obj.tolist()
+        return super().default(obj)
+
+
+TIPO_JSON = "application/json"
+TIPO_MSGPACK = "application/x-msgpack"
+
+
+def _empaquetar_numpy(obj):
+    if isinstance(obj, np.ndarray):
+        arreglo = np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder('<'))
+        return {"__ndarray__": True, "dtype": arreglo.dtype.str, "forma": list(arreglo.shape), "datos": arreglo.tobytes()}
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj)}")
+
+
+def _desempaquetar_numpy(obj):
+    if obj.get("__ndarray__"):
+        return np.frombuffer(obj["datos"], dtype=np.dtype(obj["dtype"])).reshape(obj["forma"])
+    return obj
+
+
+def codificar_mensaje(datos, tipo_contenido=TIPO_JSON):
+    if tipo_contenido == TIPO_MSGPACK:
+        return msgpack.packb(datos, default=_empaquetar_numpy, use_bin_type=True)
+    return json.dumps(datos, cls=CodificadorNumpy).encode()
+
+
+def decodificar_mensaje(cuerpo, tipo_contenido=None):
+    if tipo_contenido == TIPO_MSGPACK:
+        if not msgpack:
+            raise ValueError("Mensaje msgpack recibido pero 'msgpack' no esta instalado")
+        return msgpack.unpackb(cuerpo, object_hook=_desempaquetar_numpy, raw=False)
+    return json.loads(cuerpo)
+
+
+def extraer_metrica_salida(texto_modelo):
+    coincidencia = re.search(r'^OUTPUT\s*=\s*["\'](\w+)["\']', texto_modelo or "", re.MULTILINE)
+    return coincidencia.group(1) if coincidencia else None
+
+
+def memoria_residente():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None
+
+
+class RegistroMetricas:
+    # Formato de exposicion de texto de Prometheus (compatible con OpenMetrics al hacer scrape)
+    def __init__(self, prefijo):
+        self.prefijo = prefijo
+        self.lineas = []
+
+    @staticmethod
+    def _valor(valor):
+        valor = float(valor)
+        if math.isnan(valor):
+            return "NaN"
+        if math.isinf(valor):
+            return "+Inf" if valor > 0 else "-Inf"
+        return repr(int(valor)) if valor.is_integer() and abs(valor) < 2 ** 53 else repr(valor)
+
+    @staticmethod
+    def _etiquetas(etiquetas):
+        if not etiquetas:
+            return ""
+        pares = []
+        for clave, valor in etiquetas.items():
+            valor = str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+            pares.append(f'{clave}="{valor}"')
+        return "{" + ",".join(pares) + "}"
+
+    def familia(self, nombre, tipo, ayuda):
+        self.lineas.append(f"# HELP {self.prefijo}_{nombre} {ayuda}")
+        self.lineas.append(f"# TYPE {self.prefijo}_{nombre} {tipo}")
+
+    def muestra(self, nombre, valor, **etiquetas):
+        if valor is not None:
+            self.lineas.append(f"{self.prefijo}_{nombre}{self._etiquetas(etiquetas)} {self._valor(valor)}")
+
+    def metrica(self, nombre, tipo, ayuda, valor, **etiquetas):
+        self.familia(nombre, tipo, ayuda)
+        self.muestra(nombre, valor, **etiquetas)
+
+    def histograma(self, nombre, ayuda, limites, conteos, suma, **etiquetas):
+        self.familia(nombre, "histogram", ayuda)
+        acumulado = 0
+        for limite, conteo in zip(limites, conteos):
+            acumulado += conteo
+            self.muestra(nombre + "_bucket", acumulado, le=self._valor(limite), **etiquetas)
+        self.muestra(nombre + "_bucket", sum(conteos), le="+Inf", **etiquetas)
+        self.muestra(nombre + "_sum", suma, **etiquetas)
+        self.muestra(nombre + "_count", sum(conteos), **etiquetas)
+
+    def texto(self):
+        return "\n".join(self.lineas) + "\n"
+
+
+class PoolConexionesRabbit:
+    _pools = {}
+    _candado_pools = threading.Lock()
+
+    def __init__(self, parametros):
+        self.parametros = parametros
+        self._local = threading.local()
+        self._candado = threading.Lock()
+        self.reconexiones = 0
+        self.cerradas_hilo_terminado = 0
+        # Conexion abierta por cada hilo: la de un hilo que ya termino no la usa ni la cierra nadie
+        self._por_hilo = {}
+
+    @classmethod
+    def compartido(cls, parametros):
+        clave = (parametros.host, parametros.port, parametros.credentials.username)
+        with cls._candado_pools:
+            if clave not in cls._pools:
+                cls._pools[clave] = cls(parametros)
+            return cls._pools[clave]
+
+    def _conexion_sana(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None or not conexion.is_open:
+            return False
+        # Un hilo ocioso no atiende los heartbeats: pasado el intervalo el broker ya cerro su conexion
+        latido = getattr(self.parametros, "heartbeat", None)
+        if isinstance(latido, (int, float)) and latido and time.monotonic() - getattr(self._local, "ultimo_uso", 0) > latido:
+            return False
+        try:
+            conexion.process_data_events(time_limit=0)
+            return True
+        except pika.exceptions.AMQPError:
+            return False
+
+    def _reconectar(self):
+        self.invalidar()
+        self._cerrar_hilos_terminados()
+        self._local.conexion = pika.BlockingConnection(self.parametros)
+        self._local.canal = self._local.conexion.channel()
+        with self._candado:
+            self.reconexiones += 1
+            self._por_hilo[threading.current_thread()] = self._local.conexion
+
+    def _cerrar_hilos_terminados(self):
+        # Se barre al abrir otra conexion: el hilo propietario ya no existe, asi que no hay uso concurrente
+        with self._candado:
+            terminados = [hilo for hilo in self._por_hilo if not hilo.is_alive()]
+            conexiones = [self._por_hilo.pop(hilo) for hilo in terminados]
+            self.cerradas_hilo_terminado += len(conexiones)
+        for conexion in conexiones:
+            try:
+                if conexion.is_open:
+                    conexion.close()
+            except Exception:
+                pass
+
+    def obtener_canal(self):
+        # pika no es thread-safe: cada hilo mantiene su propia conexion persistente
+        if not self._conexion_sana():
+            self._reconectar()
+        if self._local.canal is None or not self._local.canal.is_open:
+            self._local.canal = self._local.conexion.channel()
+        self._local.ultimo_uso = time.monotonic()
+        return self._local.canal
+
+    def invalidar(self):
+        conexion = getattr(self._local, "conexion", None)
+        self._local.conexion = None
+        self._local.canal = None
+        if conexion is not None:
+            with self._candado:
+                self._por_hilo.pop(threading.current_thread(), None)
+        if conexion and conexion.is_open:
+            try:
+                conexion.close()
+            except Exception:
+                pass
+
+    def ejecutar(self, operacion, reintentos=1):
+        for intento in range(reintentos + 1):
+            try:
+                return operacion(self.obtener_canal())
+            except pika.exceptions.AMQPConnectionError:
+                # Incluye StreamLostError y AMQPHeartbeatTimeout: socket perdido, se reconstruye la conexion
+                self.invalidar()
+                if intento == reintentos:
+                    raise
+            except pika.exceptions.AMQPChannelError:
+                self._local.canal = None
+                raise
+
+
+class MapaBitsIndices:
+    # Los indices siguen la numeracion global del productor: el mapa arranca en el primero visto
+    # (alineado a byte) en lugar de reservar los bits de todas las versiones anteriores.
+    # 2**24 indices son 2 MB por version; fuera de esa amplitud el deduplicador usa el filtro Bloom
+    def __init__(self, amplitud_maxima=2 ** 24):
+        self.base = None
+        self.bits = bytearray()
+        self.amplitud_maxima = amplitud_maxima
+
+    def admite(self, indice):
+        if self.base is None or self.amplitud_maxima is None:
+            return True
+        inicio = min(self.base, indice - indice % 8)
+        fin = max(self.base + len(self.bits) * 8, indice + 1)
+        return fin - inicio <= self.amplitud_maxima
+
+    def _cubrir(self, minimo, maximo):
+        if self.base is None:
+            self.base = minimo - minimo % 8
+        if minimo < self.base:
+            # Resultado anterior al primero recibido: se amplia por delante, al menos al doble
+            necesarios = (self.base - (minimo - minimo % 8)) // 8
+            agregados = min(max(necesarios, len(self.bits)), self.base // 8)
+            self.bits[:0] = bytes(agregados)
+            self.base -= agregados * 8
+        byte = (maximo - self.base) // 8
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(max(byte + 1 - len(self.bits), len(self.bits))))
+
+    def probar_y_marcar(self, indice):
+        self._cubrir(indice, indice)
+        byte, bit = divmod(indice - self.base, 8)
+        mascara = 1 << bit
+        visto = bool(self.bits[byte] & mascara)
+        self.bits[byte] |= mascara
+        return visto
+
+    def probar_y_marcar_lote(self, indices):
+        # Version vectorizada: True en la primera aparicion de cada indice no marcado antes
+        indices = np.asarray(indices, dtype=np.int64)
+        nuevos = np.zeros(indices.size, dtype=bool)
+        if indices.size == 0:
+            return nuevos
+        unicos, primeras = np.unique(indices, return_index=True)
+        self._cubrir(int(unicos[0]), int(unicos[-1]))
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        relativos = unicos - self.base
+        posiciones = relativos >> 3
+        mascaras = (1 << (relativos & 7)).astype(np.uint8)
+        nuevos[primeras] = (bits[posiciones] & mascaras) == 0
+        np.bitwise_or.at(bits, posiciones, mascaras)
+        return nuevos
+
+    def memoria_bytes(self):
+        return len(self.bits)
+
+
+class FiltroBloomRotativo:
+    def __init__(self, capacidad=1000000, tasa_falsos_positivos=0.001):
+        self.capacidad = capacidad
+        self.num_bits = math.ceil(-capacidad * math.log(tasa_falsos_positivos) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacidad * math.log(2)))
+        self.actual = bytearray(self.num_bits // 8 + 1)
+        self.anterior = bytearray(self.num_bits // 8 + 1)
+        self.insertados_actual = 0
+        self.insertados_anterior = 0
+
+    def _posiciones(self, clave):
+        resumen = hashlib.blake2b(clave.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(resumen[:8], "little")
+        h2 = int.from_bytes(resumen[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    @staticmethod
+    def _contiene(filtro, posiciones):
+        return all(filtro[p >> 3] & (1 << (p & 7)) for p in posiciones)
+
+    def probar_y_marcar(self, clave):
+        posiciones = self._posiciones(clave)
+        visto = self._contiene(self.actual, posiciones) or self._contiene(self.anterior, posiciones)
+        if not visto:
+            for p in posiciones:
+                self.actual[p >> 3] |= 1 << (p & 7)
+            self.insertados_actual += 1
+            if self.insertados_actual >= self.capacidad:
+                # Se conserva la generacion anterior: recuerda entre 'capacidad' y 2x ids
+                self.anterior, self.actual = self.actual, bytearray(len(self.actual))
+                self.insertados_anterior, self.insertados_actual = self.insertados_actual, 0
+        return visto
+
+    def _tasa_filtro(self, insertados):
+        return (1 - math.exp(-self.num_hashes * insertados / self.num_bits)) ** self.num_hashes
+
+    def tasa_falsos_positivos_estimada(self):
+        return 1 - (1 - self._tasa_filtro(self.insertados_actual)) * (1 - self._tasa_filtro(self.insertados_anterior))
+
+    def memoria_bytes(self):
+        return len(self.actual) + len(self.anterior)
+
+
+class DeduplicadorEscenarios:
+    def __init__(self, capacidad_bloom=1000000, tasa_falsos_positivos=0.001, amplitud_maxima=2 ** 24):
+        self.mapas_indices = {}
+        self.bloom = FiltroBloomRotativo(capacidad_bloom, tasa_falsos_positivos)
+        self.amplitud_maxima = amplitud_maxima
+        self.comprobados = 0
+        self.comprobados_bloom = 0
+        self.duplicados = 0
+
+    def es_duplicado(self, datos_resultado):
+        indice = datos_resultado.get("indice")
+        id_escenario = datos_resultado.get("id_escenario")
+        version = datos_resultado.get("version_modelo")
+        mapa = self.mapas_indices.get(version)
+        if isinstance(indice, int) and indice >= 0 and (mapa is None or mapa.admite(indice)):
+            if mapa is None:
+                mapa = self.mapas_indices[version] = MapaBitsIndices(self.amplitud_maxima)
+            visto = mapa.probar_y_marcar(indice)
+        elif id_escenario:
+            visto = self.bloom.probar_y_marcar(id_escenario)
+            self.comprobados_bloom += 1
+        else:
+            return False
+        self.comprobados += 1
+        if visto:
+            self.duplicados += 1
+        return visto
+
+    def estado(self):
+        tasa_observada = self.duplicados / self.comprobados if self.comprobados else 0
+        tasa_fp = self.bloom.tasa_falsos_positivos_estimada()
+        fraccion_bloom = self.comprobados_bloom / self.comprobados if self.comprobados else 0
+        return {
+            "memoria_bytes": self.bloom.memoria_bytes() + sum(m.memoria_bytes() for m in self.mapas_indices.values()),
+            "comprobados": self.comprobados,
+            "duplicados": self.duplicados,
+            "tasa_duplicados_observada": tasa_observada,
+            "tasa_falsos_positivos_estimada": tasa_fp,
+            "tasa_duplicados_estimada": max(0.0, tasa_observada - tasa_fp * fraccion_bloom)
+        }
+
+
+class SerieTemporalMetricas:
+    RESOLUCIONES = ((1, 3600), (10, 2160), (60, 1440))
+
+    def __init__(self, resoluciones=RESOLUCIONES, max_puntos=600):
+        self.resoluciones = [resolucion for resolucion, _ in resoluciones]
+        self.cerradas = [deque(maxlen=retencion) for _, retencion in resoluciones]
+        self.abiertas = [None] * len(resoluciones)
+        self.pendientes = []
+        self.max_puntos = max_puntos
+        self.candado = threading.Lock()
+
+    def _cubeta_nueva(self, nivel, marca_tiempo):
+        resolucion = self.resoluciones[nivel]
+        return {"inicio": math.floor(marca_tiempo / resolucion) * resolucion, "metricas": {}}
+
+    def _acumular(self, cubeta, nombre, cantidad, minimo, maximo, suma):
+        actual = cubeta["metricas"].get(nombre)
+        if actual is None:
+            cubeta["metricas"][nombre] = [cantidad, minimo, maximo, suma]
+        else:
+            actual[0] += cantidad
+            actual[1] = min(actual[1], minimo)
+            actual[2] = max(actual[2], maximo)
+            actual[3] += suma
+
+    def _cerrar(self, nivel):
+        # Al cerrar una cubeta se pliega en la resolucion superior
+        cubeta = self.abiertas[nivel]
+        self.abiertas[nivel] = None
+        self.cerradas[nivel].append(cubeta)
+        self.pendientes.append((self.resoluciones[nivel], cubeta))
+        if nivel + 1 < len(self.resoluciones):
+            superior = self.abiertas[nivel + 1]
+            inicio = math.floor(cubeta["inicio"] / self.resoluciones[nivel + 1]) * self.resoluciones[nivel + 1]
+            if superior is not None and superior["inicio"] != inicio:
+                self._cerrar(nivel + 1)
+                superior = None
+            if superior is None:
+                superior = self.abiertas[nivel + 1] = self._cubeta_nueva(nivel + 1, cubeta["inicio"])
+            for nombre, valores in cubeta["metricas"].items():
+                self._acumular(superior, nombre, *valores)
+
+    def agregar(self, marca_tiempo, valores):
+        if not valores:
+            return
+        with self.candado:
+            abierta = self.abiertas[0]
+            if abierta is not None and marca_tiempo >= abierta["inicio"] + self.resoluciones[0]:
+                self._cerrar(0)
+                abierta = None
+            if abierta is None:
+                abierta = self.abiertas[0] = self._cubeta_nueva(0, marca_tiempo)
+            for nombre, valor in valores.items():
+                self._acumular(abierta, nombre, 1, valor, valor, valor)
+
+    def cerrar_vencidas(self, ahora):
+        with self.candado:
+            for nivel, resolucion in enumerate(self.resoluciones):
+                abierta = self.abiertas[nivel]
+                if abierta is not None and ahora >= abierta["inicio"] + resolucion:
+                    self._cerrar(nivel)
+            pendientes, self.pendientes = self.pendientes, []
+        nuevas = defaultdict(list)
+        for resolucion, cubeta in pendientes:
+            nuevas[resolucion].append(self._formatear(cubeta))
+        return dict(nuevas)
+
+    def _formatear(self, cubeta):
+        return {
+            "t": cubeta["inicio"],
+            "metricas": {
+                nombre: {"n": cantidad, "min": minimo, "max": maximo, "media": suma / cantidad}
+                for nombre, (cantidad, minimo, maximo, suma) in cubeta["metricas"].items()
+            }
+        }
+
+    def elegir_resolucion(self, desde, hasta):
+        for resolucion, cerradas in zip(self.resoluciones, self.cerradas):
+            cubre_rango = len(cerradas) < cerradas.maxlen or cerradas[0]["inicio"] <= desde
+            if (hasta - desde) / resolucion <= self.max_puntos and cubre_rango:
+                return resolucion
+        return self.resoluciones[-1]
+
+    def consultar(self, desde, hasta, resolucion=None):
+        if resolucion not in self.resoluciones:
+            resolucion = self.elegir_resolucion(desde, hasta)
+        with self.candado:
+            cerradas = list(self.cerradas[self.resoluciones.index(resolucion)])
+        return {
+            "resolucion": resolucion,
+            "cubetas": [self._formatear(c) for c in cerradas if desde <= c["inicio"] <= hasta]
+        }
+
+
+class RastreadorConvergencia:
+    def __init__(self, semiancho_objetivo=None, semiancho_relativo=0.01, muestras_minimas=1000, z=1.96):
+        self.semiancho_objetivo = semiancho_objetivo
+        self.semiancho_relativo = semiancho_relativo
+        self.muestras_minimas = muestras_minimas
+        self.z = z
+        self.version_modelo = None
+        self.metrica_salida = None
+        self.convergido = False
+        self.marca_convergencia = None
+
+    def configurar(self, version_modelo=None, metrica_salida=None):
+        if version_modelo and version_modelo != self.version_modelo:
+            self.version_modelo = version_modelo
+            self.metrica_salida = None
+            self.convergido = False
+            self.marca_convergencia = None
+        if metrica_salida:
+            self.metrica_salida = metrica_salida
+
+    def _objetivo(self, media):
+        if self.semiancho_objetivo is not None:
+            return self.semiancho_objetivo
+        return self.semiancho_relativo * abs(media)
+
+    def estado(self, acumuladores):
+        estado = {
+            "metrica": self.metrica_salida,
+            "version_modelo": self.version_modelo,
+            "muestras_minimas": self.muestras_minimas,
+            "convergido": self.convergido,
+            "marca_convergencia": self.marca_convergencia,
+            "n": 0
+        }
+        acumulador = acumuladores.get(self.metrica_salida)
+        if acumulador is None or acumulador.cantidad == 0:
+            return estado
+        estado.update({
+            "n": acumulador.cantidad,
+            "media": acumulador.media,
+            "semiancho": self.z * acumulador.error_estandar(),
+            "objetivo": self._objetivo(acumulador.media)
+        })
+        return estado
+
+    def evaluar(self, acumuladores):
+        if self.convergido or self.version_modelo is None:
+            return None
+        estado = self.estado(acumuladores)
+        if estado["n"] < self.muestras_minimas or estado["semiancho"] > estado["objetivo"]:
+            return None
+        self.convergido = True
+        self.marca_convergencia = time.time()
+        estado.update(convergido=True, marca_convergencia=self.marca_convergencia)
+        return estado
 
 
 class MetricasDashboard:
-    def __init__(self):
+    def __init__(self, capacidad_deduplicacion=1000000, tasa_falsos_positivos=0.001, convergencia=None,
+                 amplitud_indices=2 ** 24):
+        self.capacidad_deduplicacion = capacidad_deduplicacion
+        self.tasa_falsos_positivos = tasa_falsos_positivos
+        self.amplitud_indices = amplitud_indices
+        self.convergencia = convergencia or RastreadorConvergencia()
         self._inicializar_estado()
 
     def _inicializar_estado(self):
@@ -20,13 +541,15 @@ class MetricasDashboard:
         self.total_errores = 0
         self.consumidores_activos = set()
         self.estadisticas_consumidor = {}
-        self.ids_procesados = set()
+        self.deduplicador = DeduplicadorEscenarios(self.capacidad_deduplicacion, self.tasa_falsos_positivos,
+                                                   self.amplitud_indices)
         self.carga_trabajo_consumidor = defaultdict(int)
         self.errores_consumidor = defaultdict(int)
         self.historial_resultados = deque(maxlen=1000)
         self.metricas_descubiertas = set()
         self.tipos_metricas = {}
-        self.agregados_numericos = defaultdict(list)
+        self.acumuladores = defaultdict(AcumuladorNumerico)
+        self.serie = SerieTemporalMetricas()
         self.tiempo_inicio = None
         self.ultimo_tiempo_resultado = None
         self.esta_terminado = False
@@ -58,15 +581,17 @@ class MetricasDashboard:
     def _descubrir_y_procesar_resultado(self, resultado):
         if not isinstance(resultado, dict):
             return
+        numericos = {}
         for clave, valor in resultado.items():
             self.metricas_descubiertas.add(clave)
             if isinstance(valor, (int, float)):
                 self.tipos_metricas[clave] = 'numerica'
-                self.agregados_numericos[clave].append(float(valor))
+                numericos[clave] = float(valor)
+                self.acumuladores[clave].agregar(numericos[clave])
+        self.serie.agregar(self.ultimo_tiempo_resultado, numericos)
 
     def actualizar_resultado(self, datos_resultado):
-        id_escenario = datos_resultado.get("id_escenario")
-        if id_escenario and id_escenario in self.ids_procesados:
+        if self.deduplicador.es_duplicado(datos_resultado):
             return False
 
         if self.tiempo_inicio is None:
@@ -75,9 +600,6 @@ class MetricasDashboard:
         self.ultimo_tiempo_resultado = time.time()
         self.esta_terminado = False
 
-        if id_escenario:
-            self.ids_procesados.add(id_escenario)
-
         self.total_procesados += 1
         consumidor = datos_resultado.get("consumidor")
         
@@ -99,6 +621,37 @@ class MetricasDashboard:
         })
         return True
 
+    def agregar_columnas(self, columnas):
+        exito = np.asarray(columnas["exito"], dtype=bool)
+        filas = exito.size
+        if filas == 0:
+            return
+        marcas = columnas["marca_tiempo"]
+        self.tiempo_inicio = min(self.tiempo_inicio or math.inf, float(marcas.min()))
+        self.ultimo_tiempo_resultado = max(self.ultimo_tiempo_resultado or 0.0, float(marcas.max()))
+        self.total_procesados += filas
+        self.total_errores += filas - int(np.count_nonzero(exito))
+
+        # Los resultados llegan en lotes por consumidor: se agregan tramos contiguos, no filas
+        consumidores = columnas["consumidor"]
+        inicios = np.concatenate(([0], np.flatnonzero(consumidores[1:] != consumidores[:-1]) + 1))
+        cargas = np.diff(np.append(inicios, filas))
+        errores = np.add.reduceat(~exito, inicios, dtype=np.int64)
+        for consumidor, carga, fallos in zip(consumidores[inicios].tolist(), cargas.tolist(), errores.tolist()):
+            nombre = consumidor.decode()
+            if not nombre:
+                continue
+            self.consumidores_activos.add(nombre)
+            self.carga_trabajo_consumidor[nombre] += carga
+            self.errores_consumidor[nombre] += fallos
+
+        for columna, valores in columnas.items():
+            if columna.startswith("resultado."):
+                nombre = columna[len("resultado."):]
+                self.metricas_descubiertas.add(nombre)
+                self.tipos_metricas[nombre] = 'numerica'
+                self.acumuladores[nombre].agregar_lote(valores)
+
     def actualizar_estadisticas(self, datos_estadisticas):
         consumidor = datos_estadisticas.get("consumidor")
         if consumidor:
@@ -127,6 +680,25 @@ class MetricasDashboard:
             }
         return rendimiento
 
+    def registrar_metricas(self, registro):
+        registro.metrica("resultados_procesados_total", "counter", "Resultados agregados", self.total_procesados)
+        registro.metrica("resultados_errores_total", "counter", "Resultados con error", self.total_errores)
+        registro.metrica("consumidores_activos", "gauge", "Consumidores que han enviado estadisticas", len(self.consumidores_activos))
+        deduplicacion = self.deduplicador.estado()
+        registro.metrica("duplicados_total", "counter", "Resultados descartados por duplicados", deduplicacion["duplicados"])
+        registro.metrica("deduplicacion_memoria_bytes", "gauge", "Memoria del deduplicador", deduplicacion["memoria_bytes"])
+        registro.metrica("cola_modelo_mensajes", "gauge", "Mensajes en cola_modelo en la ultima verificacion",
+                         self.info_modelo["cantidad_mensajes"])
+        registro.metrica("terminado", "gauge", "1 si no llegan resultados desde hace un tiempo", int(self.esta_terminado))
+
+        # Reexporta lo ultimo que cada trabajador envio en 'estadisticas', sin consultar a nadie
+        registro.familia("consumidor_procesados", "gauge", "Escenarios procesados segun el ultimo reporte del consumidor")
+        for consumidor, datos in self.estadisticas_consumidor.items():
+            registro.muestra("consumidor_procesados", datos.get("procesados", 0), consumidor=consumidor)
+        registro.familia("consumidor_tasa", "gauge", "Escenarios por segundo segun el ultimo reporte del consumidor")
+        for consumidor, datos in self.estadisticas_consumidor.items():
+            registro.muestra("consumidor_tasa", datos.get("tasa", 0), consumidor=consumidor)
+
     def obtener_resumen(self):
         return {
             "total_procesados": self.total_procesados,
@@ -137,25 +709,202 @@ class MetricasDashboard:
             "carga_trabajo_consumidor": dict(self.carga_trabajo_consumidor),
             "metricas_descubiertas": list(self.metricas_descubiertas),
             "tipos_metricas": self.tipos_metricas,
+            "estadisticas_metricas": {clave: acumulador.resumen() for clave, acumulador in self.acumuladores.items()},
+            "deduplicacion": self.deduplicador.estado(),
+            "convergencia": self.convergencia.estado(self.acumuladores),
             "esta_terminado": self.esta_terminado,
             "info_modelo": self.info_modelo
         }
 
 
+class RepeticionEjecuciones:
+    def __init__(self, directorio_base="resultados_persistidos", filas_por_bloque=5000000):
+        self.directorio_base = directorio_base
+        self.filas_por_bloque = filas_por_bloque
+
+    def _leer_manifiesto(self, directorio_version):
+        with open(os.path.join(directorio_version, "manifiesto.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def listar(self):
+        ejecuciones = []
+        if not os.path.isdir(self.directorio_base):
+            return ejecuciones
+        for nombre in sorted(os.listdir(self.directorio_base)):
+            directorio_version = os.path.join(self.directorio_base, nombre)
+            if not os.path.exists(os.path.join(directorio_version, "manifiesto.json")):
+                continue
+            manifiesto = self._leer_manifiesto(directorio_version)
+            partes = manifiesto["partes"]
+            ejecuciones.append({
+                "version": manifiesto.get("version_modelo") or nombre,
+                "directorio": nombre,
+                "filas": manifiesto["filas"],
+                "partes": len(partes),
+                "marca_tiempo_minima": min((p["marca_tiempo_minima"] for p in partes), default=None),
+                "marca_tiempo_maxima": max((p["marca_tiempo_maxima"] for p in partes), default=None)
+            })
+        return ejecuciones
+
+    def cargar(self, version, metricas):
+        directorio_version = os.path.join(self.directorio_base, re.sub(r'[^\w.-]', '_', version))
+        if not os.path.exists(os.path.join(directorio_version, "manifiesto.json")):
+            raise FileNotFoundError(f"No hay resultados persistidos para la version {version}")
+        inicio = time.time()
+        manifiesto = self._leer_manifiesto(directorio_version)
+        metricas.reiniciar_metricas()
+        # Reentregas y reintentos del productor dejan filas repetidas en disco: como en vivo, cuenta la primera
+        mapa = MapaBitsIndices(amplitud_maxima=None)
+        duplicados = 0
+        for parte in manifiesto["partes"]:
+            directorio_parte = os.path.join(directorio_version, parte["directorio"])
+            columnas = {
+                nombre: np.load(os.path.join(directorio_parte, archivo), mmap_mode='r')
+                for nombre, archivo in parte["columnas"].items()
+            }
+            for desde in range(0, parte["filas"], self.filas_por_bloque):
+                bloque = {nombre: c[desde:desde + self.filas_por_bloque] for nombre, c in columnas.items()}
+                if "indice" in bloque:
+                    indices = np.asarray(bloque["indice"])
+                    conservar = indices < 0
+                    conservar[~conservar] = mapa.probar_y_marcar_lote(indices[~conservar])
+                    repetidas = conservar.size - int(np.count_nonzero(conservar))
+                    if repetidas:
+                        duplicados += repetidas
+                        bloque = {nombre: c[conservar] for nombre, c in bloque.items()}
+                    metricas.deduplicador.comprobados += int(np.count_nonzero(indices >= 0))
+                    metricas.deduplicador.duplicados += repetidas
+                metricas.agregar_columnas(bloque)
+        metricas.esta_terminado = True
+        metricas.actualizar_info_modelo("Repeticion", 0, version[:8] + "...", directorio_version)
+        metricas.convergencia.configurar(version)
+        print(f"[DASHBOARD] Repeticion de {version[:12]}... cargada: {manifiesto['filas']} filas "
+              f"({duplicados} duplicadas descartadas) en {time.time() - inicio:.2f}s")
+        return metricas
+
+
+class PlanificadorEmisiones:
+    def __init__(self, socketio, metricas, frecuencia_maxima=4, muestras_por_trama=20):
+        self.socketio = socketio
+        self.metricas = metricas
+        self.intervalo = 1.0 / frecuencia_maxima
+        self.muestras_por_trama = muestras_por_trama
+        self.candado = threading.Lock()
+        self.hay_cambios = False
+        self.muestras = []
+        self.recibidos_desde_trama = 0
+        self.ultimo_resumen = {}
+        self.terminado_emitido = False
+        self.ejecutando = True
+        self.tramas_resumen = 0
+        self.tramas_resultados = 0
+        self.tramas_series = 0
+        self.resultados_recibidos = 0
+        self.resultados_emitidos = 0
+
+    def marcar_cambio(self):
+        self.hay_cambios = True
+
+    def agregar_resultado(self, datos):
+        # Muestreo por reservorio: cada trama lleva una muestra uniforme de lo recibido
+        with self.candado:
+            self.recibidos_desde_trama += 1
+            self.resultados_recibidos += 1
+            if len(self.muestras) < self.muestras_por_trama:
+                self.muestras.append(datos)
+            else:
+                posicion = random.randrange(self.recibidos_desde_trama)
+                if posicion < self.muestras_por_trama:
+                    self.muestras[posicion] = datos
+        self.hay_cambios = True
+
+    def reiniciar(self):
+        with self.candado:
+            self.muestras = []
+            self.recibidos_desde_trama = 0
+            self.ultimo_resumen = {}
+            self.terminado_emitido = False
+
+    def _calcular_delta(self, resumen):
+        delta = {clave: valor for clave, valor in resumen.items() if self.ultimo_resumen.get(clave) != valor}
+        self.ultimo_resumen = copy.deepcopy(resumen)
+        return delta
+
+    def emitir_pendientes(self):
+        with self.candado:
+            muestras, self.muestras = self.muestras, []
+            recibidos, self.recibidos_desde_trama = self.recibidos_desde_trama, 0
+            hay_cambios, self.hay_cambios = self.hay_cambios, False
+
+        if muestras:
+            self.socketio.emit('resultados_lote', {"resultados": muestras, "recibidos": recibidos})
+            self.tramas_resultados += 1
+            self.resultados_emitidos += len(muestras)
+
+        if hay_cambios:
+            self.terminado_emitido = False
+            delta = self._calcular_delta(self.metricas.obtener_resumen())
+            if delta:
+                self.socketio.emit('actualizacion_metricas_delta', delta)
+                self.tramas_resumen += 1
+
+        for resolucion, cubetas in self.metricas.serie.cerrar_vencidas(time.time()).items():
+            self.socketio.emit('serie_cubetas', {"resolucion": resolucion, "cubetas": cubetas})
+            self.tramas_series += 1
+
+        if self.metricas.verificar_si_termino() and not self.terminado_emitido:
+            self.socketio.emit('simulacion_terminada', self.metricas.obtener_resumen())
+            self.terminado_emitido = True
+
+    def bucle(self):
+        while self.ejecutando:
+            time.sleep(self.intervalo)
+            try:
+                self.emitir_pendientes()
+            except Exception as e:
+                print(f"[DASHBOARD] Error emitiendo actualizaciones: {e}")
+
+    def registrar_metricas(self, registro):
+        registro.metrica("frecuencia_maxima_emision", "gauge", "Tramas por segundo permitidas por tipo", 1.0 / self.intervalo)
+        registro.familia("tramas_emitidas_total", "counter", "Tramas Socket.IO emitidas")
+        registro.muestra("tramas_emitidas_total", self.tramas_resumen, tipo="resumen")
+        registro.muestra("tramas_emitidas_total", self.tramas_resultados, tipo="resultados")
+        registro.muestra("tramas_emitidas_total", self.tramas_series, tipo="series")
+        registro.metrica("resultados_recibidos_total", "counter", "Resultados nuevos entregados al planificador", self.resultados_recibidos)
+        registro.metrica("resultados_emitidos_total", "counter", "Resultados muestreados enviados a los navegadores", self.resultados_emitidos)
+
+    def estado(self):
+        return {
+            "frecuencia_maxima": 1.0 / self.intervalo,
+            "tramas_resumen": self.tramas_resumen,
+            "tramas_resultados": self.tramas_resultados,
+            "tramas_series": self.tramas_series,
+            "resultados_recibidos": self.resultados_recibidos,
+            "resultados_emitidos": self.resultados_emitidos
+        }
+
+
 class OyenteRabbitMonteCarlo:
     COLA_DASHBOARD = "dashboard_actualizaciones"
     COLA_MODELO = "cola_modelo"
     COLA_RESULTADOS = "resultados"
+    INTERCAMBIO_RESULTADOS = "resultados"
     COLA_ESTADISTICAS = "estadisticas"
+    INTERCAMBIO_CONTROL = "control_simulacion"
+    INTERCAMBIO_MODELOS = "modelos"
+    COLA_REGISTRO = "registro_modelos"
 
-    def __init__(self, host, port, usuario, contrasena, socketio, metricas):
+    def __init__(self, host, port, usuario, contrasena, socketio, metricas, planificador=None):
         self.host = host
         self.puerto = port
         self.usuario = usuario
         self.contrasena = contrasena
         self.socketio = socketio
         self.metricas = metricas
+        self.planificador = planificador or PlanificadorEmisiones(socketio, metricas)
         self.ejecutando = True
+        self.version_anunciada = None
+        self.pool = PoolConexionesRabbit.compartido(self._obtener_parametros_conexion())
 
     def _obtener_parametros_conexion(self):
         return pika.ConnectionParameters(
@@ -169,8 +918,7 @@ class OyenteRabbitMonteCarlo:
 
     def _verificar_cola_modelo(self):
         try:
-            conexion = pika.BlockingConnection(self._obtener_parametros_conexion())
-            canal = conexion.channel()
+            canal = self.pool.obtener_canal()
             try:
                 cola_modelo = canal.queue_declare(queue=self.COLA_MODELO, passive=True)
                 cantidad = cola_modelo.method.message_count
@@ -182,6 +930,10 @@ class OyenteRabbitMonteCarlo:
                             datos = json.loads(cuerpo.decode())
                             version = datos.get("version", "Desconocida")[:8] + "..."
                             self.metricas.actualizar_info_modelo("Activa", cantidad, version)
+                            self.metricas.convergencia.configurar(
+                                datos.get("version"),
+                                datos.get("metrica_salida") or extraer_metrica_salida(datos.get("codigo"))
+                            )
                         except:
                             self.metricas.actualizar_info_modelo("Activa", cantidad)
                         canal.basic_nack(metodo.delivery_tag, requeue=True)
@@ -189,20 +941,32 @@ class OyenteRabbitMonteCarlo:
                     self.metricas.actualizar_info_modelo("Activa", cantidad)
             except pika.exceptions.ChannelClosedByBroker:
                 self.metricas.actualizar_info_modelo("No existe", 0)
-            conexion.close()
         except Exception as e:
+            self.pool.invalidar()
             self.metricas.actualizar_info_modelo(f"Error: {str(e)}", 0)
 
+    def _procesar_modelo_anunciado(self, datos):
+        if datos.get("error") or not datos.get("version"):
+            return
+        self.version_anunciada = datos["version"]
+        self.metricas.actualizar_info_modelo("Activa", 1, datos["version"][:8] + "...")
+        self.metricas.convergencia.configurar(
+            datos["version"],
+            datos.get("metrica_salida") or extraer_metrica_salida(datos.get("codigo"))
+        )
+
     def _procesar_resultado(self, datos):
-        self.metricas.actualizar_resultado(datos)
-        self.socketio.emit('resultado', datos)
-        resumen = self.metricas.obtener_resumen()
-        self.socketio.emit('actualizacion_metricas', resumen)
-        if self.metricas.verificar_si_termino():
-            self.socketio.emit('simulacion_terminada', resumen)
+        if self.metricas.actualizar_resultado(datos):
+            self.planificador.agregar_resultado(datos)
+
+    def _procesar_lote_resultados(self, sobre):
+        for resultado in sobre.get("resultados", []):
+            datos = dict(resultado, consumidor=sobre.get("consumidor"), version_modelo=sobre.get("version_modelo"))
+            self._procesar_resultado(datos)
 
     def _procesar_estadisticas(self, datos):
         self.metricas.actualizar_estadisticas(datos)
+        self.planificador.marcar_cambio()
         self.socketio.emit('estadisticas', datos)
 
     def _procesar_cambio_modelo(self, datos):
@@ -214,6 +978,8 @@ class OyenteRabbitMonteCarlo:
         print(f"[DASHBOARD] Archivo: {datos.get('archivo_modelo')}")
         
         self.metricas.reiniciar_metricas()
+        self.planificador.reiniciar()
+        self.metricas.convergencia.configurar(datos.get("nueva_version"), datos.get("metrica_salida"))
         self.metricas.actualizar_info_modelo(
             "Activa", 1,
             datos.get('nueva_version'),
@@ -227,10 +993,30 @@ class OyenteRabbitMonteCarlo:
         })
         print(f"[DASHBOARD] Metricas reiniciadas para nuevo modelo")
 
+    def _evaluar_convergencia(self):
+        estado = self.metricas.convergencia.evaluar(self.metricas.acumuladores)
+        if not estado:
+            return
+        print(f"\n[DASHBOARD] Convergencia alcanzada en '{estado['metrica']}': "
+              f"media {estado['media']:.6g} +/- {estado['semiancho']:.3g} con {estado['n']} muestras")
+        mensaje = dict(estado, evento="convergencia_alcanzada")
+
+        def publicar(canal):
+            canal.exchange_declare(exchange=self.INTERCAMBIO_CONTROL, exchange_type='fanout')
+            canal.basic_publish(exchange=self.INTERCAMBIO_CONTROL, routing_key='', body=json.dumps(mensaje).encode())
+
+        try:
+            self.pool.ejecutar(publicar)
+        except Exception as e:
+            self.metricas.convergencia.convergido = False
+            print(f"[DASHBOARD] Error publicando senal de convergencia: {e}")
+            return
+        self.socketio.emit('convergencia', estado)
+        self.planificador.marcar_cambio()
+
     def ejecutar(self):
         print(f"[RABBITMQ] Iniciando oyente en {self.host}:{self.puerto}")
         print(f"[RABBITMQ] Escuchando cambios de modelo...")
-        self._verificar_cola_modelo()
 
         while self.ejecutando:
             conexion = None
@@ -238,20 +1024,29 @@ class OyenteRabbitMonteCarlo:
                 conexion = pika.BlockingConnection(self._obtener_parametros_conexion())
                 canal = conexion.channel()
 
+                canal.exchange_declare(exchange=self.INTERCAMBIO_RESULTADOS, exchange_type='fanout', durable=True)
                 canal.queue_declare(queue=self.COLA_RESULTADOS, durable=True)
+                canal.queue_bind(exchange=self.INTERCAMBIO_RESULTADOS, queue=self.COLA_RESULTADOS)
                 canal.queue_declare(queue=self.COLA_ESTADISTICAS, durable=False)
                 canal.queue_declare(queue=self.COLA_DASHBOARD, durable=False)
+                canal.exchange_declare(exchange=self.INTERCAMBIO_MODELOS, exchange_type='fanout', durable=True)
+                cola_modelos = canal.queue_declare(queue='', exclusive=True).method.queue
+                canal.queue_bind(exchange=self.INTERCAMBIO_MODELOS, queue=cola_modelos)
 
                 def callback_resultado(ch, metodo, props, cuerpo):
                     try:
-                        self._procesar_resultado(json.loads(cuerpo.decode()))
+                        datos = decodificar_mensaje(cuerpo, props.content_type)
+                        if datos.get("tipo") == "lote_resultados":
+                            self._procesar_lote_resultados(datos)
+                        else:
+                            self._procesar_resultado(datos)
                         ch.basic_ack(metodo.delivery_tag)
                     except Exception as e:
                         print(f"[DASHBOARD] Error procesando resultado: {e}")
 
                 def callback_estadisticas(ch, metodo, props, cuerpo):
                     try:
-                        self._procesar_estadisticas(json.loads(cuerpo.decode()))
+                        self._procesar_estadisticas(decodificar_mensaje(cuerpo, props.content_type))
                         ch.basic_ack(metodo.delivery_tag)
                     except Exception as e:
                         print(f"[DASHBOARD] Error procesando estadisticas: {e}")
@@ -267,13 +1062,30 @@ class OyenteRabbitMonteCarlo:
                 canal.basic_consume(queue=self.COLA_ESTADISTICAS, on_message_callback=callback_estadisticas)
                 canal.basic_consume(queue=self.COLA_DASHBOARD, on_message_callback=callback_dashboard)
 
+                def callback_modelo(ch, metodo, props, cuerpo):
+                    try:
+                        self._procesar_modelo_anunciado(json.loads(cuerpo.decode()))
+                    except Exception as e:
+                        print(f"[DASHBOARD] Error procesando modelo anunciado: {e}")
+
+                canal.basic_consume(queue=cola_modelos, on_message_callback=callback_modelo, auto_ack=True)
+                # El modelo vigente llega como respuesta del registro; los siguientes, por el fanout
+                canal.basic_publish(
+                    exchange='',
+                    routing_key=self.COLA_REGISTRO,
+                    body=json.dumps({"version": None}).encode(),
+                    properties=pika.BasicProperties(reply_to=cola_modelos, correlation_id="ultima")
+                )
+
                 print("[DASHBOARD] Conectado a RabbitMQ - Esperando mensajes...")
                 ultima_verificacion = time.time()
 
                 while self.ejecutando:
                     conexion.process_data_events(time_limit=1.0)
+                    self._evaluar_convergencia()
                     if time.time() - ultima_verificacion > 10:
-                        self._verificar_cola_modelo()
+                        if not self.version_anunciada:
+                            self._verificar_cola_modelo()
                         self.socketio.emit('actualizacion_metricas', self.metricas.obtener_resumen())
                         ultima_verificacion = time.time()
 
@@ -465,6 +1277,10 @@ class DashboardMonteCarlo:
                 <div class="etiqueta-metrica">Errores Totales</div>
                 <div class="valor-metrica error" id="totalErrores">0</div>
             </div>
+            <div class="tarjeta">
+                <div class="etiqueta-metrica" id="etiquetaConvergencia">Convergencia</div>
+                <div class="valor-metrica" id="valorConvergencia">-</div>
+            </div>
         </div>
 
         <div class="tarjeta">
@@ -475,7 +1291,14 @@ class DashboardMonteCarlo:
         </div>
 
         <div class="contenedor-grafico">
-            <h3>Valores Numericos en Tiempo Real (Stream)</h3>
+            <h3>Valores Numericos en Tiempo Real (Stream)
+                <select id="ventanaSerie" onchange="cargarSerie()" style="float: right;">
+                    <option value="300">5 min</option>
+                    <option value="3600">1 hora</option>
+                    <option value="21600">6 horas</option>
+                    <option value="86400">24 horas</option>
+                </select>
+            </h3>
             <canvas id="graficoStream"></canvas>
         </div>
 
@@ -553,39 +1376,43 @@ class DashboardMonteCarlo:
                 </div>`;
         }
 
-        function extraerNumericos(obj, prefijo = '') {
-            const nums = {};
-            for (const [clave, valor] of Object.entries(obj)) {
-                const claveCompleta = prefijo ? prefijo + '.' + clave : clave;
-                if (typeof valor === 'number') {
-                    nums[claveCompleta] = valor;
-                } else if (typeof valor === 'object' && valor !== null && !Array.isArray(valor)) {
-                    Object.assign(nums, extraerNumericos(valor, claveCompleta));
-                }
-            }
-            return nums;
-        }
-
-        function actualizarGraficoStream(resultado, marca) {
-            const nums = extraerNumericos(resultado);
-            Object.entries(nums).forEach(([nombre, valor]) => {
-                let ds = graficoStream.data.datasets.find(d => d.label === nombre);
-                if (!ds) {
-                    ds = {
-                        label: nombre, data: [], borderColor: obtenerColor(nombre),
-                        backgroundColor: obtenerColor(nombre) + '20',
-                        tension: 0.2, fill: false, pointRadius: 2, borderWidth: 2
-                    };
-                    graficoStream.data.datasets.push(ds);
-                }
-                ds.data.push(valor);
-                if (ds.data.length > 50) ds.data.shift();
+        let resolucionSerie = 1;
+
+        function agregarCubetasSerie(cubetas) {
+            const maxPuntos = Math.ceil(document.getElementById('ventanaSerie').value / resolucionSerie);
+            cubetas.forEach((c) => {
+                Object.keys(c.metricas).forEach((nombre) => {
+                    if (!graficoStream.data.datasets.find(d => d.label === nombre)) {
+                        graficoStream.data.datasets.push({
+                            label: nombre, data: graficoStream.data.labels.map(() => null),
+                            borderColor: obtenerColor(nombre), backgroundColor: obtenerColor(nombre) + '20',
+                            tension: 0.2, fill: false, pointRadius: 0, borderWidth: 2, spanGaps: true
+                        });
+                    }
+                });
+                graficoStream.data.labels.push(new Date(c.t * 1000).toLocaleTimeString());
+                graficoStream.data.datasets.forEach((ds) => {
+                    const m = c.metricas[ds.label];
+                    ds.data.push(m ? m.media : null);
+                });
             });
-            graficoStream.data.labels.push(marca);
-            if (graficoStream.data.labels.length > 50) graficoStream.data.labels.shift();
+            while (graficoStream.data.labels.length > maxPuntos) {
+                graficoStream.data.labels.shift();
+                graficoStream.data.datasets.forEach((ds) => ds.data.shift());
+            }
             graficoStream.update('quiet');
         }
 
+        function cargarSerie() {
+            const desde = Date.now() / 1000 - document.getElementById('ventanaSerie').value;
+            fetch('/series?desde=' + desde).then((r) => r.json()).then((datos) => {
+                resolucionSerie = datos.resolucion;
+                graficoStream.data.labels = [];
+                graficoStream.data.datasets = [];
+                agregarCubetasSerie(datos.cubetas);
+            });
+        }
+
         function actualizarMetricas(datos) {
             metricas = datos;
             document.getElementById('totalProcesados').textContent = datos.total_procesados || 0;
@@ -595,12 +1422,26 @@ class DashboardMonteCarlo:
                 ? ((datos.total_procesados - datos.total_errores) / datos.total_procesados * 100).toFixed(1) : 100;
             document.getElementById('tasaExito').textContent = tasa + '%';
             if (datos.info_modelo) actualizarPoliticasModelo(datos.info_modelo);
-            actualizarMetricasDescubiertas(datos.metricas_descubiertas, datos.tipos_metricas);
+            actualizarMetricasDescubiertas(datos.metricas_descubiertas, datos.tipos_metricas, datos.estadisticas_metricas);
             actualizarRendimiento(datos.rendimiento_consumidor);
             actualizarCarga(datos.carga_trabajo_consumidor);
+            actualizarConvergencia(datos.convergencia);
+        }
+
+        function actualizarConvergencia(conv) {
+            if (!conv || !conv.metrica) return;
+            document.getElementById('etiquetaConvergencia').textContent = 'Convergencia (' + conv.metrica + ')';
+            const valor = document.getElementById('valorConvergencia');
+            if (conv.convergido) {
+                valor.textContent = 'OK';
+                valor.className = 'valor-metrica exito';
+            } else if (conv.n > 0) {
+                valor.textContent = '+/-' + Number(conv.semiancho).toPrecision(2) + ' / ' + Number(conv.objetivo).toPrecision(2);
+                valor.className = 'valor-metrica';
+            }
         }
 
-        function actualizarMetricasDescubiertas(descubiertas, tipos) {
+        function actualizarMetricasDescubiertas(descubiertas, tipos, estadisticas) {
             if (!descubiertas || descubiertas.length === 0) return;
             let html = '<div style="display: flex; flex-wrap: wrap; gap: 8px;">';
             descubiertas.forEach(m => {
@@ -608,7 +1449,21 @@ class DashboardMonteCarlo:
                 const icono = tipo === 'numerica' ? '[N]' : '[T]';
                 html += '<span class="insignia">' + icono + ' ' + m + ' (' + tipo + ')</span>';
             });
-            document.getElementById('metricasDescubiertas').innerHTML = html + '</div>';
+            html += '</div>';
+            const filas = Object.entries(estadisticas || {}).filter(([_, e]) => e.cantidad > 0);
+            if (filas.length > 0) {
+                const f = (v) => Number(v).toPrecision(4);
+                html += '<table style="width: 100%; margin-top: 15px; font-size: 13px; text-align: right;">' +
+                    '<tr><th style="text-align: left;">Metrica</th><th>n</th><th>Media</th><th>Desv.</th>' +
+                    '<th>IC 95%</th><th>p50</th><th>p99</th><th>Min</th><th>Max</th></tr>';
+                filas.forEach(([m, e]) => {
+                    html += `<tr><td style="text-align: left;">${m}</td><td>${e.cantidad}</td><td>${f(e.media)}</td>` +
+                        `<td>${f(e.desviacion)}</td><td>[${f(e.intervalo_confianza_95[0])}, ${f(e.intervalo_confianza_95[1])}]</td>` +
+                        `<td>${f(e.percentiles.p50)}</td><td>${f(e.percentiles.p99)}</td><td>${f(e.minimo)}</td><td>${f(e.maximo)}</td></tr>`;
+                });
+                html += '</table>';
+            }
+            document.getElementById('metricasDescubiertas').innerHTML = html;
         }
 
         function actualizarRendimiento(rend) {
@@ -674,12 +1529,11 @@ class DashboardMonteCarlo:
             setTimeout(() => banner.classList.remove('mostrar', 'cambio-modelo'), 5000);
         });
 
-        socket.on('resultado', (r) => {
+        function mostrarResultado(r) {
             if (!document.getElementById('bannerEstado').classList.contains('mostrar')) {
                 document.getElementById('bannerEstado').classList.add('mostrar');
             }
             const marca = new Date(r.marca_tiempo * 1000).toLocaleTimeString();
-            actualizarGraficoStream(r.resultado || {}, marca);
             const icono = r.exito ? '[OK]' : '[ERR]';
             const clase = r.exito ? 'exito' : 'error';
             const div = document.createElement('div');
@@ -692,10 +1546,20 @@ class DashboardMonteCarlo:
             const flujo = document.getElementById('flujoResultados');
             flujo.insertBefore(div, flujo.firstChild);
             if (flujo.children.length > 50) flujo.removeChild(flujo.lastChild);
+        }
+
+        socket.on('serie_cubetas', (datos) => {
+            if (datos.resolucion === resolucionSerie) agregarCubetasSerie(datos.cubetas);
         });
 
+        socket.on('connect', cargarSerie);
+
+        socket.on('resultados_lote', (lote) => lote.resultados.forEach(mostrarResultado));
+
         socket.on('actualizacion_metricas', actualizarMetricas);
 
+        socket.on('actualizacion_metricas_delta', (delta) => actualizarMetricas(Object.assign({}, metricas, delta)));
+
         socket.on('simulacion_terminada', (datos) => {
             const banner = document.getElementById('bannerEstado');
             banner.textContent = 'Simulacion Completada: ' + datos.total_procesados + ' escenarios procesados';
@@ -703,6 +1567,14 @@ class DashboardMonteCarlo:
             actualizarMetricas(datos);
         });
 
+        socket.on('convergencia', (conv) => {
+            const banner = document.getElementById('bannerEstado');
+            banner.textContent = 'Convergencia alcanzada: ' + conv.metrica + ' = ' + Number(conv.media).toPrecision(6) +
+                ' +/- ' + Number(conv.semiancho).toPrecision(3) + ' (' + conv.n + ' escenarios)';
+            banner.classList.add('mostrar', 'terminado');
+            actualizarConvergencia(conv);
+        });
+
         socket.on('estadisticas', (s) => console.log("Estadisticas consumidor:", s));
     </script>
 </body>
@@ -710,17 +1582,29 @@ class DashboardMonteCarlo:
 """
 
     def __init__(self, host='0.0.0.0', puerto=5000, host_rabbit='10.163.238.60', 
-                 puerto_rabbit=5672, usuario_rabbit='admin', contrasena_rabbit='admin'):
+                 puerto_rabbit=5672, usuario_rabbit='admin', contrasena_rabbit='admin',
+                 semiancho_objetivo=None, semiancho_relativo=0.01, muestras_minimas=1000,
+                 directorio_resultados="resultados_persistidos", version_repeticion=None, amplitud_indices=2 ** 24):
         self.host = host
         self.puerto = puerto
+        self.version_repeticion = version_repeticion
         self.app = Flask(__name__)
         self.socketio = SocketIO(self.app, cors_allowed_origins="*", async_mode='eventlet')
-        self.metricas = MetricasDashboard()
+        self.metricas = MetricasDashboard(convergencia=RastreadorConvergencia(
+            semiancho_objetivo=semiancho_objetivo,
+            semiancho_relativo=semiancho_relativo,
+            muestras_minimas=muestras_minimas
+        ), amplitud_indices=amplitud_indices)
+        self.planificador = PlanificadorEmisiones(self.socketio, self.metricas)
         self.oyente_rabbit = OyenteRabbitMonteCarlo(
             host=host_rabbit, port=puerto_rabbit,
             usuario=usuario_rabbit, contrasena=contrasena_rabbit,
-            socketio=self.socketio, metricas=self.metricas
+            socketio=self.socketio, metricas=self.metricas,
+            planificador=self.planificador
         )
+        self.repeticiones = RepeticionEjecuciones(directorio_resultados)
+        if version_repeticion:
+            self.repeticiones.cargar(version_repeticion, self.metricas)
         self._configurar_rutas()
 
     def _configurar_rutas(self):
@@ -732,13 +1616,54 @@ class DashboardMonteCarlo:
         def obtener_metricas():
             return self.metricas.obtener_resumen()
 
+        @self.app.route('/series')
+        def obtener_series():
+            hasta = request.args.get('hasta', time.time(), type=float)
+            desde = request.args.get('desde', hasta - 300, type=float)
+            resolucion = request.args.get('resolucion', type=int)
+            return self.metricas.serie.consultar(desde, hasta, resolucion)
+
+        @self.app.route('/ejecuciones')
+        def listar_ejecuciones():
+            return {"ejecuciones": self.repeticiones.listar()}
+
+        @self.app.route('/repeticion/<version>')
+        def obtener_repeticion(version):
+            # Mapear y agregar las partes .npy tarda segundos: en un hilo nativo, el hub de eventlet sigue
+            # atendiendo peticiones y emisiones mientras tanto
+            try:
+                return tpool.execute(self._resumen_repeticion, version)
+            except FileNotFoundError as e:
+                return {"status": "error", "message": str(e)}, 404
+
+        @self.app.route('/metrics')
+        def exportar_metricas():
+            registro = RegistroMetricas("montecarlo_dashboard")
+            self.metricas.registrar_metricas(registro)
+            self.planificador.registrar_metricas(registro)
+            registro.metrica("memoria_residente_bytes", "gauge", "Memoria residente del proceso", memoria_residente())
+            return Response(registro.texto(), mimetype="text/plain; version=0.0.4")
+
         @self.app.route('/reiniciar', methods=['POST'])
         def reiniciar():
             self.metricas.reiniciar_metricas()
+            self.planificador.reiniciar()
             return {"status": "success", "message": "Metricas reiniciadas"}
 
+        @self.socketio.on('connect')
+        def al_conectar():
+            self.socketio.emit('actualizacion_metricas', self.metricas.obtener_resumen(), to=request.sid)
+
+    def _resumen_repeticion(self, version):
+        # Metricas propias de la peticion: nada compartido con el hub se toca desde el hilo nativo
+        return self.repeticiones.cargar(version, MetricasDashboard(amplitud_indices=self.metricas.amplitud_indices)).obtener_resumen()
+
     def ejecutar(self, depurar=True):
-        threading.Thread(target=self.oyente_rabbit.ejecutar, daemon=True).start()
+        if self.version_repeticion:
+            print(f"[DASHBOARD] Modo repeticion: version {self.version_repeticion} (sin conexion a RabbitMQ)")
+        else:
+            threading.Thread(target=self.oyente_rabbit.ejecutar, daemon=True).start()
+            threading.Thread(target=self.planificador.bucle, daemon=True).start()
         print(f"[DASHBOARD] Iniciando Dashboard Universal")
         print(f"[DASHBOARD] Abre tu navegador en: http://{self.host}:{self.puerto}")
         print(f"[DASHBOARD] Conectando a RabbitMQ: {self.oyente_rabbit.host}:{self.oyente_rabbit.puerto}")
@@ -750,16 +1675,27 @@ class DashboardMonteCarlo:
         except KeyboardInterrupt:
             print("\n[DASHBOARD] Cerrando dashboard...")
             self.oyente_rabbit.ejecutando = False
+            self.planificador.ejecutando = False
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Dashboard de simulacion Monte Carlo")
+    parser.add_argument("--repeticion", metavar="VERSION", help="Cargar una ejecucion persistida en lugar de escuchar RabbitMQ")
+    parser.add_argument("--directorio-resultados", default="resultados_persistidos")
+    parser.add_argument("--amplitud-indices", type=int, default=2 ** 24,
+                        help="Indices por version que deduplica el mapa de bits (1 bit cada uno); el resto usa el filtro Bloom")
+    argumentos = parser.parse_args()
+
     dashboard = DashboardMonteCarlo(
         host='0.0.0.0',
         puerto=5000,
         host_rabbit='10.163.238.60',
         puerto_rabbit=5672,
         usuario_rabbit='admin',
-        contrasena_rabbit='admin'
+        contrasena_rabbit='admin',
+        directorio_resultados=argumentos.directorio_resultados,
+        version_repeticion=argumentos.repeticion,
+        amplitud_indices=argumentos.amplitud_indices
     )
     
     print("\nDASHBOARD INICIADO")
@@ -0,0 +1,157 @@
+# estadisticas.py
+# Acumuladores en streaming comunes al dashboard y a la ejecucion local: memoria acotada
+# sea cual sea el numero de escenarios y el mismo resumen en ambos
+import math
+import numpy as np
+from collections import defaultdict
+
+
+class BosquejoCuantiles:
+    def __init__(self, precision_relativa=0.01, max_cubetas=2048):
+        self.precision_relativa = precision_relativa
+        self.gamma = (1 + precision_relativa) / (1 - precision_relativa)
+        self.log_gamma = math.log(self.gamma)
+        self.max_cubetas = max_cubetas
+        self.positivos = defaultdict(int)
+        self.negativos = defaultdict(int)
+        self.ceros = 0
+        self.cantidad = 0
+
+    def _indice(self, magnitud):
+        return math.ceil(math.log(magnitud) / self.log_gamma)
+
+    def _valor(self, indice):
+        return 2 * self.gamma ** indice / (self.gamma + 1)
+
+    def agregar(self, valor, veces=1):
+        if valor > 1e-12:
+            self.positivos[self._indice(valor)] += veces
+        elif valor < -1e-12:
+            self.negativos[self._indice(-valor)] += veces
+        else:
+            self.ceros += veces
+        self.cantidad += veces
+        if len(self.positivos) + len(self.negativos) > self.max_cubetas:
+            self._colapsar()
+
+    def agregar_lote(self, valores):
+        valores = np.asarray(valores, dtype=np.float64)
+        for cubetas, magnitudes in ((self.positivos, valores[valores > 1e-12]), (self.negativos, -valores[valores < -1e-12])):
+            if magnitudes.size == 0:
+                continue
+            indices = np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64)
+            minimo = int(indices.min())
+            conteos = np.bincount(indices - minimo)
+            for desplazamiento in np.flatnonzero(conteos).tolist():
+                cubetas[minimo + desplazamiento] += int(conteos[desplazamiento])
+        self.ceros += int(np.count_nonzero(np.abs(valores) <= 1e-12))
+        self.cantidad += valores.size
+        if len(self.positivos) + len(self.negativos) > self.max_cubetas:
+            self._colapsar()
+
+    def _colapsar(self):
+        # Se sacrifica precision en las magnitudes mas pequenas, igual que DDSketch
+        for cubetas in (self.negativos, self.positivos):
+            indices = sorted(cubetas)
+            while len(indices) > 1 and len(self.positivos) + len(self.negativos) > self.max_cubetas:
+                menor = indices.pop(0)
+                cubetas[indices[0]] += cubetas.pop(menor)
+
+    def fusionar(self, otro):
+        for indice, veces in otro.positivos.items():
+            self.positivos[indice] += veces
+        for indice, veces in otro.negativos.items():
+            self.negativos[indice] += veces
+        self.ceros += otro.ceros
+        self.cantidad += otro.cantidad
+        if len(self.positivos) + len(self.negativos) > self.max_cubetas:
+            self._colapsar()
+
+    def cuantil(self, q):
+        if self.cantidad == 0:
+            return None
+        rango = q * (self.cantidad - 1)
+        acumulado = 0
+        for indice in sorted(self.negativos, reverse=True):
+            acumulado += self.negativos[indice]
+            if acumulado > rango:
+                return -self._valor(indice)
+        acumulado += self.ceros
+        if acumulado > rango:
+            return 0.0
+        for indice in sorted(self.positivos):
+            acumulado += self.positivos[indice]
+            if acumulado > rango:
+                return self._valor(indice)
+        return self._valor(max(self.positivos)) if self.positivos else 0.0
+
+
+class AcumuladorNumerico:
+    PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+    def __init__(self):
+        self.cantidad = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.minimo = math.inf
+        self.maximo = -math.inf
+        self.bosquejo = BosquejoCuantiles()
+
+    def agregar(self, valor):
+        self.cantidad += 1
+        delta = valor - self.media
+        self.media += delta / self.cantidad
+        self.m2 += delta * (valor - self.media)
+        self.minimo = min(self.minimo, valor)
+        self.maximo = max(self.maximo, valor)
+        self.bosquejo.agregar(valor)
+
+    def agregar_lote(self, valores):
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        if valores.size == 0:
+            return
+        lote = AcumuladorNumerico()
+        lote.cantidad = valores.size
+        lote.media = float(valores.mean())
+        lote.m2 = float(np.square(valores - lote.media).sum())
+        lote.minimo = float(valores.min())
+        lote.maximo = float(valores.max())
+        lote.bosquejo.agregar_lote(valores)
+        self.fusionar(lote)
+
+    def fusionar(self, otro):
+        if otro.cantidad == 0:
+            return
+        total = self.cantidad + otro.cantidad
+        delta = otro.media - self.media
+        self.m2 += otro.m2 + delta * delta * self.cantidad * otro.cantidad / total
+        self.media += delta * otro.cantidad / total
+        self.cantidad = total
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+        self.bosquejo.fusionar(otro.bosquejo)
+
+    def varianza(self):
+        return self.m2 / (self.cantidad - 1) if self.cantidad > 1 else 0.0
+
+    def error_estandar(self):
+        return math.sqrt(self.varianza() / self.cantidad) if self.cantidad > 0 else 0.0
+
+    def resumen(self, z=1.96):
+        if self.cantidad == 0:
+            return {"cantidad": 0}
+        semiancho = z * self.error_estandar()
+        return {
+            "cantidad": self.cantidad,
+            "media": self.media,
+            "desviacion": math.sqrt(self.varianza()),
+            "error_estandar": self.error_estandar(),
+            "minimo": self.minimo,
+            "maximo": self.maximo,
+            "intervalo_confianza_95": [self.media - semiancho, self.media + semiancho],
+            "percentiles": {
+                f"p{p}": min(max(self.bosquejo.cuantil(p / 100), self.minimo), self.maximo)
+                for p in self.PERCENTILES
+            }
+        }
@@ -0,0 +1,330 @@
+# local-runner.py
+import os
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import multiprocessing
+import numpy as np
+from semillas import derivar_semillas, espacio_modelo, verificar_equivalencia_lote
+from estadisticas import AcumuladorNumerico
+from collections import defaultdict
+
+
+class CodificadorNumpy(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (np.integer, np.int32, np.int64)):
+            return int(obj)
+        elif isinstance(obj, (np.floating, np.float32, np.float64)):
+            return float(obj)
+        elif isinstance(obj, np.ndarray):
+            return obj.tolist()
+        return super().default(obj)
+
+
+def extraer_metrica_salida(texto_modelo):
+    coincidencia = re.search(r'^OUTPUT\s*=\s*["\'](\w+)["\']', texto_modelo or "", re.MULTILINE)
+    return coincidencia.group(1) if coincidencia else None
+
+
+def compilar_modelo(codigo_modelo):
+    if not codigo_modelo:
+        raise ValueError("No hay codigo de modelo")
+
+    espacio = espacio_modelo()
+    exec(codigo_modelo, espacio)
+    funcion_modelo = espacio.get("model_fn")
+    if not funcion_modelo:
+        raise ValueError("El modelo no contiene 'model_fn'")
+
+    funcion_modelo({"prueba": True})
+    funcion_modelo_lote = espacio.get("model_fn_batch")
+    if funcion_modelo_lote:
+        try:
+            salidas = funcion_modelo_lote({"indice": np.arange(2)})
+            if not isinstance(salidas, dict):
+                raise ValueError("debe devolver un diccionario de columnas")
+            for valores in salidas.values():
+                np.broadcast_to(valores, (2,))
+            verificar_equivalencia_lote(funcion_modelo_lote, funcion_modelo)
+        except Exception as e:
+            print(f"[LOCAL] 'model_fn_batch' descartado: {e}")
+            funcion_modelo_lote = None
+    return funcion_modelo, funcion_modelo_lote
+
+
+def generar_distribuciones_lote(generador, cantidad):
+    return {
+        "uniforme": generador.random(cantidad),
+        "uniforme_rango": generador.uniform(0, 100, cantidad),
+        "normal_estandar": generador.normal(0, 1, cantidad),
+        "normal_personalizada": generador.normal(50, 15, cantidad),
+        "binomial": generador.binomial(100, 0.5, cantidad),
+        "poisson": generador.poisson(10, cantidad),
+        "bernoulli": generador.binomial(1, 0.3, cantidad),
+        "exponencial": generador.exponential(2, cantidad),
+        "gamma": generador.gamma(2, 2, cantidad),
+        "beta": generador.beta(2, 5, cantidad),
+    }
+
+
+_proceso = {}
+
+
+def _inicializar_proceso(codigo_modelo, version_modelo):
+    random.seed()
+    np.random.seed()
+    funcion_modelo, funcion_modelo_lote = compilar_modelo(codigo_modelo)
+    _proceso.update(
+        funcion_modelo=funcion_modelo,
+        funcion_modelo_lote=funcion_modelo_lote,
+        version_modelo=version_modelo,
+        consumidor=f"local-{os.getpid()}"
+    )
+
+
+def _expandir_bloque(bloque):
+    distribuciones = bloque.get("distribuciones", {})
+    nombres = list(distribuciones.keys())
+    metadatos = {"marca_tiempo_lote": int(bloque["marca_tiempo"]), "tipos_distribucion": nombres}
+    inicio = bloque["indice_inicial"]
+    semillas = derivar_semillas(bloque["semilla"], np.arange(inicio, inicio + bloque["cantidad"])).tolist()
+    filas = zip(*(valores.tolist() for valores in distribuciones.values())) if nombres else [()] * bloque["cantidad"]
+    for desplazamiento, (semilla, fila) in enumerate(zip(semillas, filas)):
+        indice = inicio + desplazamiento
+        escenario = {
+            "id": f"{bloque['id_lote']}-{indice}",
+            "indice": indice,
+            "semilla": semilla,
+            "marca_tiempo": bloque["marca_tiempo"],
+            "version_modelo": bloque["version_modelo"],
+            "metadatos": metadatos
+        }
+        if nombres:
+            escenario["distribuciones"] = dict(zip(nombres, fila))
+        yield escenario
+
+
+def _procesar_escenario(escenario):
+    inicio = time.time()
+    try:
+        resultado = _proceso["funcion_modelo"](escenario)
+        exito = True
+    except Exception as e:
+        resultado = {"error": str(e)}
+        exito = False
+    return {
+        "consumidor": _proceso["consumidor"],
+        "id_escenario": escenario["id"],
+        "indice": escenario["indice"],
+        "resultado": resultado,
+        "marca_tiempo": time.time(),
+        "tiempo_procesamiento": time.time() - inicio,
+        "exito": exito,
+        "version_modelo": _proceso["version_modelo"]
+    }
+
+
+def _procesar_bloque(bloque):
+    if not _proceso["funcion_modelo_lote"]:
+        return [_procesar_escenario(escenario) for escenario in _expandir_bloque(bloque)]
+
+    inicio = time.time()
+    cantidad = bloque["cantidad"]
+    indices = np.arange(bloque["indice_inicial"], bloque["indice_inicial"] + cantidad)
+    columnas = dict(bloque.get("distribuciones", {}))
+    columnas["indice"] = indices
+    columnas["semilla"] = derivar_semillas(bloque["semilla"], indices)
+    try:
+        salidas = _proceso["funcion_modelo_lote"](columnas)
+        salidas = {clave: np.broadcast_to(valores, (cantidad,)).tolist() for clave, valores in salidas.items()}
+    except Exception as e:
+        print(f"[LOCAL] Fallo en model_fn_batch, usando model_fn: {e}")
+        return [_procesar_escenario(escenario) for escenario in _expandir_bloque(bloque)]
+
+    fin = time.time()
+    tiempo_por_escenario = (fin - inicio) / cantidad if cantidad else 0
+    claves = list(salidas.keys())
+    return [
+        {
+            "consumidor": _proceso["consumidor"],
+            "id_escenario": f"{bloque['id_lote']}-{indice}",
+            "indice": indice,
+            "resultado": dict(zip(claves, fila)),
+            "marca_tiempo": fin,
+            "tiempo_procesamiento": tiempo_por_escenario,
+            "exito": True,
+            "version_modelo": _proceso["version_modelo"]
+        }
+        for indice, fila in zip(indices.tolist(), zip(*salidas.values()))
+    ]
+
+
+class ResumenLocal:
+    def __init__(self, version_modelo, archivo_modelo):
+        self.version_modelo = version_modelo
+        self.archivo_modelo = archivo_modelo
+        self.total_procesados = 0
+        self.total_errores = 0
+        self.carga_trabajo_consumidor = defaultdict(int)
+        self.errores_consumidor = defaultdict(int)
+        self.metricas_descubiertas = set()
+        self.tipos_metricas = {}
+        self.acumuladores = defaultdict(AcumuladorNumerico)
+
+    def agregar(self, resultados):
+        # Solo se retienen los valores del lote en curso: cada metrica se vuelca a su acumulador de una vez
+        valores = defaultdict(list)
+        for datos in resultados:
+            self.total_procesados += 1
+            consumidor = datos["consumidor"]
+            self.carga_trabajo_consumidor[consumidor] += 1
+            if not datos["exito"]:
+                self.total_errores += 1
+                self.errores_consumidor[consumidor] += 1
+            resultado = datos["resultado"]
+            if not isinstance(resultado, dict):
+                continue
+            for clave, valor in resultado.items():
+                self.metricas_descubiertas.add(clave)
+                if isinstance(valor, (int, float)):
+                    self.tipos_metricas[clave] = 'numerica'
+                    valores[clave].append(float(valor))
+        for clave, lote in valores.items():
+            self.acumuladores[clave].agregar_lote(lote)
+
+    def obtener_resumen(self):
+        rendimiento = {}
+        for consumidor, procesados in self.carga_trabajo_consumidor.items():
+            errores = self.errores_consumidor.get(consumidor, 0)
+            rendimiento[consumidor] = {
+                "procesados": procesados,
+                "errores": errores,
+                "tasa_exito": (procesados - errores) / procesados * 100 if procesados > 0 else 0
+            }
+        return {
+            "total_procesados": self.total_procesados,
+            "total_errores": self.total_errores,
+            "consumidores_activos": len(self.carga_trabajo_consumidor),
+            "estadisticas_consumidor": {},
+            "rendimiento_consumidor": rendimiento,
+            "carga_trabajo_consumidor": dict(self.carga_trabajo_consumidor),
+            "metricas_descubiertas": list(self.metricas_descubiertas),
+            "tipos_metricas": self.tipos_metricas,
+            "estadisticas_metricas": {clave: acumulador.resumen() for clave, acumulador in self.acumuladores.items()},
+            "esta_terminado": True,
+            "info_modelo": {
+                "estado_cola": "Local",
+                "cantidad_mensajes": 0,
+                "ttl_segundos": 0,
+                "ultima_actualizacion": time.time(),
+                "politica": "Ejecucion local sin RabbitMQ",
+                "version": self.version_modelo,
+                "archivo_actual": self.archivo_modelo
+            }
+        }
+
+
+class MotorLocal:
+    def __init__(self, archivo_modelo="trafico.txt", escenarios=10000, procesos=None,
+                 escenarios_por_bloque=500, semilla=None, enviar_distribuciones=True):
+        self.archivo_modelo = archivo_modelo
+        self.escenarios = escenarios
+        self.procesos = procesos or os.cpu_count() or 1
+        self.escenarios_por_bloque = max(1, escenarios_por_bloque)
+        self.semilla = semilla if semilla is not None else int(np.random.default_rng().integers(2**63))
+        self.generador = np.random.default_rng(self.semilla)
+        self.enviar_distribuciones = enviar_distribuciones
+        self.version_modelo = f"local-{uuid.uuid4()}"
+
+    def cargar_modelo(self):
+        with open(self.archivo_modelo, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def generar_bloques(self):
+        id_lote = uuid.uuid4().hex
+        for inicio in range(0, self.escenarios, self.escenarios_por_bloque):
+            cantidad = min(self.escenarios_por_bloque, self.escenarios - inicio)
+            bloque = {
+                "tipo": "bloque_escenarios",
+                "id_lote": id_lote,
+                "indice_inicial": inicio,
+                "cantidad": cantidad,
+                "semilla": self.semilla,
+                "marca_tiempo": time.time(),
+                "version_modelo": self.version_modelo
+            }
+            if self.enviar_distribuciones:
+                bloque["distribuciones"] = generar_distribuciones_lote(self.generador, cantidad)
+            yield bloque
+
+    def ejecutar(self, al_recibir=None):
+        codigo_modelo = self.cargar_modelo()
+        _, funcion_modelo_lote = compilar_modelo(codigo_modelo)
+        print(f"[LOCAL] Modelo '{self.archivo_modelo}' compilado" + (" (con model_fn_batch)" if funcion_modelo_lote else ""))
+        print(f"[LOCAL] {self.escenarios} escenarios | {self.procesos} procesos | Semilla: {self.semilla}")
+
+        resumen = ResumenLocal(self.version_modelo, self.archivo_modelo)
+        inicio = time.time()
+        with multiprocessing.Pool(self.procesos, initializer=_inicializar_proceso,
+                                  initargs=(codigo_modelo, self.version_modelo)) as pool:
+            for resultados in pool.imap(_procesar_bloque, self.generar_bloques()):
+                resumen.agregar(resultados)
+                if al_recibir:
+                    al_recibir(resultados)
+        transcurrido = time.time() - inicio
+        print(f"[LOCAL] {resumen.total_procesados} escenarios en {transcurrido:.2f}s "
+              f"({resumen.total_procesados / transcurrido:.0f}/s) | Errores: {resumen.total_errores}")
+        return resumen.obtener_resumen()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ejecucion local de modelos Monte Carlo sin RabbitMQ")
+    parser.add_argument("archivo_modelo", nargs="?", default="trafico.txt")
+    parser.add_argument("-n", "--escenarios", type=int, default=10000)
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--escenarios-por-bloque", type=int, default=500)
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--sin-distribuciones", action="store_true", help="No generar las distribuciones del productor")
+    parser.add_argument("--resultados", help="Archivo JSON Lines donde escribir cada resultado")
+    parser.add_argument("--resumen", help="Archivo JSON donde escribir el resumen")
+    argumentos = parser.parse_args()
+
+    motor = MotorLocal(
+        archivo_modelo=argumentos.archivo_modelo,
+        escenarios=argumentos.escenarios,
+        procesos=argumentos.procesos,
+        escenarios_por_bloque=argumentos.escenarios_por_bloque,
+        semilla=argumentos.semilla,
+        enviar_distribuciones=not argumentos.sin_distribuciones
+    )
+
+    archivo_resultados = open(argumentos.resultados, 'w', encoding='utf-8') if argumentos.resultados else None
+    try:
+        def escribir(resultados):
+            archivo_resultados.writelines(json.dumps(r, cls=CodificadorNumpy) + "\n" for r in resultados)
+
+        resumen = motor.ejecutar(escribir if archivo_resultados else None)
+    finally:
+        if archivo_resultados:
+            archivo_resultados.close()
+
+    if argumentos.resumen:
+        with open(argumentos.resumen, 'w', encoding='utf-8') as f:
+            json.dump(resumen, f, cls=CodificadorNumpy, indent=2)
+
+    metrica_salida = extraer_metrica_salida(motor.cargar_modelo())
+    print(f"\n{'=' * 60}")
+    print("RESUMEN")
+    print(f"{'=' * 60}")
+    for nombre, estadisticas in resumen["estadisticas_metricas"].items():
+        marca = " (OUTPUT)" if nombre == metrica_salida else ""
+        ic = estadisticas["intervalo_confianza_95"]
+        print(f"  {nombre}{marca}: media {estadisticas['media']:.6g} | IC 95% [{ic[0]:.6g}, {ic[1]:.6g}] "
+              f"| p50 {estadisticas['percentiles']['p50']:.6g} | n {estadisticas['cantidad']}")
+
+
+if __name__ == "__main__":
+    main()
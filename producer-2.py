@@ -1,11 +1,28 @@
 # producer.py
 import pika
+import os
+import re
 import json
+import math
 import time
 import uuid
+import bisect
 import random
 import numpy as np
-from threading import Thread, Event
+from semillas import derivar_semillas
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Event, Lock, local, current_thread
+from collections import OrderedDict
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 
 class CodificadorNumpy(json.JSONEncoder):
@@ -19,6 +36,341 @@ class CodificadorNumpy(json.JSONEncoder):
         return super().default(obj)
 
 
+TIPO_JSON = "application/json"
+TIPO_MSGPACK = "application/x-msgpack"
+TIPO_PREFERIDO = TIPO_MSGPACK if msgpack else TIPO_JSON
+
+
+def _empaquetar_numpy(obj):
+    if isinstance(obj, np.ndarray):
+        arreglo = np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder('<'))
+        return {"__ndarray__": True, "dtype": arreglo.dtype.str, "forma": list(arreglo.shape), "datos": arreglo.tobytes()}
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj)}")
+
+
+def _desempaquetar_numpy(obj):
+    if obj.get("__ndarray__"):
+        return np.frombuffer(obj["datos"], dtype=np.dtype(obj["dtype"])).reshape(obj["forma"])
+    return obj
+
+
+def codificar_mensaje(datos, tipo_contenido=TIPO_JSON):
+    if tipo_contenido == TIPO_MSGPACK:
+        return msgpack.packb(datos, default=_empaquetar_numpy, use_bin_type=True)
+    return json.dumps(datos, cls=CodificadorNumpy).encode()
+
+
+def decodificar_mensaje(cuerpo, tipo_contenido=None):
+    if tipo_contenido == TIPO_MSGPACK:
+        if not msgpack:
+            raise ValueError("Mensaje msgpack recibido pero 'msgpack' no esta instalado")
+        return msgpack.unpackb(cuerpo, object_hook=_desempaquetar_numpy, raw=False)
+    return json.loads(cuerpo)
+
+
+def extraer_metrica_salida(texto_modelo):
+    coincidencia = re.search(r'^OUTPUT\s*=\s*["\'](\w+)["\']', texto_modelo or "", re.MULTILINE)
+    return coincidencia.group(1) if coincidencia else None
+
+
+def memoria_residente():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None
+
+
+class RegistroMetricas:
+    # Formato de exposicion de texto de Prometheus (compatible con OpenMetrics al hacer scrape)
+    def __init__(self, prefijo):
+        self.prefijo = prefijo
+        self.lineas = []
+
+    @staticmethod
+    def _valor(valor):
+        valor = float(valor)
+        if math.isnan(valor):
+            return "NaN"
+        if math.isinf(valor):
+            return "+Inf" if valor > 0 else "-Inf"
+        return repr(int(valor)) if valor.is_integer() and abs(valor) < 2 ** 53 else repr(valor)
+
+    @staticmethod
+    def _etiquetas(etiquetas):
+        if not etiquetas:
+            return ""
+        pares = []
+        for clave, valor in etiquetas.items():
+            valor = str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+            pares.append(f'{clave}="{valor}"')
+        return "{" + ",".join(pares) + "}"
+
+    def familia(self, nombre, tipo, ayuda):
+        self.lineas.append(f"# HELP {self.prefijo}_{nombre} {ayuda}")
+        self.lineas.append(f"# TYPE {self.prefijo}_{nombre} {tipo}")
+
+    def muestra(self, nombre, valor, **etiquetas):
+        if valor is not None:
+            self.lineas.append(f"{self.prefijo}_{nombre}{self._etiquetas(etiquetas)} {self._valor(valor)}")
+
+    def metrica(self, nombre, tipo, ayuda, valor, **etiquetas):
+        self.familia(nombre, tipo, ayuda)
+        self.muestra(nombre, valor, **etiquetas)
+
+    def histograma(self, nombre, ayuda, limites, conteos, suma, **etiquetas):
+        self.familia(nombre, "histogram", ayuda)
+        acumulado = 0
+        for limite, conteo in zip(limites, conteos):
+            acumulado += conteo
+            self.muestra(nombre + "_bucket", acumulado, le=self._valor(limite), **etiquetas)
+        self.muestra(nombre + "_bucket", sum(conteos), le="+Inf", **etiquetas)
+        self.muestra(nombre + "_sum", suma, **etiquetas)
+        self.muestra(nombre + "_count", sum(conteos), **etiquetas)
+
+    def texto(self):
+        return "\n".join(self.lineas) + "\n"
+
+
+class ExportadorMetricas:
+    TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, recolectar, puerto, host="0.0.0.0"):
+        self.recolectar = recolectar
+        self.puerto = puerto
+        self.host = host
+        self.servidor = None
+
+    def iniciar(self):
+        recolectar = self.recolectar
+        tipo_contenido = self.TIPO_CONTENIDO
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                cuerpo = recolectar().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", tipo_contenido)
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.servidor = ThreadingHTTPServer((self.host, self.puerto), Manejador)
+        except OSError as e:
+            print(f"[METRICAS] No se pudo abrir el puerto {self.puerto}: {e} - exportador desactivado")
+            return False
+        self.servidor.daemon_threads = True
+        Thread(target=self.servidor.serve_forever, daemon=True).start()
+        print(f"[METRICAS] Exportando en http://{self.host}:{self.servidor.server_address[1]}/metrics")
+        return True
+
+    def detener(self):
+        if self.servidor:
+            self.servidor.shutdown()
+            self.servidor.server_close()
+            self.servidor = None
+
+
+class PoolConexionesRabbit:
+    _pools = {}
+    _candado_pools = Lock()
+
+    def __init__(self, parametros):
+        self.parametros = parametros
+        self._local = local()
+        self._candado = Lock()
+        self.reconexiones = 0
+        self.cerradas_hilo_terminado = 0
+        # Conexion abierta por cada hilo: la de un hilo que ya termino no la usa ni la cierra nadie
+        self._por_hilo = {}
+
+    @classmethod
+    def compartido(cls, parametros):
+        clave = (parametros.host, parametros.port, parametros.credentials.username)
+        with cls._candado_pools:
+            if clave not in cls._pools:
+                cls._pools[clave] = cls(parametros)
+            return cls._pools[clave]
+
+    def _conexion_sana(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None or not conexion.is_open:
+            return False
+        # Un hilo ocioso no atiende los heartbeats: pasado el intervalo el broker ya cerro su conexion
+        latido = getattr(self.parametros, "heartbeat", None)
+        if isinstance(latido, (int, float)) and latido and time.monotonic() - getattr(self._local, "ultimo_uso", 0) > latido:
+            return False
+        try:
+            conexion.process_data_events(time_limit=0)
+            return True
+        except pika.exceptions.AMQPError:
+            return False
+
+    def _reconectar(self):
+        self.invalidar()
+        self._cerrar_hilos_terminados()
+        self._local.conexion = pika.BlockingConnection(self.parametros)
+        self._local.canal = self._local.conexion.channel()
+        with self._candado:
+            self.reconexiones += 1
+            self._por_hilo[current_thread()] = self._local.conexion
+
+    def _cerrar_hilos_terminados(self):
+        # Se barre al abrir otra conexion: el hilo propietario ya no existe, asi que no hay uso concurrente
+        with self._candado:
+            terminados = [hilo for hilo in self._por_hilo if not hilo.is_alive()]
+            conexiones = [self._por_hilo.pop(hilo) for hilo in terminados]
+            self.cerradas_hilo_terminado += len(conexiones)
+        for conexion in conexiones:
+            try:
+                if conexion.is_open:
+                    conexion.close()
+            except Exception:
+                pass
+
+    def obtener_canal(self):
+        # pika no es thread-safe: cada hilo mantiene su propia conexion persistente
+        if not self._conexion_sana():
+            self._reconectar()
+        if self._local.canal is None or not self._local.canal.is_open:
+            self._local.canal = self._local.conexion.channel()
+        self._local.ultimo_uso = time.monotonic()
+        return self._local.canal
+
+    def invalidar(self):
+        conexion = getattr(self._local, "conexion", None)
+        self._local.conexion = None
+        self._local.canal = None
+        if conexion is not None:
+            with self._candado:
+                self._por_hilo.pop(current_thread(), None)
+        if conexion and conexion.is_open:
+            try:
+                conexion.close()
+            except Exception:
+                pass
+
+    def ejecutar(self, operacion, reintentos=1):
+        for intento in range(reintentos + 1):
+            try:
+                return operacion(self.obtener_canal())
+            except pika.exceptions.AMQPConnectionError:
+                # Incluye StreamLostError y AMQPHeartbeatTimeout: socket perdido, se reconstruye la conexion
+                self.invalidar()
+                if intento == reintentos:
+                    raise
+            except pika.exceptions.AMQPChannelError:
+                self._local.canal = None
+                raise
+
+
+class CanalAsincronoPika:
+    # Unico punto que usa BlockingChannel._impl, API interna de pika: solo se activa en las versiones
+    # comprobadas; con cualquier otra CanalConfirmaciones recurre a confirm_delivery() bloqueante
+    VERSIONES_ADMITIDAS = ((1, 0), (2, 0))
+
+    @classmethod
+    def obtener(cls, canal):
+        try:
+            version = tuple(int(parte) for parte in pika.__version__.split(".")[:2])
+        except (AttributeError, ValueError):
+            return None
+        minima, limite = cls.VERSIONES_ADMITIDAS
+        impl = getattr(canal, "_impl", None)
+        if not minima <= version < limite or impl is None:
+            return None
+        return cls(impl)
+
+    def __init__(self, impl):
+        self.impl = impl
+
+    def confirmar_entregas(self, al_confirmar, al_activar):
+        self.impl.confirm_delivery(ack_nack_callback=al_confirmar, callback=al_activar)
+
+    def publicar(self, intercambio, clave_enrutamiento, cuerpo, propiedades):
+        self.impl.basic_publish(exchange=intercambio, routing_key=clave_enrutamiento, body=cuerpo, properties=propiedades)
+
+
+class CanalConfirmaciones:
+    # Conexion propia en modo confirmacion, fuera del pool: el lote se publica de corrido y se espera a los
+    # acks del broker una sola vez, en lugar de un viaje de ida y vuelta por mensaje
+    def __init__(self, parametros):
+        self.conexion = pika.BlockingConnection(parametros)
+        self.canal = self.conexion.channel()
+        self.secuencia = 0
+        self.pendientes = {}
+        self.confirmados = []
+        self.rechazados = []
+        self.asincrono = CanalAsincronoPika.obtener(self.canal)
+        if self.asincrono is None:
+            print(f"[PRODUCTOR] pika {getattr(pika, '__version__', '?')} sin confirmaciones asincronas: "
+                  f"se confirma cada publicacion")
+            self.canal.confirm_delivery()
+            return
+        listo = []
+        self.asincrono.confirmar_entregas(self._al_confirmar, listo.append)
+        while not listo:
+            self.conexion.process_data_events(time_limit=0.05)
+
+    def sano(self):
+        if not (self.conexion.is_open and self.canal.is_open):
+            return False
+        try:
+            self.conexion.process_data_events(time_limit=0)
+            return True
+        except pika.exceptions.AMQPError:
+            return False
+
+    def _al_confirmar(self, trama):
+        metodo = trama.method
+        destino = self.rechazados if isinstance(metodo, pika.spec.Basic.Nack) else self.confirmados
+        numeros = [n for n in self.pendientes if n <= metodo.delivery_tag] if metodo.multiple else [metodo.delivery_tag]
+        for numero in numeros:
+            if numero in self.pendientes:
+                destino.append(self.pendientes.pop(numero))
+
+    def publicar(self, envio, intercambio, clave_enrutamiento, cuerpo, propiedades):
+        if self.asincrono is None:
+            # BlockingChannel en modo confirmacion espera el ack de cada mensaje y lanza NackError si se rechaza
+            try:
+                self.canal.basic_publish(exchange=intercambio, routing_key=clave_enrutamiento, body=cuerpo,
+                                         properties=propiedades)
+                self.confirmados.append(envio)
+            except pika.exceptions.NackError:
+                self.rechazados.append(envio)
+            return
+        self.secuencia += 1
+        self.pendientes[self.secuencia] = envio
+        self.asincrono.publicar(intercambio, clave_enrutamiento, cuerpo, propiedades)
+
+    def esperar(self, tiempo_maximo=30.0):
+        limite = time.time() + tiempo_maximo
+        while self.pendientes and time.time() < limite:
+            self.conexion.process_data_events(time_limit=0.05)
+        if self.pendientes:
+            raise pika.exceptions.AMQPConnectionError(f"{len(self.pendientes)} publicaciones sin confirmar")
+        confirmados, self.confirmados = self.confirmados, []
+        rechazados, self.rechazados = self.rechazados, []
+        return confirmados, rechazados
+
+    def cerrar(self):
+        try:
+            if self.conexion.is_open:
+                self.conexion.close()
+        except Exception:
+            pass
+
+
 class ConexionRabbit:
     def __init__(self, host="10.163.238.60", port=5672, usuario="admin", contrasena="admin"):
         self.host = host
@@ -27,17 +379,19 @@ class ConexionRabbit:
         self.contrasena = contrasena
         self.conexion = None
         self.canal = None
+        self.pool = PoolConexionesRabbit.compartido(self.obtener_parametros())
 
-    def conectar(self):
-        credenciales = pika.PlainCredentials(self.usuario, self.contrasena)
-        parametros = pika.ConnectionParameters(
+    def obtener_parametros(self):
+        return pika.ConnectionParameters(
             host=self.host,
             port=self.puerto,
-            credentials=credenciales,
+            credentials=pika.PlainCredentials(self.usuario, self.contrasena),
             heartbeat=600,
             blocked_connection_timeout=300
         )
-        self.conexion = pika.BlockingConnection(parametros)
+
+    def conectar(self):
+        self.conexion = pika.BlockingConnection(self.obtener_parametros())
         self.canal = self.conexion.channel()
         return self.canal
 
@@ -46,7 +400,6 @@ class ConexionRabbit:
             self.conexion.close()
 
     def publicar_mensaje(self, cola, mensaje, persistente=False, ttl=None):
-        canal = self.conectar()
         propiedades = pika.BasicProperties(
             delivery_mode=2 if persistente else 1,
             content_type='application/json'
@@ -54,116 +407,388 @@ class ConexionRabbit:
         if ttl:
             propiedades.expiration = str(ttl)
         
-        canal.basic_publish(
+        self.pool.ejecutar(lambda canal: canal.basic_publish(
             exchange='',
             routing_key=cola,
             body=json.dumps(mensaje).encode() if isinstance(mensaje, dict) else mensaje,
             properties=propiedades
-        )
-        self.cerrar()
+        ))
 
 
 class PublicadorModelo(ConexionRabbit):
-    def __init__(self, cola="cola_modelo", ttl=300000, **kwargs):
+    def __init__(self, cola="cola_modelo", intercambio="modelos", ttl=300000, versiones_retenidas=8, **kwargs):
         super().__init__(**kwargs)
         self.cola = cola
+        self.intercambio = intercambio
         self.ttl = ttl
         self.version_modelo = None
+        self.modelos_publicados = 0
+        self.versiones_retenidas = versiones_retenidas
+        self.modelos = OrderedDict()
+        self.al_crear_version = None
 
     def publicar_modelo(self, texto_modelo):
         version_anterior = self.version_modelo
         self.version_modelo = str(uuid.uuid4())
-        
-        canal = self.conectar()
+        if self.al_crear_version:
+            # La cola de escenarios de la version existe antes de que los trabajadores reciban el anuncio
+            try:
+                self.al_crear_version(self.version_modelo)
+            except Exception as e:
+                print(f"[PRODUCTOR] Error preparando la version {self.version_modelo[:12]}: {e}")
         
         if version_anterior:
             try:
-                canal.queue_delete(queue=self.cola)
+                self.pool.ejecutar(lambda canal: canal.queue_delete(queue=self.cola))
                 print(f"[PRODUCTOR] Modelo anterior invalidado")
                 time.sleep(0.3)
             except Exception:
                 pass
 
-        canal.queue_declare(
-            queue=self.cola,
-            durable=False,
-            arguments={'x-message-ttl': self.ttl, 'x-max-length': 1}
-        )
-
         datos_modelo = {
             "version": self.version_modelo,
             "marca_tiempo": time.time(),
             "codigo": texto_modelo,
+            "metrica_salida": extraer_metrica_salida(texto_modelo),
             "estado": "activo"
         }
 
-        canal.basic_publish(
-            exchange='',
-            routing_key=self.cola,
-            body=json.dumps(datos_modelo).encode(),
-            properties=pika.BasicProperties(
-                delivery_mode=1,
-                expiration=str(self.ttl),
-                headers={'version-modelo': self.version_modelo}
+        self.modelos[self.version_modelo] = datos_modelo
+        while len(self.modelos) > self.versiones_retenidas:
+            self.modelos.popitem(last=False)
+        cuerpo = json.dumps(datos_modelo).encode()
+
+        def publicar(canal):
+            # cola_modelo solo queda como respaldo de arranque; los suscriptores reciben el modelo por el fanout
+            canal.queue_declare(
+                queue=self.cola,
+                durable=False,
+                arguments={'x-message-ttl': self.ttl, 'x-max-length': 1}
+            )
+            canal.basic_publish(
+                exchange='',
+                routing_key=self.cola,
+                body=cuerpo,
+                properties=pika.BasicProperties(
+                    delivery_mode=1,
+                    expiration=str(self.ttl),
+                    headers={'version-modelo': self.version_modelo}
+                )
+            )
+            canal.exchange_declare(exchange=self.intercambio, exchange_type='fanout', durable=True)
+            canal.basic_publish(
+                exchange=self.intercambio,
+                routing_key='',
+                body=cuerpo,
+                properties=pika.BasicProperties(
+                    content_type=TIPO_JSON,
+                    headers={'version-modelo': self.version_modelo}
+                )
             )
-        )
 
-        self.cerrar()
+        self.pool.ejecutar(publicar)
+        self.modelos_publicados += 1
         print(f"[PRODUCTOR] Nuevo modelo publicado - Version: {self.version_modelo[:12]}...")
         return self.version_modelo
 
 
+class RegistroModelos(ConexionRabbit):
+    def __init__(self, publicador_modelo, cola="registro_modelos", **kwargs):
+        super().__init__(**kwargs)
+        self.publicador_modelo = publicador_modelo
+        self.cola = cola
+        self.solicitudes_atendidas = 0
+        self.ejecutando = True
+
+    def iniciar(self):
+        Thread(target=self._bucle_atencion, daemon=True).start()
+        print(f"[PRODUCTOR] Registro de modelos atendiendo en '{self.cola}'")
+
+    def buscar(self, version=None):
+        modelos = self.publicador_modelo.modelos
+        if version is None:
+            version = self.publicador_modelo.version_modelo
+        return modelos.get(version)
+
+    def _al_solicitar(self, ch, metodo, props, cuerpo):
+        try:
+            version = json.loads(cuerpo.decode()).get("version")
+        except ValueError:
+            version = None
+        datos = self.buscar(version) or {"version": version, "error": "version desconocida"}
+        if props.reply_to:
+            ch.basic_publish(
+                exchange='',
+                routing_key=props.reply_to,
+                body=json.dumps(datos).encode(),
+                properties=pika.BasicProperties(content_type=TIPO_JSON, correlation_id=props.correlation_id)
+            )
+        ch.basic_ack(metodo.delivery_tag)
+        self.solicitudes_atendidas += 1
+
+    def _bucle_atencion(self):
+        while self.ejecutando:
+            try:
+                conexion = pika.BlockingConnection(self.obtener_parametros())
+                canal = conexion.channel()
+                canal.queue_declare(queue=self.cola, durable=False)
+                canal.basic_consume(queue=self.cola, on_message_callback=self._al_solicitar)
+                canal.start_consuming()
+            except Exception as e:
+                if self.ejecutando:
+                    print(f"[ADVERTENCIA] Reconectando registro de modelos: {e}")
+                    time.sleep(5)
+
+    def detener(self):
+        self.ejecutando = False
+
+
 class Notificador(ConexionRabbit):
     def __init__(self, cola, **kwargs):
         super().__init__(**kwargs)
         self.cola = cola
 
     def notificar(self, mensaje):
-        canal = self.conectar()
-        canal.queue_declare(queue=self.cola, durable=False)
-        canal.basic_publish(
-            exchange='',
-            routing_key=self.cola,
-            body=json.dumps(mensaje).encode()
-        )
-        self.cerrar()
+        def publicar(canal):
+            canal.queue_declare(queue=self.cola, durable=False)
+            canal.basic_publish(
+                exchange='',
+                routing_key=self.cola,
+                body=json.dumps(mensaje).encode()
+            )
+
+        self.pool.ejecutar(publicar)
+
+
+class OyenteControl(ConexionRabbit):
+    def __init__(self, al_convergencia, intercambio="control_simulacion", **kwargs):
+        super().__init__(**kwargs)
+        self.intercambio = intercambio
+        self.al_convergencia = al_convergencia
+        self.ejecutando = True
+
+    def iniciar_escucha(self):
+        Thread(target=self._bucle_escucha, daemon=True).start()
+        print("[PRODUCTOR] Escuchando senales de control...")
+
+    def _bucle_escucha(self):
+        while self.ejecutando:
+            try:
+                conexion = pika.BlockingConnection(self.obtener_parametros())
+                canal = conexion.channel()
+                canal.exchange_declare(exchange=self.intercambio, exchange_type='fanout')
+                cola = canal.queue_declare(queue='', exclusive=True).method.queue
+                canal.queue_bind(exchange=self.intercambio, queue=cola)
+
+                def callback(ch, metodo, props, cuerpo):
+                    datos = json.loads(cuerpo.decode())
+                    if datos.get("evento") == "convergencia_alcanzada":
+                        self.al_convergencia(datos)
+
+                canal.basic_consume(queue=cola, on_message_callback=callback, auto_ack=True)
+                canal.start_consuming()
+            except Exception as e:
+                if self.ejecutando:
+                    print(f"[ADVERTENCIA] Reconectando oyente de control: {e}")
+                    time.sleep(5)
+
+    def detener(self):
+        self.ejecutando = False
+
+
+class MonitorCapacidad(ConexionRabbit):
+    def __init__(self, intercambio="capacidad_trabajadores", caducidad=5.0, **kwargs):
+        super().__init__(**kwargs)
+        self.intercambio = intercambio
+        self.caducidad = caducidad
+        self.trabajadores = {}
+        self.consumidos = {}
+        self.al_consumir = None
+        self.anuncios_recibidos = 0
+        self.ejecutando = True
+
+    def iniciar_escucha(self):
+        Thread(target=self._bucle_escucha, daemon=True).start()
+        print("[PRODUCTOR] Escuchando capacidad de los trabajadores...")
+
+    def _al_anunciar(self, datos):
+        consumidor = datos.get("consumidor")
+        self.trabajadores[consumidor] = {
+            "capacidad": datos.get("capacidad"),
+            "tasa": datos.get("tasa", 0.0),
+            "marca": time.time()
+        }
+        # Los contadores son acumulados por version: se reparte solo el incremento desde el anuncio anterior
+        previos = self.consumidos.get(consumidor, {})
+        actuales = datos.get("consumidos") or {}
+        for version, cantidad in actuales.items():
+            incremento = cantidad - previos.get(version, 0)
+            if incremento < 0:
+                incremento = cantidad
+            if incremento and self.al_consumir:
+                self.al_consumir(version, incremento)
+        self.consumidos[consumidor] = actuales
+        self.anuncios_recibidos += 1
+
+    def activos(self):
+        limite = time.time() - self.caducidad
+        return {consumidor: datos for consumidor, datos in list(self.trabajadores.items()) if datos["marca"] >= limite}
+
+    def capacidad_total(self):
+        return sum(datos["capacidad"] or 0 for datos in self.activos().values())
+
+    def consumo_proyectado(self):
+        # Lo que la flota habra consumido desde su ultimo anuncio al ritmo observado en el anterior
+        ahora = time.time()
+        return sum(datos["tasa"] * (ahora - datos["marca"]) for datos in self.activos().values())
+
+    def _bucle_escucha(self):
+        while self.ejecutando:
+            try:
+                conexion = pika.BlockingConnection(self.obtener_parametros())
+                canal = conexion.channel()
+                canal.exchange_declare(exchange=self.intercambio, exchange_type='fanout')
+                cola = canal.queue_declare(queue='', exclusive=True).method.queue
+                canal.queue_bind(exchange=self.intercambio, queue=cola)
+
+                def callback(ch, metodo, props, cuerpo):
+                    try:
+                        self._al_anunciar(json.loads(cuerpo.decode()))
+                    except ValueError:
+                        pass
+
+                canal.basic_consume(queue=cola, on_message_callback=callback, auto_ack=True)
+                canal.start_consuming()
+            except Exception as e:
+                if self.ejecutando:
+                    print(f"[ADVERTENCIA] Reconectando monitor de capacidad: {e}")
+                    time.sleep(5)
+
+    def detener(self):
+        self.ejecutando = False
 
 
 class ProductorEscenariosContinuo(ConexionRabbit):
+    LIMITES_TAMANO_LOTE = (100, 250, 500, 1000, 2000, 5000, 10000, 50000)
+
     def __init__(self, cola="escenarios", escenarios_minimos=1000, 
-                 escenarios_maximos=50000, tamano_lote=500, **kwargs):
+                 escenarios_maximos=50000, tamano_lote=500, generacion_lote=True,
+                 semilla=None, escenarios_por_mensaje=500, enviar_distribuciones=True,
+                 tipo_contenido=TIPO_PREFERIDO, intercambio="escenarios", expiracion_cola=3600000,
+                 monitor_capacidad=None, segundos_trabajo=5.0, segundos_resincronizacion=30.0, **kwargs):
         super().__init__(**kwargs)
-        self.cola = cola
+        self.monitor_capacidad = monitor_capacidad
+        if monitor_capacidad:
+            monitor_capacidad.al_consumir = self.al_consumir
+        self.segundos_trabajo = segundos_trabajo
+        self.segundos_resincronizacion = segundos_resincronizacion if monitor_capacidad else 0.5
+        self.candado_credito = Lock()
+        self.evento_credito = Event()
+        self.escenarios_en_cola_estimados = 0
+        self.ultima_resincronizacion = 0
+        self.rechazos_cola = 0
+        self.espera_rechazo = 0.05
+        self.canal_confirmaciones = None
+        self.candado_publicacion = Lock()
+        # Mensajes ya codificados que la cola rechazo por estar llena: se reintentan antes de generar mas
+        self.envios_rechazados = []
+        self.siguiente_indice = 0
+        self.prefijo_cola = cola
+        self.intercambio = intercambio
+        self.expiracion_cola = expiracion_cola
+        self.cola = None
+        self.colas_preparadas = set()
+        self.colas_retiradas = 0
+        self.mensajes_obsoletos_descartados = 0
         self.escenarios_minimos = escenarios_minimos
         self.escenarios_maximos = escenarios_maximos
         self.tamano_lote = tamano_lote
+        self.generacion_lote = generacion_lote
+        self.semilla = semilla if semilla is not None else int(np.random.default_rng().integers(2**63))
+        self.generador = np.random.default_rng(self.semilla)
+        self.enviar_distribuciones = enviar_distribuciones
+        self.tipo_contenido = tipo_contenido if msgpack else TIPO_JSON
+        self.escenarios_por_mensaje = max(1, escenarios_por_mensaje)
         self.esta_ejecutando = False
         self.hilo_productor = None
         self.evento_detener = Event()
         self.escenarios_publicados = 0
+        self.mensajes_publicados = 0
+        self.bytes_publicados = 0
+        self.errores_publicacion = 0
+        self.conteos_tamano_lote = [0] * (len(self.LIMITES_TAMANO_LOTE) + 1)
+        self.suma_tamano_lote = 0
+        self.estado_cola = None
+        self.marca_estado_cola = None
         self.version_modelo_actual = None
         self._configurar_cola()
 
     def _configurar_cola(self):
+        # Los escenarios se enrutan por version de modelo; cada version tiene su propia cola
         try:
-            canal = self.conectar()
+            self.pool.ejecutar(lambda canal: canal.exchange_declare(
+                exchange=self.intercambio, exchange_type='topic', durable=True
+            ))
+            print(f"[PRODUCTOR] Intercambio '{self.intercambio}' configurado")
+        except Exception as e:
+            print(f"[PRODUCTOR] Error configurando intercambio: {e}")
+
+    def cola_version(self, version):
+        return f"{self.prefijo_cola}.{version}"
+
+    def preparar_cola_version(self, version):
+        cola = self.cola_version(version)
+        if cola in self.colas_preparadas:
+            return cola
+
+        def preparar(canal):
+            # x-expires elimina la cola si queda huerfana (productor caido antes de retirarla)
             canal.queue_declare(
-                queue=self.cola,
+                queue=cola,
                 durable=True,
                 arguments={
                     'x-max-length': self.escenarios_maximos,
                     'x-overflow': 'reject-publish',
                     'x-message-ttl': 3600000,
+                    'x-expires': self.expiracion_cola,
                     'x-queue-mode': 'lazy'
                 }
             )
-            self.cerrar()
-            print(f"[PRODUCTOR] Cola '{self.cola}' configurada")
+            canal.queue_bind(exchange=self.intercambio, queue=cola, routing_key=version)
+
+        self.pool.ejecutar(preparar)
+        self.colas_preparadas.add(cola)
+        print(f"[PRODUCTOR] Cola '{cola}' configurada")
+        return cola
+
+    def establecer_version_modelo(self, version):
+        anterior = self.cola
+        try:
+            cola = self.preparar_cola_version(version)
         except Exception as e:
             print(f"[PRODUCTOR] Error configurando cola: {e}")
+            cola = self.cola_version(version)
+        with self.candado_credito:
+            self.cola = cola
+            self.version_modelo_actual = version
+            self.escenarios_en_cola_estimados = 0
+            self.envios_rechazados = []
+        self.estado_cola = None
+        self.ultima_resincronizacion = 0
+        if anterior and anterior != cola:
+            self._retirar_cola(anterior)
 
-    def establecer_version_modelo(self, version):
-        self.version_modelo_actual = version
+    def _retirar_cola(self, cola):
+        # Lo que quede de la version reemplazada es trabajo obsoleto: se elimina la cola entera
+        try:
+            resultado = self.pool.ejecutar(lambda canal: canal.queue_delete(queue=cola))
+            descartados = resultado.method.message_count if resultado else 0
+            self.colas_retiradas += 1
+            self.mensajes_obsoletos_descartados += descartados
+            print(f"[PRODUCTOR] Cola '{cola}' retirada - {descartados} mensajes obsoletos descartados")
+        except Exception as e:
+            print(f"[PRODUCTOR] Error retirando cola '{cola}': {e}")
+        self.colas_preparadas.discard(cola)
 
     def _generar_distribuciones(self):
         return {
@@ -193,61 +818,231 @@ class ProductorEscenariosContinuo(ConexionRabbit):
             }
         }
 
+    def _generar_distribuciones_lote(self, cantidad):
+        generador = self.generador
+        return {
+            "uniforme": generador.random(cantidad),
+            "uniforme_rango": generador.uniform(0, 100, cantidad),
+            "normal_estandar": generador.normal(0, 1, cantidad),
+            "normal_personalizada": generador.normal(50, 15, cantidad),
+            "binomial": generador.binomial(100, 0.5, cantidad),
+            "poisson": generador.poisson(10, cantidad),
+            "bernoulli": generador.binomial(1, 0.3, cantidad),
+            "exponencial": generador.exponential(2, cantidad),
+            "gamma": generador.gamma(2, 2, cantidad),
+            "beta": generador.beta(2, 5, cantidad),
+        }
+
+    def _generar_escenarios_lote(self, indice_inicial, cantidad):
+        columnas = {}
+        if self.enviar_distribuciones:
+            columnas = {
+                nombre: valores.tolist()
+                for nombre, valores in self._generar_distribuciones_lote(cantidad).items()
+            }
+        nombres = list(columnas.keys())
+        semillas = derivar_semillas(self.semilla, np.arange(indice_inicial, indice_inicial + cantidad)).tolist()
+        marca_tiempo = time.time()
+        id_lote = uuid.uuid4().hex
+        metadatos = {
+            "marca_tiempo_lote": int(marca_tiempo),
+            "tipos_distribucion": nombres
+        }
+        filas = zip(*columnas.values()) if columnas else [()] * cantidad
+        escenarios = []
+        for i, (semilla, fila) in enumerate(zip(semillas, filas)):
+            escenario = {
+                "id": f"{id_lote}-{indice_inicial + i}",
+                "indice": indice_inicial + i,
+                "semilla": semilla,
+                "marca_tiempo": marca_tiempo,
+                "version_modelo": self.version_modelo_actual,
+                "metadatos": metadatos
+            }
+            if nombres:
+                escenario["distribuciones"] = dict(zip(nombres, fila))
+            escenarios.append(escenario)
+        return escenarios
+
+    def _generar_bloques(self, indice_inicial, cantidad):
+        columnas = self._generar_distribuciones_lote(cantidad) if self.enviar_distribuciones else {}
+        marca_tiempo = time.time()
+        id_lote = uuid.uuid4().hex
+        bloques = []
+        for inicio in range(0, cantidad, self.escenarios_por_mensaje):
+            fin = min(inicio + self.escenarios_por_mensaje, cantidad)
+            bloque = {
+                "tipo": "bloque_escenarios",
+                "id_lote": id_lote,
+                "indice_inicial": indice_inicial + inicio,
+                "cantidad": fin - inicio,
+                "semilla": self.semilla,
+                "marca_tiempo": marca_tiempo,
+                "version_modelo": self.version_modelo_actual
+            }
+            if columnas:
+                # En binario cada columna viaja como buffer little-endian; en JSON como lista
+                bloque["distribuciones"] = {
+                    nombre: valores[inicio:fin] if self.tipo_contenido == TIPO_MSGPACK else valores[inicio:fin].tolist()
+                    for nombre, valores in columnas.items()
+                }
+            bloques.append(bloque)
+        return bloques
+
     def _obtener_estado_cola(self):
+        cola = self.cola
         try:
-            canal = self.conectar()
-            info = canal.queue_declare(queue=self.cola, passive=True)
-            resultado = {
+            info = self.pool.ejecutar(lambda canal: canal.queue_declare(queue=cola, passive=True))
+            escenarios_en_cola = info.method.message_count * self.escenarios_por_mensaje
+            self.estado_cola = {
                 "cantidad_mensajes": info.method.message_count,
+                "escenarios_en_cola": escenarios_en_cola,
                 "cantidad_consumidores": info.method.consumer_count,
-                "necesita_mas": info.method.message_count < self.escenarios_minimos
+                "necesita_mas": escenarios_en_cola < self.escenarios_minimos
             }
-            self.cerrar()
-            return resultado
+            self.marca_estado_cola = time.time()
+            return self.estado_cola
         except Exception:
-            return {"cantidad_mensajes": 0, "cantidad_consumidores": 0, "necesita_mas": True}
+            return {"cantidad_mensajes": 0, "escenarios_en_cola": 0, "cantidad_consumidores": 0, "necesita_mas": True}
+
+    def al_consumir(self, version, cantidad):
+        if version != self.version_modelo_actual:
+            return
+        with self.candado_credito:
+            self.escenarios_en_cola_estimados = max(0, self.escenarios_en_cola_estimados - cantidad)
+        self.evento_credito.set()
+
+    def objetivo_cola(self):
+        # segundos_trabajo de la capacidad anunciada por la flota, acotado por los limites de la cola
+        capacidad = self.monitor_capacidad.capacidad_total() if self.monitor_capacidad else 0
+        return int(min(max(capacidad * self.segundos_trabajo, self.escenarios_minimos), self.escenarios_maximos))
+
+    def credito_disponible(self):
+        proyectado = self.monitor_capacidad.consumo_proyectado() if self.monitor_capacidad else 0
+        return self.objetivo_cola() - max(0, self.escenarios_en_cola_estimados - int(proyectado))
+
+    def _resincronizar(self):
+        # La estimacion deriva con TTL, reentregas o trabajadores caidos: se corrige con la cola real de vez en cuando
+        self.ultima_resincronizacion = time.time()
+        version = self.version_modelo_actual
+        estado = self._obtener_estado_cola()
+        if self.marca_estado_cola and self.marca_estado_cola >= self.ultima_resincronizacion:
+            with self.candado_credito:
+                if version == self.version_modelo_actual:
+                    self.escenarios_en_cola_estimados = estado["escenarios_en_cola"]
+
+    def _canal_confirmado(self):
+        if self.canal_confirmaciones is None or not self.canal_confirmaciones.sano():
+            self._cerrar_canal_confirmaciones()
+            self.canal_confirmaciones = CanalConfirmaciones(self.obtener_parametros())
+        return self.canal_confirmaciones
+
+    def _cerrar_canal_confirmaciones(self):
+        if self.canal_confirmaciones:
+            self.canal_confirmaciones.cerrar()
+            self.canal_confirmaciones = None
+
+    def _preparar_envios(self, version, cantidad):
+        # Primero lo rechazado de esta version, luego indices nuevos hasta cubrir la cantidad pedida
+        with self.candado_credito:
+            pendientes = [envio for envio in self.envios_rechazados if envio[1] == version]
+            self.envios_rechazados = []
+        envios, cubiertos = [], 0
+        while pendientes and cubiertos < cantidad:
+            envio = pendientes.pop(0)
+            envios.append(envio)
+            cubiertos += envio[0]
+        with self.candado_credito:
+            self.envios_rechazados = pendientes + self.envios_rechazados
+        restantes = cantidad - cubiertos
+        if restantes <= 0:
+            return envios
+        if self.escenarios_por_mensaje > 1:
+            mensajes = self._generar_bloques(self.siguiente_indice, restantes)
+        elif self.generacion_lote:
+            mensajes = self._generar_escenarios_lote(self.siguiente_indice, restantes)
+        else:
+            mensajes = (self._generar_escenario(self.siguiente_indice + i) for i in range(restantes))
+        self.siguiente_indice += restantes
+        envios.extend(
+            (mensaje.get("cantidad", 1), mensaje["version_modelo"], codificar_mensaje(mensaje, self.tipo_contenido))
+            for mensaje in mensajes
+        )
+        return envios
 
     def _publicar_lote(self, cantidad):
-        if cantidad <= 0:
+        version = self.version_modelo_actual
+        if cantidad <= 0 or not version:
             return 0
-        try:
-            canal = self.conectar()
-            for i in range(cantidad):
-                escenario = self._generar_escenario(self.escenarios_publicados + i)
-                canal.basic_publish(
-                    exchange='',
-                    routing_key=self.cola,
-                    body=json.dumps(escenario, cls=CodificadorNumpy).encode(),
-                    properties=pika.BasicProperties(
+        with self.candado_publicacion:
+            envios = []
+            try:
+                envios = self._preparar_envios(version, cantidad)
+                canal = self._canal_confirmado()
+                for envio in envios:
+                    cantidad_mensaje, version_mensaje, cuerpo = envio
+                    canal.publicar(envio, self.intercambio, version_mensaje, cuerpo, pika.BasicProperties(
                         delivery_mode=2,
-                        content_type='application/json'
-                    )
-                )
-            self.cerrar()
-            self.escenarios_publicados += cantidad
-            return cantidad
-        except Exception as e:
-            print(f"[PRODUCTOR] Error publicando lote: {e}")
-            return 0
+                        content_type=self.tipo_contenido,
+                        headers={
+                            'version-modelo': version_mensaje,
+                            'cantidad-escenarios': cantidad_mensaje
+                        }
+                    ))
+                confirmados, rechazados = canal.esperar()
+            except Exception as e:
+                # Sin confirmacion no se sabe que llego: se reintenta todo (los resultados se deduplican por indice)
+                self.errores_publicacion += 1
+                self._cerrar_canal_confirmaciones()
+                with self.candado_credito:
+                    if version == self.version_modelo_actual:
+                        self.envios_rechazados = envios + self.envios_rechazados
+                print(f"[PRODUCTOR] Error publicando lote: {e}")
+                return 0
+
+        if rechazados:
+            # x-overflow reject-publish: la cola esta llena; esos mensajes se reintentan en el siguiente lote
+            self.rechazos_cola += 1
+            self.ultima_resincronizacion = 0
+            with self.candado_credito:
+                if version == self.version_modelo_actual:
+                    self.envios_rechazados = rechazados + self.envios_rechazados
+        escenarios = sum(envio[0] for envio in confirmados)
+        self.escenarios_publicados += escenarios
+        self.mensajes_publicados += len(confirmados)
+        self.bytes_publicados += sum(len(envio[2]) for envio in confirmados)
+        with self.candado_credito:
+            if version == self.version_modelo_actual:
+                self.escenarios_en_cola_estimados += escenarios
+        if escenarios:
+            self.conteos_tamano_lote[bisect.bisect_left(self.LIMITES_TAMANO_LOTE, escenarios)] += 1
+            self.suma_tamano_lote += escenarios
+        return escenarios
 
     def _ciclo_produccion(self):
+        # Produccion por credito: lo consumido que anuncian los trabajadores libera hueco hasta el objetivo,
+        # y un nack de la cola llena frena hasta el siguiente anuncio en lugar de consultar su profundidad
         while not self.evento_detener.is_set():
             try:
-                estado = self._obtener_estado_cola()
-                cantidad_actual = estado["cantidad_mensajes"]
-                
-                if cantidad_actual < self.escenarios_minimos:
-                    necesarios = min(self.escenarios_minimos - cantidad_actual, self.tamano_lote)
-                    if estado["cantidad_consumidores"] > 0 and cantidad_actual < (self.escenarios_minimos // 2):
-                        necesarios = min(necesarios * 2, self.tamano_lote * 2)
-                    
-                    if necesarios > 0:
-                        generados = self._publicar_lote(necesarios)
-                        if generados > 0:
-                            print(f"[PRODUCTOR] +{generados} escenarios | Total: {self.escenarios_publicados}")
-
-                tiempo_espera = 0.5 if cantidad_actual < (self.escenarios_minimos // 2) else 3.0
-                time.sleep(tiempo_espera)
+                self.evento_credito.clear()
+                if time.time() - self.ultima_resincronizacion >= self.segundos_resincronizacion:
+                    self._resincronizar()
+
+                credito = self.credito_disponible()
+                if credito > 0 and credito >= min(self.escenarios_por_mensaje, self.objetivo_cola()):
+                    solicitados = min(credito, self.tamano_lote)
+                    generados = self._publicar_lote(solicitados)
+                    if generados > 0:
+                        print(f"[PRODUCTOR] +{generados} escenarios | Total: {self.escenarios_publicados}")
+                    if generados == solicitados:
+                        self.espera_rechazo = 0.05
+                        continue
+                    if generados < solicitados and self.ultima_resincronizacion == 0:
+                        # Nack de la cola llena: espera exponencial hasta que los trabajadores liberen hueco
+                        self.evento_detener.wait(self.espera_rechazo)
+                        self.espera_rechazo = min(self.espera_rechazo * 2, 1.0)
+                        continue
+                self.evento_credito.wait(1.0)
             except Exception as e:
                 print(f"[PRODUCTOR] Error en ciclo: {e}")
                 time.sleep(10)
@@ -260,9 +1055,8 @@ class ProductorEscenariosContinuo(ConexionRabbit):
         self.esta_ejecutando = True
         self.evento_detener.clear()
         
-        estado = self._obtener_estado_cola()
-        if estado["cantidad_mensajes"] < self.escenarios_minimos:
-            self._publicar_lote(self.escenarios_minimos - estado["cantidad_mensajes"])
+        self._resincronizar()
+        self._publicar_lote(self.credito_disponible())
         
         self.hilo_productor = Thread(target=self._ciclo_produccion, daemon=True)
         self.hilo_productor.start()
@@ -275,21 +1069,80 @@ class ProductorEscenariosContinuo(ConexionRabbit):
         self.evento_detener.set()
         if self.hilo_productor and self.hilo_productor.is_alive():
             self.hilo_productor.join(timeout=10)
+        with self.candado_publicacion:
+            self._cerrar_canal_confirmaciones()
         print(f"[PRODUCTOR] Detenido - Total publicados: {self.escenarios_publicados}")
 
+    def purgar_cola(self):
+        cola = self.cola
+        if not cola:
+            return 0
+        try:
+            purgados = self.pool.ejecutar(lambda canal: canal.queue_purge(queue=cola)).method.message_count
+            print(f"[PRODUCTOR] Cola '{cola}' purgada - {purgados} mensajes descartados")
+            return purgados
+        except Exception as e:
+            print(f"[PRODUCTOR] Error purgando cola: {e}")
+            return 0
+
+    def registrar_metricas(self, registro):
+        # Solo se lee el ultimo estado de cola consultado por el ciclo de produccion: el scrape no toca el broker
+        registro.metrica("escenarios_publicados_total", "counter", "Escenarios publicados en la cola", self.escenarios_publicados)
+        registro.metrica("mensajes_publicados_total", "counter", "Mensajes publicados en la cola", self.mensajes_publicados)
+        registro.metrica("bytes_publicados_total", "counter", "Bytes de cuerpo publicados", self.bytes_publicados)
+        registro.metrica("errores_publicacion_total", "counter", "Lotes fallidos al publicar", self.errores_publicacion)
+        registro.metrica("rechazos_cola_total", "counter", "Mensajes rechazados por la cola llena (nack del broker)", self.rechazos_cola)
+        registro.metrica("colas_retiradas_total", "counter", "Colas de versiones reemplazadas eliminadas", self.colas_retiradas)
+        registro.metrica("mensajes_obsoletos_descartados_total", "counter",
+                         "Mensajes de versiones reemplazadas descartados al retirar su cola", self.mensajes_obsoletos_descartados)
+        registro.histograma(
+            "tamano_lote_escenarios", "Escenarios por lote de reposicion",
+            self.LIMITES_TAMANO_LOTE, self.conteos_tamano_lote, self.suma_tamano_lote
+        )
+        registro.metrica("produccion_activa", "gauge", "1 si el ciclo de produccion esta en marcha", int(self.esta_ejecutando))
+        registro.metrica("escenarios_minimos", "gauge", "Umbral de reposicion de la cola", self.escenarios_minimos)
+        registro.metrica("objetivo_cola_escenarios", "gauge", "Escenarios que se mantienen en cola segun la capacidad de la flota",
+                         self.objetivo_cola())
+        registro.metrica("cola_escenarios_estimados", "gauge", "Escenarios en cola segun publicaciones confirmadas y consumos anunciados",
+                         self.escenarios_en_cola_estimados)
+        if self.monitor_capacidad:
+            activos = self.monitor_capacidad.activos()
+            registro.metrica("capacidad_flota_escenarios_por_segundo", "gauge", "Capacidad anunciada por los trabajadores activos",
+                             sum(datos["capacidad"] or 0 for datos in activos.values()))
+            registro.metrica("trabajadores_activos", "gauge", "Trabajadores con anuncio de capacidad reciente", len(activos))
+            registro.metrica("anuncios_capacidad_total", "counter", "Anuncios de capacidad recibidos",
+                             self.monitor_capacidad.anuncios_recibidos)
+        if self.estado_cola:
+            registro.metrica("cola_mensajes", "gauge", "Mensajes en la cola en la ultima consulta", self.estado_cola["cantidad_mensajes"])
+            registro.metrica("cola_escenarios", "gauge", "Escenarios en la cola en la ultima consulta", self.estado_cola["escenarios_en_cola"])
+            registro.metrica("cola_consumidores", "gauge", "Consumidores de la cola en la ultima consulta", self.estado_cola["cantidad_consumidores"])
+            registro.metrica("cola_antiguedad_segundos", "gauge", "Segundos desde la ultima consulta de la cola", time.time() - self.marca_estado_cola)
+
     def obtener_estado_detallado(self):
         estado_cola = self._obtener_estado_cola()
         return {
             "produccion": {
                 "esta_ejecutando": self.esta_ejecutando,
                 "total_publicados": self.escenarios_publicados,
-                "modelo_actual": self.version_modelo_actual
+                "modelo_actual": self.version_modelo_actual,
+                "semilla": self.semilla
+            },
+            "cola": dict(estado_cola, nombre=self.cola),
+            "credito": {
+                "objetivo": self.objetivo_cola(),
+                "escenarios_estimados": self.escenarios_en_cola_estimados,
+                "capacidad_flota": self.monitor_capacidad.capacidad_total() if self.monitor_capacidad else None,
+                "trabajadores_activos": len(self.monitor_capacidad.activos()) if self.monitor_capacidad else None,
+                "segundos_trabajo": self.segundos_trabajo,
+                "rechazos_cola": self.rechazos_cola,
+                "mensajes_por_reintentar": len(self.envios_rechazados)
             },
-            "cola": estado_cola,
             "limites": {
                 "escenarios_minimos": self.escenarios_minimos,
                 "escenarios_maximos": self.escenarios_maximos,
-                "tamano_lote": self.tamano_lote
+                "tamano_lote": self.tamano_lote,
+                "escenarios_por_mensaje": self.escenarios_por_mensaje,
+                "tipo_contenido": self.tipo_contenido
             }
         }
 
@@ -302,19 +1155,32 @@ class ProductorMonteCarloContinuo:
         "contrasena": "admin"
     }
 
-    def __init__(self, archivo_modelo="trafico.txt", escenarios_minimos=2000, escenarios_maximos=50000):
+    def __init__(self, archivo_modelo="trafico.txt", escenarios_minimos=2000, escenarios_maximos=50000,
+                 semilla=None, escenarios_por_mensaje=500, enviar_distribuciones=True, puerto_metricas=9101,
+                 segundos_trabajo=5.0):
         self.archivo_modelo = archivo_modelo
         self.version_modelo_actual = None
+        self.convergencias = 0
+        self.exportador_metricas = ExportadorMetricas(self.recolectar_metricas, puerto_metricas) if puerto_metricas else None
         
         self.publicador_modelo = PublicadorModelo(**self.CONFIG_RABBIT)
+        self.registro_modelos = RegistroModelos(self.publicador_modelo, **self.CONFIG_RABBIT)
         self.notificador_actualizaciones = Notificador(cola="actualizaciones_modelo", **self.CONFIG_RABBIT)
         self.notificador_dashboard = Notificador(cola="dashboard_actualizaciones", **self.CONFIG_RABBIT)
+        self.oyente_control = OyenteControl(al_convergencia=self._al_convergencia, **self.CONFIG_RABBIT)
+        self.monitor_capacidad = MonitorCapacidad(**self.CONFIG_RABBIT)
         self.productor_escenarios = ProductorEscenariosContinuo(
             escenarios_minimos=escenarios_minimos,
             escenarios_maximos=escenarios_maximos,
             tamano_lote=1000,
+            semilla=semilla,
+            escenarios_por_mensaje=escenarios_por_mensaje,
+            enviar_distribuciones=enviar_distribuciones,
+            monitor_capacidad=self.monitor_capacidad,
+            segundos_trabajo=segundos_trabajo,
             **self.CONFIG_RABBIT
         )
+        self.publicador_modelo.al_crear_version = self.productor_escenarios.preparar_cola_version
 
     def cargar_modelo(self):
         try:
@@ -334,8 +1200,13 @@ class ProductorMonteCarloContinuo:
             return False
         
         self.version_modelo_actual = self.publicador_modelo.publicar_modelo(texto_modelo)
+        self.registro_modelos.iniciar()
         self.productor_escenarios.establecer_version_modelo(self.version_modelo_actual)
+        self.monitor_capacidad.iniciar_escucha()
         self.productor_escenarios.iniciar_produccion()
+        self.oyente_control.iniciar_escucha()
+        if self.exportador_metricas:
+            self.exportador_metricas.iniciar()
         
         print("Sistema inicializado correctamente")
         return True
@@ -359,6 +1230,7 @@ class ProductorMonteCarloContinuo:
             "evento": "modelo_cambiado",
             "nueva_version": nueva_version,
             "archivo_modelo": self.archivo_modelo,
+            "metrica_salida": extraer_metrica_salida(texto_modelo),
             "marca_tiempo": time.time()
         })
         
@@ -369,9 +1241,32 @@ class ProductorMonteCarloContinuo:
         })
         
         self.version_modelo_actual = nueva_version
+        self.productor_escenarios.iniciar_produccion()
         print(f"Modelo actualizado: {nueva_version[:12]}...")
         return True
 
+    def _al_convergencia(self, datos):
+        if datos.get("version_modelo") != self.version_modelo_actual:
+            return
+        print(f"\n[PRODUCTOR] Convergencia alcanzada en '{datos.get('metrica')}': "
+              f"media {datos.get('media'):.6g} +/- {datos.get('semiancho'):.3g} con {datos.get('n')} muestras")
+        self.convergencias += 1
+        self.productor_escenarios.detener_produccion()
+        self.productor_escenarios.purgar_cola()
+
+    def recolectar_metricas(self):
+        registro = RegistroMetricas("montecarlo_productor")
+        self.productor_escenarios.registrar_metricas(registro)
+        registro.metrica("modelos_publicados_total", "counter", "Versiones de modelo publicadas", self.publicador_modelo.modelos_publicados)
+        registro.metrica("solicitudes_registro_total", "counter", "Solicitudes de modelo atendidas por el registro",
+                         self.registro_modelos.solicitudes_atendidas)
+        registro.metrica("convergencias_total", "counter", "Paradas por convergencia de la metrica OUTPUT", self.convergencias)
+        if self.version_modelo_actual:
+            registro.metrica("modelo_info", "gauge", "Modelo en produccion", 1,
+                             version=self.version_modelo_actual, archivo=self.archivo_modelo)
+        registro.metrica("memoria_residente_bytes", "gauge", "Memoria residente del proceso", memoria_residente())
+        return registro.texto()
+
     def ejecutar_consola_gestion(self):
         if not self.inicializar_sistema():
             return
@@ -400,22 +1295,30 @@ class ProductorMonteCarloContinuo:
         except KeyboardInterrupt:
             print("\nInterrumpido por usuario")
         finally:
+            self.oyente_control.detener()
+            self.monitor_capacidad.detener()
+            self.registro_modelos.detener()
             self.productor_escenarios.detener_produccion()
+            if self.exportador_metricas:
+                self.exportador_metricas.detener()
 
     def _mostrar_estado(self):
         estado = self.productor_escenarios.obtener_estado_detallado()
         print(f"\nESTADO DEL SISTEMA:")
         print(f"  Modelo: {estado['produccion']['modelo_actual'][:12]}...")
         print(f"  Produccion: {'ACTIVA' if estado['produccion']['esta_ejecutando'] else 'DETENIDA'}")
-        print(f"  En cola: {estado['cola']['cantidad_mensajes']}")
+        print(f"  Semilla: {estado['produccion']['semilla']}")
+        print(f"  En cola: {estado['cola']['escenarios_en_cola']}")
         print(f"  Consumidores: {estado['cola']['cantidad_consumidores']}")
+        print(f"  Capacidad flota: {estado['credito']['capacidad_flota'] or 0:.0f} escenarios/s "
+              f"({estado['credito']['trabajadores_activos']} trabajadores) | Objetivo: {estado['credito']['objetivo']}")
 
     def _mostrar_estadisticas(self):
         estado = self.productor_escenarios.obtener_estado_detallado()
         print(f"\nESTADISTICAS:")
         print(f"  Minimo: {estado['limites']['escenarios_minimos']}")
         print(f"  Maximo: {estado['limites']['escenarios_maximos']}")
-        print(f"  En cola: {estado['cola']['cantidad_mensajes']}")
+        print(f"  En cola: {estado['cola']['escenarios_en_cola']}")
         print(f"  Total publicados: {estado['produccion']['total_publicados']}")
 
 
@@ -0,0 +1,425 @@
+# result-sink.py
+import os
+import re
+import pika
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from collections import defaultdict
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+TIPO_JSON = "application/json"
+TIPO_MSGPACK = "application/x-msgpack"
+
+
+def _desempaquetar_numpy(obj):
+    if obj.get("__ndarray__"):
+        return np.frombuffer(obj["datos"], dtype=np.dtype(obj["dtype"])).reshape(obj["forma"])
+    return obj
+
+
+def decodificar_mensaje(cuerpo, tipo_contenido=None):
+    if tipo_contenido == TIPO_MSGPACK:
+        if not msgpack:
+            raise ValueError("Mensaje msgpack recibido pero 'msgpack' no esta instalado")
+        return msgpack.unpackb(cuerpo, object_hook=_desempaquetar_numpy, raw=False)
+    return json.loads(cuerpo)
+
+
+def _escribir_sincronizado(ruta, escribir):
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb", buffering=1 << 20) as f:
+        escribir(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+def _sincronizar_directorio(ruta):
+    descriptor = os.open(ruta, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class MapaBitsIndices:
+    # Indices globales del productor ya vistos en una version; arranca en el primero recibido
+    def __init__(self):
+        self.base = None
+        self.bits = bytearray()
+
+    def _cubrir(self, minimo, maximo):
+        if self.base is None:
+            self.base = minimo - minimo % 8
+        if minimo < self.base:
+            necesarios = (self.base - (minimo - minimo % 8)) // 8
+            agregados = min(max(necesarios, len(self.bits)), self.base // 8)
+            self.bits[:0] = bytes(agregados)
+            self.base -= agregados * 8
+        byte = (maximo - self.base) // 8
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(max(byte + 1 - len(self.bits), len(self.bits))))
+
+    def contiene_lote(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        contenidos = np.zeros(indices.size, dtype=bool)
+        if self.base is None or indices.size == 0:
+            return contenidos
+        relativos = indices - self.base
+        dentro = (relativos >= 0) & (relativos < len(self.bits) * 8)
+        relativos = relativos[dentro]
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        contenidos[dentro] = (bits[relativos >> 3] & (1 << (relativos & 7)).astype(np.uint8)) != 0
+        return contenidos
+
+    def probar_y_marcar_lote(self, indices):
+        # True en la primera aparicion de cada indice no marcado antes
+        indices = np.asarray(indices, dtype=np.int64)
+        nuevos = np.zeros(indices.size, dtype=bool)
+        if indices.size == 0:
+            return nuevos
+        unicos, primeras = np.unique(indices, return_index=True)
+        self._cubrir(int(unicos[0]), int(unicos[-1]))
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        relativos = unicos - self.base
+        posiciones = relativos >> 3
+        mascaras = (1 << (relativos & 7)).astype(np.uint8)
+        nuevos[primeras] = (bits[posiciones] & mascaras) == 0
+        np.bitwise_or.at(bits, posiciones, mascaras)
+        return nuevos
+
+
+class BufferColumnas:
+    COLUMNAS_FIJAS = {
+        "id_escenario": "S",
+        "indice": np.int64,
+        "consumidor": "S",
+        "marca_tiempo": np.float64,
+        "tiempo_procesamiento": np.float64,
+        "exito": np.bool_
+    }
+
+    def __init__(self):
+        self.filas = 0
+        self.columnas = defaultdict(list)
+        self.metricas = defaultdict(list)
+        self.marca_inicio = None
+        self.lotes = []
+        # Indices en el buffer: pasan a los persistidos solo cuando la parte queda en disco
+        self.pendientes = MapaBitsIndices()
+
+    def agregar(self, resultado, consumidor):
+        if self.marca_inicio is None:
+            self.marca_inicio = time.time()
+        indice = resultado.get("indice")
+        self.columnas["id_escenario"].append(str(resultado.get("id_escenario", "")).encode())
+        self.columnas["indice"].append(-1 if indice is None else indice)
+        self.columnas["consumidor"].append(str(consumidor or "").encode())
+        self.columnas["marca_tiempo"].append(resultado.get("marca_tiempo", 0.0))
+        self.columnas["tiempo_procesamiento"].append(resultado.get("tiempo_procesamiento", 0.0))
+        self.columnas["exito"].append(resultado.get("exito", True))
+
+        valores = resultado.get("resultado")
+        if isinstance(valores, dict):
+            for nombre, valor in valores.items():
+                if isinstance(valor, (int, float)) and nombre not in self.metricas:
+                    # Metrica nueva: se rellena con NaN las filas previas del buffer
+                    self.metricas[nombre] = [np.nan] * self.filas
+        else:
+            valores = {}
+        for nombre, columna in self.metricas.items():
+            valor = valores.get(nombre)
+            columna.append(float(valor) if isinstance(valor, (int, float)) else np.nan)
+        self.filas += 1
+
+    def arreglos(self):
+        arreglos = {nombre: np.array(valores, dtype=self.COLUMNAS_FIJAS[nombre]) for nombre, valores in self.columnas.items()}
+        for nombre, valores in self.metricas.items():
+            arreglos["resultado." + nombre] = np.array(valores, dtype=np.float64)
+        return arreglos
+
+
+class EscritorColumnas:
+    def __init__(self, directorio_base, filas_por_parte=1000000):
+        self.directorio_base = directorio_base
+        self.filas_por_parte = filas_por_parte
+        self.buffers = {}
+        self.partes_escritas = 0
+        self.filas_escritas = 0
+        self.lotes_descartados = 0
+        self.filas_descartadas = 0
+        # Reintentos del productor y reentregas sin id_lote repiten escenarios: una fila por (version, indice)
+        self.indices_persistidos = defaultdict(MapaBitsIndices)
+        # Lotes ya en disco cuya confirmacion al broker puede no haber llegado: su reentrega se ignora
+        self.lotes_persistidos = set()
+        os.makedirs(directorio_base, exist_ok=True)
+        self.reconciliar()
+
+    @staticmethod
+    def nombre_seguro(nombre):
+        return re.sub(r'[^\w.-]', '_', str(nombre))
+
+    def reconciliar(self):
+        # Una caida entre mover la parte y escribir el manifiesto deja directorios huerfanos:
+        # se eliminan los que el manifiesto no recoge junto con los temporales a medio escribir
+        eliminados = 0
+        for nombre_version in os.listdir(self.directorio_base):
+            directorio_version = os.path.join(self.directorio_base, nombre_version)
+            if not os.path.isdir(directorio_version):
+                continue
+            manifiesto = self._leer_manifiesto(directorio_version)
+            registradas = {parte["directorio"] for parte in manifiesto["partes"]}
+            for nombre in os.listdir(directorio_version):
+                if nombre.endswith(".tmp") or (nombre.startswith("parte-") and nombre not in registradas):
+                    self._eliminar(os.path.join(directorio_version, nombre))
+                    eliminados += 1
+            if manifiesto["partes"]:
+                self.lotes_persistidos.update(manifiesto["partes"][-1].get("lotes", []))
+            self._cargar_indices(directorio_version, manifiesto)
+        if eliminados:
+            print(f"[SUMIDERO] {eliminados} restos de escrituras interrumpidas eliminados")
+
+    def _cargar_indices(self, directorio_version, manifiesto):
+        mapa = self.indices_persistidos[manifiesto["version_modelo"]]
+        for parte in manifiesto["partes"]:
+            archivo = parte["columnas"].get("indice")
+            if not archivo:
+                continue
+            indices = np.load(os.path.join(directorio_version, parte["directorio"], archivo), mmap_mode='r')
+            for desde in range(0, indices.size, self.filas_por_parte):
+                bloque = np.asarray(indices[desde:desde + self.filas_por_parte])
+                mapa.probar_y_marcar_lote(bloque[bloque >= 0])
+
+    @staticmethod
+    def _eliminar(ruta):
+        if os.path.isdir(ruta):
+            shutil.rmtree(ruta)
+        elif os.path.exists(ruta):
+            os.remove(ruta)
+
+    def agregar_lote(self, version, consumidor, resultados, id_lote=None):
+        if id_lote is not None and id_lote in self.lotes_persistidos:
+            self.lotes_descartados += 1
+            return
+        version = version or "sin_version"
+        buffer = self.buffers.setdefault(version, BufferColumnas())
+        indices = np.array([-1 if r.get("indice") is None else r["indice"] for r in resultados], dtype=np.int64)
+        # Sin indice no hay forma de reconocer la repeticion: esas filas se guardan siempre
+        conservar = indices < 0
+        con_indice = ~conservar
+        if con_indice.any():
+            candidatos = indices[con_indice]
+            nuevos = buffer.pendientes.probar_y_marcar_lote(candidatos)
+            if version in self.indices_persistidos:
+                nuevos &= ~self.indices_persistidos[version].contiene_lote(candidatos)
+            conservar[con_indice] = nuevos
+        self.filas_descartadas += conservar.size - int(np.count_nonzero(conservar))
+        for resultado, guardar in zip(resultados, conservar):
+            if guardar:
+                buffer.agregar(resultado, consumidor)
+        if id_lote is not None:
+            buffer.lotes.append(id_lote)
+
+    @property
+    def marca_mas_antigua(self):
+        marcas = [buffer.marca_inicio for buffer in self.buffers.values() if buffer.marca_inicio]
+        return min(marcas) if marcas else None
+
+    def debe_vaciar(self, segundos_maximos):
+        if any(buffer.filas >= self.filas_por_parte for buffer in self.buffers.values()):
+            return True
+        marca = self.marca_mas_antigua
+        return marca is not None and time.time() - marca >= segundos_maximos
+
+    def _leer_manifiesto(self, directorio_version):
+        ruta = os.path.join(directorio_version, "manifiesto.json")
+        if not os.path.exists(ruta):
+            return {"version_modelo": None, "filas": 0, "partes": []}
+        with open(ruta, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _escribir_parte(self, version, buffer):
+        directorio_version = os.path.join(self.directorio_base, self.nombre_seguro(version))
+        os.makedirs(directorio_version, exist_ok=True)
+        manifiesto = self._leer_manifiesto(directorio_version)
+        nombre_parte = f"parte-{len(manifiesto['partes']):06d}"
+        directorio_parte = os.path.join(directorio_version, nombre_parte)
+        temporal = directorio_parte + ".tmp"
+        # Nada fuera del manifiesto es valido: se descartan restos de un intento anterior con el mismo nombre
+        self._eliminar(temporal)
+        self._eliminar(directorio_parte)
+        os.makedirs(temporal)
+
+        columnas = {}
+        for nombre, arreglo in buffer.arreglos().items():
+            archivo = self.nombre_seguro(nombre) + ".npy"
+            _escribir_sincronizado(os.path.join(temporal, archivo), lambda f, a=arreglo: np.save(f, a))
+            columnas[nombre] = archivo
+        _sincronizar_directorio(temporal)
+        os.replace(temporal, directorio_parte)
+
+        marcas = buffer.columnas["marca_tiempo"]
+        manifiesto["version_modelo"] = version
+        manifiesto["filas"] += buffer.filas
+        manifiesto["partes"].append({
+            "directorio": nombre_parte,
+            "filas": buffer.filas,
+            "columnas": columnas,
+            "marca_tiempo_minima": min(marcas),
+            "marca_tiempo_maxima": max(marcas),
+            "lotes": buffer.lotes
+        })
+        _escribir_sincronizado(
+            os.path.join(directorio_version, "manifiesto.json"),
+            lambda f: f.write(json.dumps(manifiesto, indent=2).encode())
+        )
+        _sincronizar_directorio(directorio_version)
+        self.lotes_persistidos.update(buffer.lotes)
+        indices = np.asarray(buffer.columnas["indice"], dtype=np.int64)
+        self.indices_persistidos[version].probar_y_marcar_lote(indices[indices >= 0])
+        self.partes_escritas += 1
+        self.filas_escritas += buffer.filas
+
+    def vaciar(self):
+        # Si falla a mitad, las versiones ya escritas quedan en lotes_persistidos y su reentrega no duplica filas
+        buffers, self.buffers = self.buffers, {}
+        for version, buffer in buffers.items():
+            if buffer.filas:
+                self._escribir_parte(version, buffer)
+        return sum(buffer.filas for buffer in buffers.values())
+
+    def confirmado(self):
+        # Tras el ack el broker ya no reentrega esos lotes
+        self.lotes_persistidos.clear()
+
+
+class SumideroResultados:
+    CONFIG = {
+        "host": "10.163.238.60",
+        "port": 5672,
+        "usuario": "admin",
+        "contrasena": "admin"
+    }
+    INTERCAMBIO_RESULTADOS = "resultados"
+    COLA_SUMIDERO = "resultados_sumidero"
+
+    def __init__(self, directorio="resultados_persistidos", filas_por_parte=1000000,
+                 segundos_vaciado=30.0, mensajes_en_vuelo=2000):
+        self.escritor = EscritorColumnas(directorio, filas_por_parte)
+        self.segundos_vaciado = segundos_vaciado
+        self.mensajes_en_vuelo = mensajes_en_vuelo
+        self.ultima_etiqueta = None
+        self.mensajes_pendientes = 0
+        self.mensajes_recibidos = 0
+        self.ejecutando = True
+
+    def _obtener_parametros(self):
+        return pika.ConnectionParameters(
+            host=self.CONFIG["host"],
+            port=self.CONFIG["port"],
+            credentials=pika.PlainCredentials(self.CONFIG["usuario"], self.CONFIG["contrasena"]),
+            heartbeat=600,
+            blocked_connection_timeout=300
+        )
+
+    def _al_recibir(self, ch, metodo, props, cuerpo):
+        try:
+            datos = decodificar_mensaje(cuerpo, props.content_type)
+        except Exception as e:
+            print(f"[SUMIDERO] Mensaje ilegible descartado: {e}")
+            ch.basic_nack(metodo.delivery_tag, requeue=False)
+            return
+
+        if datos.get("tipo") == "lote_resultados":
+            self.escritor.agregar_lote(datos.get("version_modelo"), datos.get("consumidor"), datos.get("resultados", []),
+                                       datos.get("id_lote"))
+        else:
+            self.escritor.agregar_lote(datos.get("version_modelo"), datos.get("consumidor"), [datos])
+        self.ultima_etiqueta = metodo.delivery_tag
+        self.mensajes_pendientes += 1
+        self.mensajes_recibidos += 1
+
+        if self.mensajes_pendientes >= self.mensajes_en_vuelo or self.escritor.debe_vaciar(self.segundos_vaciado):
+            self._vaciar(ch)
+
+    def _vaciar(self, canal):
+        # Solo se confirma al broker lo que ya esta sincronizado en disco
+        if self.ultima_etiqueta is None:
+            return
+        inicio = time.time()
+        filas = self.escritor.vaciar()
+        canal.basic_ack(self.ultima_etiqueta, multiple=True)
+        self.escritor.confirmado()
+        print(f"[SUMIDERO] {filas} filas persistidas ({self.mensajes_pendientes} mensajes) en {time.time() - inicio:.2f}s "
+              f"| Total: {self.escritor.filas_escritas}")
+        self.ultima_etiqueta = None
+        self.mensajes_pendientes = 0
+
+    def ejecutar(self):
+        print(f"[SUMIDERO] Persistiendo resultados en '{self.escritor.directorio_base}'")
+        while self.ejecutando:
+            conexion = canal = None
+            try:
+                conexion = pika.BlockingConnection(self._obtener_parametros())
+                canal = conexion.channel()
+                canal.exchange_declare(exchange=self.INTERCAMBIO_RESULTADOS, exchange_type='fanout', durable=True)
+                canal.queue_declare(queue=self.COLA_SUMIDERO, durable=True)
+                canal.queue_bind(exchange=self.INTERCAMBIO_RESULTADOS, queue=self.COLA_SUMIDERO)
+                canal.basic_qos(prefetch_count=self.mensajes_en_vuelo)
+                canal.basic_consume(queue=self.COLA_SUMIDERO, on_message_callback=self._al_recibir)
+                print(f"[SUMIDERO] Conectado a {self.CONFIG['host']}:{self.CONFIG['port']} - Cola: {self.COLA_SUMIDERO}")
+
+                while self.ejecutando:
+                    conexion.process_data_events(time_limit=1.0)
+                    if self.escritor.debe_vaciar(self.segundos_vaciado):
+                        self._vaciar(canal)
+            except KeyboardInterrupt:
+                print("\n[SUMIDERO] Interrumpido")
+                self.ejecutando = False
+                if canal and canal.is_open:
+                    self._vaciar(canal)
+            except Exception as e:
+                # Lo no confirmado se reentrega al reconectar; se descarta el buffer para no duplicar
+                self.escritor.buffers = {}
+                self.ultima_etiqueta = None
+                self.mensajes_pendientes = 0
+                if self.ejecutando:
+                    print(f"[SUMIDERO] Error: {e} - reconectando en 3 segundos...")
+                    time.sleep(3)
+            finally:
+                if conexion and conexion.is_open:
+                    try:
+                        conexion.close()
+                    except Exception:
+                        pass
+        print(f"[SUMIDERO] Partes escritas: {self.escritor.partes_escritas} | Filas: {self.escritor.filas_escritas} "
+              f"| Lotes reentregados ignorados: {self.escritor.lotes_descartados} "
+              f"| Filas repetidas ignoradas: {self.escritor.filas_descartadas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistencia columnar de resultados Monte Carlo")
+    parser.add_argument("--directorio", default="resultados_persistidos")
+    parser.add_argument("--filas-por-parte", type=int, default=1000000)
+    parser.add_argument("--segundos-vaciado", type=float, default=30.0)
+    parser.add_argument("--mensajes-en-vuelo", type=int, default=2000)
+    argumentos = parser.parse_args()
+
+    SumideroResultados(
+        directorio=argumentos.directorio,
+        filas_por_parte=argumentos.filas_por_parte,
+        segundos_vaciado=argumentos.segundos_vaciado,
+        mensajes_en_vuelo=argumentos.mensajes_en_vuelo
+    ).ejecutar()
+
+
+if __name__ == "__main__":
+    main()
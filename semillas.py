@@ -0,0 +1,50 @@
+# semillas.py
+# Derivacion de semillas comun a productor, trabajadores, ejecucion local y modelos:
+# una sola copia para que todos generen los mismos numeros para el mismo escenario
+import numpy as np
+
+INCREMENTO = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mezclar(x):
+    # Finalizador de SplitMix64
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def derivar_semillas(semilla, indices):
+    # SplitMix64 sobre (semilla de la ejecucion, indice): semilla reproducible por escenario
+    with np.errstate(over='ignore'):
+        return _mezclar(np.uint64(semilla % 2**64) + np.asarray(indices, dtype=np.uint64) * INCREMENTO)
+
+
+def uniformes(semillas, pasos):
+    # SplitMix64 sobre (semilla, paso): cada numero depende solo de la semilla de su propio escenario,
+    # asi model_fn y model_fn_batch dan lo mismo sea cual sea el bloque en que viaje el escenario
+    with np.errstate(over='ignore'):
+        x = _mezclar(np.asarray(semillas, dtype=np.uint64) + (np.asarray(pasos, dtype=np.uint64) + np.uint64(1)) * INCREMENTO)
+    return (x >> np.uint64(11)) * (1.0 / 2**53)
+
+
+def semillas_columnas(columnas, n):
+    semillas = columnas.get("semilla")
+    if semillas is None:
+        return np.random.default_rng().integers(0, 2**64, size=n, dtype=np.uint64)
+    return np.asarray(semillas, dtype=np.uint64)
+
+
+def espacio_modelo():
+    # Espacio de nombres para exec del modelo: los modelos usan _uniformes y _semillas sin copiarlos
+    return {"_uniformes": uniformes, "_semillas": semillas_columnas}
+
+
+def verificar_equivalencia_lote(funcion_modelo_lote, funcion_modelo, cantidad=8):
+    # Con las mismas semillas, model_fn_batch debe reproducir model_fn fila a fila
+    indices = np.arange(cantidad)
+    semillas = derivar_semillas(12345, indices)
+    salidas = funcion_modelo_lote({"indice": indices, "semilla": semillas})
+    for indice, semilla in zip(indices.tolist(), semillas.tolist()):
+        for clave, valor in funcion_modelo({"indice": indice, "semilla": semilla}).items():
+            if clave in salidas and not np.isclose(np.broadcast_to(salidas[clave], (cantidad,))[indice], valor, equal_nan=True):
+                raise ValueError(f"'{clave}' no coincide con model_fn para la semilla {semilla}")
@@ -0,0 +1,23 @@
+import os
+import importlib.util
+
+import pytest
+
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cargar_script(nombre, archivo):
+    especificacion = importlib.util.spec_from_file_location(nombre, os.path.join(DIRECTORIO, archivo))
+    modulo = importlib.util.module_from_spec(especificacion)
+    especificacion.loader.exec_module(modulo)
+    return modulo
+
+
+@pytest.fixture(scope="session")
+def componentes():
+    # El broker en memoria del benchmark sustituye a pika/eventlet: los scripts se cargan sin red
+    benchmark = cargar_script("bench_pruebas", "benchmark.py")
+    modulos = benchmark.cargar_componentes(benchmark.crear_modulo_pika(benchmark.BrokerMemoria()))
+    modulos["sumidero"] = cargar_script("bench_sumidero", "result-sink.py")
+    modulos["local"] = cargar_script("bench_local", "local-runner.py")
+    return modulos
@@ -0,0 +1,25 @@
+import pytest
+
+
+def _publicar_con_cola_llena(productor, maximo=3, mensajes=5):
+    parametros = productor.ConexionRabbit().obtener_parametros()
+    canal = productor.CanalConfirmaciones(parametros)
+    # El broker en memoria se comparte entre pruebas: se parte de la cola vacia
+    canal.canal.queue_delete(queue="confirmaciones_prueba")
+    canal.canal.queue_declare(queue="confirmaciones_prueba", arguments={"x-max-length": maximo, "x-overflow": "reject-publish"})
+    for numero in range(mensajes):
+        canal.publicar(numero, "", "confirmaciones_prueba", b"{}", productor.pika.BasicProperties(delivery_mode=2))
+    confirmados, rechazados = canal.esperar()
+    canal.cerrar()
+    return canal, confirmados, rechazados
+
+
+@pytest.mark.parametrize("version, asincrono", [("1.4.4", True), ("2.0.0", False), ("desconocida", False)])
+def test_confirmaciones_segun_version_de_pika(componentes, monkeypatch, version, asincrono):
+    productor = componentes["productor"]
+    monkeypatch.setattr(productor.pika, "__version__", version)
+    canal, confirmados, rechazados = _publicar_con_cola_llena(productor)
+    assert (canal.asincrono is not None) == asincrono
+    # Con o sin el canal interno, lo rechazado por la cola llena vuelve para reintentarse
+    assert sorted(confirmados) == [0, 1, 2]
+    assert sorted(rechazados) == [3, 4]
@@ -0,0 +1,21 @@
+def test_amplitud_por_defecto_acota_el_mapa(componentes):
+    dashboard = componentes["dashboard"]
+    metricas = dashboard.MetricasDashboard()
+    deduplicador = metricas.deduplicador
+    base = 3_000_000_000
+    for indice in (base, base + 2 ** 24 - 8, base + 2 ** 24 + 100, base - 2 ** 30):
+        assert not deduplicador.es_duplicado({"indice": indice, "version_modelo": "v1", "id_escenario": f"e-{indice}"})
+    # Los dos ultimos quedan fuera de 2**24 indices: van al filtro Bloom y el mapa no pasa de 2 MB
+    assert deduplicador.comprobados_bloom == 2
+    assert deduplicador.mapas_indices["v1"].memoria_bytes() <= 2 ** 21
+    assert deduplicador.es_duplicado({"indice": base + 2 ** 24 + 100, "version_modelo": "v1", "id_escenario": f"e-{base + 2 ** 24 + 100}"})
+
+
+def test_amplitud_configurable(componentes):
+    metricas = componentes["dashboard"].MetricasDashboard(amplitud_indices=1024)
+    deduplicador = metricas.deduplicador
+    for indice in (0, 1023, 5000):
+        deduplicador.es_duplicado({"indice": indice, "version_modelo": "v1", "id_escenario": f"e-{indice}"})
+    assert deduplicador.comprobados_bloom == 1
+    metricas.reiniciar_metricas()
+    assert metricas.deduplicador.amplitud_maxima == 1024
@@ -0,0 +1,81 @@
+import math
+import random
+
+import pytest
+
+
+def _resultados_con_duplicados(cantidad=3000, duplicados=600, semilla=7):
+    generador = random.Random(semilla)
+    resultados = [
+        {
+            "id_escenario": f"lote-{indice}",
+            "indice": indice,
+            "consumidor": f"w{indice % 3}",
+            "marca_tiempo": 1000.0 + indice,
+            "tiempo_procesamiento": 0.001,
+            "exito": indice % 97 != 0,
+            "version_modelo": "v1",
+            "resultado": {"valor": generador.gauss(10, 3), "llegada": float(indice % 11)}
+        }
+        for indice in range(100, 100 + cantidad)
+    ]
+    # Reentregas y reintentos: los mismos escenarios procesados otra vez, con salidas distintas
+    repetidos = []
+    for original in generador.sample(resultados, duplicados):
+        copia = dict(original, consumidor="w9", resultado={"valor": generador.gauss(50, 1), "llegada": 99.0})
+        repetidos.append(copia)
+    mezclados = resultados + repetidos
+    generador.shuffle(mezclados)
+    return mezclados
+
+
+def _comparar(vivo, repeticion, ruta="resumen"):
+    if isinstance(vivo, dict):
+        assert set(vivo) == set(repeticion), ruta
+        for clave in vivo:
+            _comparar(vivo[clave], repeticion[clave], f"{ruta}.{clave}")
+    elif isinstance(vivo, (list, tuple)):
+        assert len(vivo) == len(repeticion), ruta
+        for posicion, (a, b) in enumerate(zip(vivo, repeticion)):
+            _comparar(a, b, f"{ruta}[{posicion}]")
+    elif isinstance(vivo, float) and not math.isnan(vivo):
+        assert repeticion == pytest.approx(vivo, rel=1e-9, abs=1e-9), ruta
+    else:
+        assert vivo == repeticion, ruta
+
+
+def test_repeticion_con_duplicados_coincide_con_vivo(componentes, tmp_path):
+    dashboard, sumidero = componentes["dashboard"], componentes["sumidero"]
+    resultados = _resultados_con_duplicados()
+
+    vivo = dashboard.MetricasDashboard()
+    for resultado in resultados:
+        vivo.actualizar_resultado(resultado)
+
+    # Partes con filas repetidas (escritas sin deduplicar): la repeticion debe descartar lo mismo que en vivo
+    escritor = sumidero.EscritorColumnas(str(tmp_path), filas_por_parte=1000)
+    for inicio in range(0, len(resultados), 700):
+        buffer = escritor.buffers.setdefault("v1", sumidero.BufferColumnas())
+        for resultado in resultados[inicio:inicio + 700]:
+            buffer.agregar(resultado, resultado["consumidor"])
+        escritor.vaciar()
+
+    repeticion = dashboard.RepeticionEjecuciones(str(tmp_path), filas_por_bloque=450).cargar(
+        "v1", dashboard.MetricasDashboard()
+    )
+
+    resumen_vivo, resumen_repeticion = vivo.obtener_resumen(), repeticion.obtener_resumen()
+    assert resumen_repeticion["total_procesados"] == 3000
+    for clave in ("total_procesados", "total_errores", "carga_trabajo_consumidor", "estadisticas_metricas"):
+        _comparar(resumen_vivo[clave], resumen_repeticion[clave], clave)
+    assert resumen_repeticion["deduplicacion"]["duplicados"] == resumen_vivo["deduplicacion"]["duplicados"]
+
+
+def test_mapa_bits_lote_coincide_con_escalar(componentes):
+    dashboard = componentes["dashboard"]
+    generador = random.Random(3)
+    escalar, lote = dashboard.MapaBitsIndices(), dashboard.MapaBitsIndices()
+    for _ in range(20):
+        indices = [generador.randrange(5000, 9000) for _ in range(300)]
+        esperado = [not escalar.probar_y_marcar(indice) for indice in indices]
+        assert lote.probar_y_marcar_lote(indices).tolist() == esperado
@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+
+def _resultados(cantidad=5000, semilla=11):
+    generador = random.Random(semilla)
+    return [
+        {
+            "id_escenario": f"local-{indice}",
+            "indice": indice,
+            "consumidor": f"local-{indice % 4}",
+            "exito": indice % 50 != 0,
+            "resultado": {"espera": generador.expovariate(0.5), "signo": generador.gauss(0, 1), "etiqueta": "x"}
+        }
+        for indice in range(cantidad)
+    ]
+
+
+def test_resumen_local_coincide_con_dashboard(componentes):
+    resultados = _resultados()
+    vivo = componentes["dashboard"].MetricasDashboard()
+    for resultado in resultados:
+        vivo.actualizar_resultado(resultado)
+    local = componentes["local"].ResumenLocal("v1", "modelo.txt")
+    for inicio in range(0, len(resultados), 256):
+        local.agregar(resultados[inicio:inicio + 256])
+
+    resumen_vivo, resumen_local = vivo.obtener_resumen(), local.obtener_resumen()
+    for clave in ("total_procesados", "total_errores", "carga_trabajo_consumidor", "tipos_metricas", "rendimiento_consumidor"):
+        assert resumen_local[clave] == resumen_vivo[clave], clave
+    assert sorted(resumen_local["metricas_descubiertas"]) == sorted(resumen_vivo["metricas_descubiertas"])
+    for metrica, estadisticas in resumen_vivo["estadisticas_metricas"].items():
+        local_metrica = resumen_local["estadisticas_metricas"][metrica]
+        assert local_metrica["cantidad"] == estadisticas["cantidad"]
+        for clave in ("media", "desviacion", "minimo", "maximo"):
+            assert local_metrica[clave] == pytest.approx(estadisticas[clave], rel=1e-9), (metrica, clave)
+        assert local_metrica["percentiles"] == pytest.approx(estadisticas["percentiles"], rel=1e-9), metrica
+
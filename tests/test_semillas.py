@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from conftest import DIRECTORIO
+
+MODELOS = ("trafico.txt", "dice rolling.txt", "monty hall.txt")
+
+
+@pytest.mark.parametrize("semilla", [12345, 2**63 - 1])
+def test_productor_y_trabajadores_derivan_las_mismas_semillas(componentes, semilla):
+    productor = componentes["productor"].ProductorEscenariosContinuo(semilla=semilla, escenarios_por_mensaje=64)
+    productor.version_modelo_actual = "v1"
+    # Escenarios sueltos: la semilla la calcula el productor; en bloques, cada trabajador a partir del indice
+    esperadas = [escenario["semilla"] for escenario in productor._generar_escenarios_lote(1000, 300)]
+    bloques = productor._generar_bloques(1000, 300)
+
+    trabajador = componentes["consumidor"].TrabajadorMonteCarlo("prueba")
+    remotas = [escenario["semilla"] for bloque in bloques for escenario in trabajador.expandir_bloque(bloque)]
+    locales = [escenario["semilla"] for bloque in bloques for escenario in componentes["local"]._expandir_bloque(bloque)]
+    assert remotas == esperadas
+    assert locales == esperadas
+
+
+@pytest.mark.parametrize("archivo", MODELOS)
+def test_modelos_usan_las_funciones_inyectadas(componentes, archivo):
+    with open(os.path.join(DIRECTORIO, archivo), "r", encoding="utf-8") as f:
+        codigo = f.read()
+    funcion_modelo, funcion_modelo_lote = componentes["local"].compilar_modelo(codigo)
+    # Sin la funcion por lotes, compilar_modelo la habria descartado por no coincidir con model_fn
+    assert funcion_modelo_lote is not None
+    # Misma semilla, mismo escenario: la reproducibilidad depende solo de la semilla recibida
+    assert funcion_modelo({"indice": 0, "semilla": 99}) == funcion_modelo({"indice": 5, "semilla": 99})
@@ -0,0 +1,59 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def sumidero(componentes):
+    return componentes["sumidero"]
+
+
+def _resultados(indices):
+    return [{"id_escenario": f"e-{i}", "indice": i, "marca_tiempo": float(i), "resultado": {"valor": float(i)}}
+            for i in indices]
+
+
+def _indices_en_disco(directorio, version="v1"):
+    directorio_version = os.path.join(directorio, version)
+    with open(os.path.join(directorio_version, "manifiesto.json"), "r", encoding="utf-8") as f:
+        manifiesto = json.load(f)
+    return np.concatenate([
+        np.load(os.path.join(directorio_version, parte["directorio"], parte["columnas"]["indice"]))
+        for parte in manifiesto["partes"]
+    ])
+
+
+def test_reintentos_y_reentregas_no_duplican_filas(sumidero, tmp_path):
+    escritor = sumidero.EscritorColumnas(str(tmp_path))
+    escritor.agregar_lote("v1", "w0", _resultados(range(0, 100)), "a")
+    # Reintento del productor dentro del mismo buffer, con otro sobre
+    escritor.agregar_lote("v1", "w1", _resultados(range(50, 150)), "b")
+    escritor.vaciar()
+    escritor.confirmado()
+    # Reintento despues de persistir y filas sin indice, que siempre se guardan
+    escritor.agregar_lote("v1", "w2", _resultados(range(140, 160)) + [{"id_escenario": "x"}] * 2, "c")
+    escritor.vaciar()
+
+    indices = _indices_en_disco(str(tmp_path))
+    assert sorted(indices[indices >= 0].tolist()) == list(range(160))
+    assert np.count_nonzero(indices < 0) == 2
+    assert escritor.filas_descartadas == 60
+
+    # Tras reiniciar, el mapa se reconstruye desde las partes
+    reiniciado = sumidero.EscritorColumnas(str(tmp_path))
+    reiniciado.agregar_lote("v1", "w3", _resultados(range(155, 165)), "d")
+    reiniciado.vaciar()
+    indices = _indices_en_disco(str(tmp_path))
+    assert sorted(indices[indices >= 0].tolist()) == list(range(165))
+
+
+def test_buffer_descartado_no_bloquea_la_reentrega(sumidero, tmp_path):
+    escritor = sumidero.EscritorColumnas(str(tmp_path))
+    escritor.agregar_lote("v1", "w0", _resultados(range(10)), "a")
+    # Caida de la conexion antes de vaciar: el broker reentrega el mismo lote
+    escritor.buffers = {}
+    escritor.agregar_lote("v1", "w0", _resultados(range(10)), "a")
+    escritor.vaciar()
+    assert sorted(_indices_en_disco(str(tmp_path)).tolist()) == list(range(10))